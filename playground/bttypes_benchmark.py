@@ -0,0 +1,46 @@
+from ggbot.btdata import Attr, Divided, Rounded, Formatted, Const
+from ggbot.bttypes import *
+from ggbot.context import Variable
+from ggbot.opendota import DotaMatch, Player
+from ggbot.utils import benchmark
+
+
+N = 2000
+
+
+def build_embed_fields():
+    # The checks of intent_my_last_match expressions
+    match = Variable('last_match', make_struct_from_python_type(DotaMatch))
+    player = Variable('match_player', make_struct_from_python_type(Player))
+    for name in ('kills', 'deaths', 'assists', 'gold_per_min', 'xp_per_min'):
+        Attr(player, name)
+    for name in ('hero_damage', 'tower_damage', 'hero_healing'):
+        Formatted('{value} k', value=Rounded(Divided(Attr(player, name), Const(NUMBER, 1000))))
+    Attr(match, 'duration')
+
+
+def main():
+    with benchmark(f'make_struct_from_python_type(DotaMatch) x{N}'):
+        for _ in range(N):
+            make_struct_from_python_type(DotaMatch)
+
+    a = make_struct_from_python_type(DotaMatch)
+    b = make_struct_from_python_type(DotaMatch)
+    with benchmark(f'STRUCT.can_accept of equal structs x{N * 10}'):
+        for _ in range(N * 10):
+            a.can_accept(b)
+
+    nested = ARRAY(MAP(STRING, ONEOF(NUMBER, NULL_TYPE)))
+    other = ARRAY(MAP(STRING, ONEOF(NULL_TYPE, NUMBER)))
+    with benchmark(f'ARRAY(MAP(...)).can_accept x{N * 10}'):
+        for _ in range(N * 10):
+            nested.can_accept(other)
+            other.can_accept(ARRAY(STRING))
+
+    with benchmark(f'building embed expressions x{N}'):
+        for _ in range(N):
+            build_embed_fields()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import json
+from inspect import signature
+
+from ggbot.btdata import *
+from ggbot.btexpr import compile_expression
+from ggbot.bttypes import *
+from ggbot.context import Context, Variable
+from ggbot.opendota import DotaMatch, Player
+from ggbot.dota.component import (
+    DOTA_MATCH,
+    DOTA_MATCH_PLAYER,
+    HeroName,
+    PlayerHeroId,
+    MatchDurationMinutes,
+    MatchPlayerResultString,
+    PlayerHeroIconUrl,
+)
+from ggbot.utils import benchmark
+
+
+N = 20000
+
+
+class StubDota:
+    def hero_id_to_localized_name(self, hero_id: int) -> str:
+        return f'Hero #{hero_id}'
+
+    def hero_id_to_icon_url(self, hero_id: int) -> str:
+        return f'https://example.com/{hero_id}.png'
+
+
+def _only_params(cls, data):
+    params = signature(cls).parameters
+    return cls(**{k: v for k, v in data.items() if k in params})
+
+
+def embed_expressions(dota):
+    """Expressions of the embed sent by intent_my_last_match"""
+    last_match_id = Variable('last_match_id', NUMBER)
+    last_match = Variable('last_match', DOTA_MATCH)
+    match_player = Variable('match_player', DOTA_MATCH_PLAYER)
+    return {
+        'description': Formatted(
+            '{result} на {hero} ({duration})'
+            '\nПосмотреть на [Dotabuff](https://www.dotabuff.com/matches/{match_id}), '
+            '[OpenDota](https://www.opendota.com/matches/{match_id})',
+            result=MatchPlayerResultString(match_player),
+            hero=HeroName(PlayerHeroId(match_player), dota),
+            duration=Formatted('{minutes} минут', minutes=MatchDurationMinutes(last_match)),
+            match_id=last_match_id,
+        ),
+        'thumbnail': PlayerHeroIconUrl(match_player, dota),
+        'fields': StringDictionary(
+            {
+                'KDA': Formatted(
+                    '{kills}/{deaths}/{assists}',
+                    kills=Attr(match_player, 'kills'),
+                    deaths=Attr(match_player, 'deaths'),
+                    assists=Attr(match_player, 'assists'),
+                ),
+                ':gold: Золото/Опыт': Formatted(
+                    '{gpm} / {xpm}',
+                    gpm=Attr(match_player, 'gold_per_min'),
+                    xpm=Attr(match_player, 'xp_per_min'),
+                ),
+                ':crossed_swords: Урона по героям': Formatted(
+                    '{value} k',
+                    value=Rounded(Divided(Attr(match_player, 'hero_damage'), Const(NUMBER, 1000))),
+                ),
+                ':homes: Урона по домикам': Formatted(
+                    '{value} k',
+                    value=Rounded(Divided(Attr(match_player, 'tower_damage'), Const(NUMBER, 1000))),
+                ),
+                ':heal: Лечения': Formatted(
+                    '{value} k',
+                    value=Rounded(Divided(Attr(match_player, 'hero_healing'), Const(NUMBER, 1000))),
+                ),
+                ':creep: Добито крипов': AsString(Attr(match_player, 'last_hits')),
+            }
+        ),
+    }
+
+
+def main():
+    with open('opendota_matches_shide.json', 'r', encoding='utf-8') as fp:
+        recent = json.load(fp)[0]
+
+    ctx = Context(
+        bot=None,
+        message=None,
+        author=None,
+        local={
+            'last_match_id': recent['match_id'],
+            'last_match': _only_params(DotaMatch, recent),
+            'match_player': _only_params(Player, recent),
+        },
+    )
+
+    interpreted = embed_expressions(StubDota())
+    compiled = {k: compile_expression(v) for k, v in interpreted.items()}
+    for name, expr in compiled.items():
+        assert expr.evaluate(ctx) == interpreted[name].evaluate(ctx), name
+        if hasattr(expr, 'source'):
+            print(f'{name}:\n{expr.source}\n')
+
+    with benchmark(f'interpreted x{N}'):
+        for _ in range(N):
+            for expr in interpreted.values():
+                expr.evaluate(ctx)
+
+    with benchmark(f'compiled x{N}'):
+        for _ in range(N):
+            for expr in compiled.values():
+                expr.evaluate(ctx)
+
+    # Same context rendered again, pure expressions are not evaluated again
+    memo = {k: memoized(v) for k, v in compiled.items()}
+    with benchmark(f'compiled and memoized x{N}'):
+        for _ in range(N):
+            for expr in memo.values():
+                expr.evaluate(ctx)
+
+
+if __name__ == '__main__':
+    main()
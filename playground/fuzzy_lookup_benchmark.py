@@ -0,0 +1,47 @@
+import random
+
+from ggbot.fuzzy import *
+from ggbot.utils import benchmark
+
+
+N = 200000
+
+TERMS = {
+    'triangular': TriangularMf(0, 1, 2),
+    'trapezoidal': TrapezoidalMf(0, 0.5, 1.5, 2),
+    'gaussian': GaussianMf(1, 0.5),
+    'compound': FuzzySum(FuzzyUnion(GaussianMf(0, 0.5), GaussianMf(2, 0.5)), TriangularMf(0, 1, 2)),
+}
+
+
+def bench_sample(name, sample, xs):
+    with benchmark(name):
+        for i in range(N):
+            sample(xs[i % len(xs)])
+
+
+def main():
+    rnd = random.Random(0)
+    xs = [rnd.uniform(0, 3) for _ in range(1000)]
+
+    for term_name, mf in TERMS.items():
+        print(f'\n{term_name}')
+        bench_sample('  analytic', mf.sample, xs)
+        for resolution in (129, 1025):
+            var = Variable('x', (0, 3), resolution=resolution, term=mf)
+            error = var.discretization_error['term']
+            bench_sample(f'  table resolution={resolution:<5} error={error:.1e}', var.get_sampler(mf).sample, xs)
+        var = Variable('x', (0, 3), max_error=1e-5, term=mf)
+        resolution = var.get_sampler(mf).resolution
+        bench_sample(f'  table max_error=1e-5 (resolution={resolution})', var.get_sampler(mf).sample, xs)
+
+    print('\nIs.evaluate')
+    for term_name, mf in TERMS.items():
+        analytic = Is(Variable('x', (0, 3), term=mf), 'term')
+        table = Is(Variable('x', (0, 3), resolution=1025, term=mf), 'term')
+        bench_sample(f'  {term_name} analytic', lambda x: analytic.evaluate(x=x), xs)
+        bench_sample(f'  {term_name} table', lambda x: table.evaluate(x=x), xs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import glob
+
+import yaml
+
+from ggbot.assets import yaml_dict_from_file
+from ggbot.utils import benchmark, load_yaml_file, YamlLoader
+
+
+FILES = sorted(glob.glob('../resources/**/*.yaml', recursive=True))
+N = 5
+
+
+def full_load(path):
+    with open(path, 'r', encoding='utf-8') as fp:
+        return yaml.full_load(fp)
+
+
+def c_load(path):
+    with open(path, 'r', encoding='utf-8') as fp:
+        return yaml.load(fp, Loader=YamlLoader)
+
+
+def main():
+    print(f'{len(FILES)} files, loader: {YamlLoader.__name__}')
+    for path in FILES:
+        assert full_load(path) == c_load(path), path
+
+    with benchmark(f'yaml.full_load x{N}'):
+        for _ in range(N):
+            for path in FILES:
+                full_load(path)
+
+    with benchmark(f'{YamlLoader.__name__} x{N}'):
+        for _ in range(N):
+            for path in FILES:
+                c_load(path)
+
+    with benchmark(f'load_yaml_file (memoized) x{N}'):
+        for _ in range(N):
+            for path in FILES:
+                load_yaml_file(path)
+
+    # Every accessor of the asset used to parse the file again
+    assets = [yaml_dict_from_file(path) for path in FILES]
+    with benchmark(f'YamlDictAsset keys/items/len x{N}'):
+        for _ in range(N):
+            for asset in assets:
+                len(asset)
+                list(asset.keys())
+                list(asset.items())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,86 @@
+import time
+
+# Startup profiler counts imports as well
+_started_at = time.perf_counter()
+
 import sys
 import logging
 import asyncio
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, Tuple
 
-import yaml
 from jinja2.nativetypes import NativeEnvironment
 
 from ggbot.client import Client
-from ggbot.conversation import ConversationManager
+from ggbot.conversation import ConversationManager, ScenarioHandler
+from ggbot.supervisor import ConversationSupervisor, DROP_OLDEST
+from ggbot.ratelimit import IntentRateLimiter, intent_rate_limits_from_config
+from ggbot.bttrace import Tracer, enable_tracing, instrument
+from ggbot.btnodes import compile_tree
+from ggbot.btree import Action
 from ggbot.context import BotContext
-from ggbot.assets import yaml_dict_from_file
-from ggbot.text.tokema_integration import TokemaNlu, rules_from_grammar_dict
-from ggbot.utils import require_item_from_dict_or_env
+from ggbot.text import DeferredNlu
+from ggbot.text.tokema_integration import TokemaNlu
+from ggbot.text.grammar_bundle import load_grammar_rules
+from ggbot.utils import require_item_from_dict_or_env, get_item_from_dict, load_yaml
+from ggbot.cache import configure_default_cache_store
+from ggbot.startup import StartupProfiler
 
 from ggbot.dota import Dota
-from ggbot.dota.phrases import PhraseGenerator, parse_rules
-from ggbot.spreadsheet import GoogleSpreadsheetsClient
+from ggbot.dota.phrases import PhraseGenerator
+from ggbot.dota.phrase_refresh import PhraseRulesRefresher
+from ggbot.spreadsheet import (
+    GoogleSpreadsheetsClient,
+    GoogleSheetSource,
+    LocalTableSource,
+    SnapshotTable,
+)
+
+_imported_at = time.perf_counter()
 
 _logger = logging.getLogger("MAIN")
 
 
 def load_phrases_generator(
     config: dict[str, Any], template_env: NativeEnvironment
-) -> PhraseGenerator:
-    try:
-        service_account_filename: str = require_item_from_dict_or_env(
-            config, "dota.gsc_service_account_file"
-        )
-    except KeyError as e:
-        _logger.warning(str(e))
-        return PhraseGenerator([])
-
-    gsc = GoogleSpreadsheetsClient.from_file(filename=service_account_filename)
-    phrases_table = gsc.get_table_by_title("ggbot_dota", worksheet="phrases")
-
-    phrase_parsing_grammar: dict[str, list[Any]] = {}
-    for filename in config["dota"]["phrase_parsing_grammar_files"]:
-        data = yaml_dict_from_file(filename)
-        phrase_parsing_grammar.update(data)
+) -> Tuple[PhraseGenerator, Optional[PhraseRulesRefresher]]:
+    generator = PhraseGenerator([])
+    phrases_config = get_item_from_dict(config, "dota.phrases") or {}
 
-    rules = rules_from_grammar_dict(phrase_parsing_grammar, template_env)
-    phrases_nlu = TokemaNlu(rules)
-    phrase_rules = parse_rules(phrases_table, phrases_nlu)
-    return PhraseGenerator(phrase_rules)
+    local_file = phrases_config.get("local_file")
+    if local_file:
+        source = LocalTableSource(local_file)
+    else:
+        try:
+            service_account_filename: str = require_item_from_dict_or_env(
+                config, "dota.gsc_service_account_file"
+            )
+        except KeyError as e:
+            _logger.warning(str(e))
+            return generator, None
+
+        gsc = GoogleSpreadsheetsClient.from_file(filename=service_account_filename)
+        source = GoogleSheetSource(gsc, "ggbot_dota", worksheet="phrases")
+
+    def _create_nlu() -> TokemaNlu:
+        rules = load_grammar_rules(
+            config["dota"]["phrase_parsing_grammar_files"],
+            template_env,
+            bundle_file=get_item_from_dict(
+                config, "dota.phrase_parsing_grammar_bundle"
+            ),
+        )
+        return TokemaNlu(rules)
+
+    refresher = PhraseRulesRefresher(
+        generator=generator,
+        table=SnapshotTable(source, phrases_config.get("snapshot_file")),
+        nlu_factory=_create_nlu,
+        cache_file=phrases_config.get("cache_file"),
+        interval=phrases_config.get("refresh_interval", 5 * 60),
+        grammar_files=config["dota"]["phrase_parsing_grammar_files"],
+    )
+    return generator, refresher
 
 
 async def main(*args: str) -> None:
@@ -52,29 +89,42 @@ async def main(*args: str) -> None:
     else:
         config_path = Path(args[0])
 
+    startup = StartupProfiler(started_at=_started_at)
+    startup.record("imports", _started_at, _imported_at)
+
     # Loading config
-    _logger.info(f"Loading config from {config_path}")
-    with config_path.open("r", encoding="utf-8") as f:
-        config = yaml.full_load(f)
-
-    # Setting log level
-    log_level_name = require_item_from_dict_or_env(config, "logging.level")
-    log_level = getattr(logging, log_level_name, logging.INFO)
-    logging.basicConfig(level=log_level)
-
-    # Loading grammar files
-    grammar_data = {}
-    for filename in config["resources"]["grammar_files"]:
-        _logger.info(f"Loading grammar from {filename}")
-        grammar_part = yaml_dict_from_file(filename).get_data()
-        grammar_data.update(grammar_part)
-
-    rules_j2_env = NativeEnvironment()
-    rules = rules_from_grammar_dict(grammar_data, rules_j2_env)
-    nlu = TokemaNlu(rules)
+    with startup.phase("config"):
+        _logger.info(f"Loading config from {config_path}")
+        with config_path.open("r", encoding="utf-8") as f:
+            config = load_yaml(f)
+
+        # Setting log level
+        log_level_name = require_item_from_dict_or_env(config, "logging.level")
+        log_level = getattr(logging, log_level_name, logging.INFO)
+        logging.basicConfig(level=log_level)
+
+    # Response cache, CACHE_DIR / CACHE_MAX_BYTES / CACHE_CODEC env vars are
+    # used when not set in config
+    configure_default_cache_store(
+        directory=get_item_from_dict(config, "cache.dir"),
+        max_bytes=get_item_from_dict(config, "cache.max_bytes"),
+        codec=get_item_from_dict(config, "cache.codec"),
+    )
+
+    # Grammar is loaded in background while the rest starts and connects,
+    # conversation manager waits for it before matching the first message
+    def _create_nlu() -> TokemaNlu:
+        rules = load_grammar_rules(
+            config["resources"]["grammar_files"],
+            NativeEnvironment(),
+            bundle_file=get_item_from_dict(config, "resources.grammar_bundle"),
+        )
+        return TokemaNlu(rules)
+
+    nlu = DeferredNlu(_create_nlu)
+    nlu_loading = asyncio.create_task(startup.track("nlu (background)", nlu.start()))
 
     """ Bot initialization and startup """
-    import time
     import datetime
 
     template_env = NativeEnvironment()
@@ -94,47 +144,138 @@ async def main(*args: str) -> None:
     """
 
     """ Dota """
-    phrase_generator = load_phrases_generator(config, template_env)
-    dota = Dota(
-        opendota_api_key=require_item_from_dict_or_env(config, "opendota.api_key"),
-        phrase_generator=phrase_generator,
-    )
+    from ggbot.opendota import OpenDotaApi, cache_policies_from_config
+
+    with startup.phase("dota"):
+        cache_policies = cache_policies_from_config(
+            get_item_from_dict(config, "opendota.cache")
+        )
+        phrase_generator, phrases_refresher = load_phrases_generator(
+            config, template_env
+        )
+        dota = Dota(
+            opendota_api_key=require_item_from_dict_or_env(config, "opendota.api_key"),
+            phrase_generator=phrase_generator,
+            constants_cache_policy=cache_policies["constants"],
+        )
 
     """ Memory """
     from ggbot.memory import Memory, PickleDbStorage
 
+    # The db itself is loaded by Memory.init
     db_filename = require_item_from_dict_or_env(config, "memory.db_file")
     memory = Memory(storage=PickleDbStorage(filename=db_filename))
 
+    api = OpenDotaApi(dota.api_key, cache_policies=cache_policies)
+
     components = [
         dota,
         memory,
         # igdb,
     ]
 
-    for component in components:
-        await component.init(context)
+    if phrases_refresher is not None:
+        components.append(phrases_refresher)
+
+    # Trees are instrumented when built, i.e. tracing has to be enabled before
+    # scenarios are imported and created
+    tracer = None
+    tracing_config = get_item_from_dict(config, "tracing") or {}
+    if tracing_config.get("enabled", False):
+        tracer = enable_tracing(
+            Tracer(
+                buffer_size=tracing_config.get("buffer_size", 256),
+                trace_dir=tracing_config.get("dir"),
+                report_interval=tracing_config.get("report_interval"),
+            )
+        )
+        components.append(tracer)
+
+    conversations_config = get_item_from_dict(config, "conversations") or {}
+    supervisor = ConversationSupervisor(
+        max_active=conversations_config.get("max_active", 32),
+        max_per_user=conversations_config.get("max_per_user", 2),
+        queue_size=conversations_config.get("queue_size", 64),
+        drop_policy=conversations_config.get("drop_policy", DROP_OLDEST),
+        reap_interval=conversations_config.get("reap_interval", 30),
+        report_interval=conversations_config.get("report_interval"),
+    )
+    components.append(supervisor)
+
+    prefetch_config = get_item_from_dict(config, "dota.prefetch") or {}
+    if prefetch_config.get("enabled", False):
+        from ggbot.dota.prefetch import RecentMatchesWatcher
+
+        watcher = RecentMatchesWatcher(
+            memory=memory,
+            dota=dota,
+            api=api,
+            interval=prefetch_config.get("interval", 2 * 60),
+            max_concurrency=prefetch_config.get("max_concurrency", 4),
+            requests_per_minute=prefetch_config.get("requests_per_minute", 30),
+            request_parse=prefetch_config.get("request_parse", True),
+        )
+        components.append(watcher)
+
+    # Components do not depend on each other, heavy loading in their init is
+    # either done in executor or in background tasks
+    await startup.gather(
+        {
+            f"init {type(component).__name__}": component.init(context)
+            for component in components
+        }
+    )
 
     # Scenarios / handlers
-    from ggbot.scenarios import HANDLERS as COMMON_HANDLERS
-    from ggbot.dota.scenarios import create_dota_scenario_handlers
-    from ggbot.opendota import OpenDotaApi
-
-    api = OpenDotaApi(dota.api_key)
-    dota_handlers = create_dota_scenario_handlers(memory, dota, api)
-
-    handlers = {**COMMON_HANDLERS, **dota_handlers}
+    with startup.phase("handlers"):
+        from ggbot.scenarios import HANDLERS as COMMON_HANDLERS
+        from ggbot.dota.scenarios import create_dota_scenario_handlers
+
+        dota_handlers = create_dota_scenario_handlers(memory, dota, api)
+
+        handlers = {**COMMON_HANDLERS, **dota_handlers}
+
+        def _prepare_tree(intent: str, action: Action) -> Action:
+            # Flattened and compiled into a single coroutine, roots of the
+            # traces are named after intents
+            action = compile_tree(action)
+            return instrument(action, intent) if tracer is not None else action
+
+        # Seconds to reuse replies of idempotent scenarios for the same author
+        # and slots
+        reply_ttls = get_item_from_dict(config, "reply_cache.intents") or {}
+
+        handlers = {
+            intent: ScenarioHandler(
+                _prepare_tree(intent, handler.action),
+                reply_ttl=reply_ttls.get(intent, handler.reply_ttl),
+            )
+            if isinstance(handler, ScenarioHandler)
+            else handler
+            for intent, handler in handlers.items()
+        }
 
     conversation_manager = ConversationManager(
-        nlu=nlu, intent_handlers=handlers, context=context
+        nlu=nlu,
+        intent_handlers=handlers,
+        context=context,
+        supervisor=supervisor,
+        rate_limiter=IntentRateLimiter(
+            intent_rate_limits_from_config(
+                get_item_from_dict(config, "rate_limits.intents")
+            )
+        ),
+        throttled_reaction=get_item_from_dict(config, "rate_limits.throttled_reaction"),
     )
-    client = Client(conversation_manager)
+    client = Client(conversation_manager, startup=startup)
     context.client = client
 
     discord_token = require_item_from_dict_or_env(config, "discord.token")
+    startup.mark("connecting")
     try:
         await client.start(discord_token)
     finally:
+        nlu_loading.cancel()
         if not client.is_closed():
             await client.close()
 
@@ -2,12 +2,13 @@ from typing import Optional, Dict, TypeVar
 import logging
 import asyncio
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 import discord
 
 from ggbot.context import *
-from ggbot.btdata import Const
+from ggbot.btdata import Const, memoized
+from ggbot.btexpr import compile_expression
 from ggbot.bttypes import *
 
 
@@ -53,7 +54,13 @@ class TimedEventMessageExpectation(MessageExpectation):
         raise NotImplementedError
 
     async def wait_for_event(self):
-        await asyncio.wait_for(self.event.wait(), timeout=self.timeout)
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout=self.timeout)
+        finally:
+            if not self.event.is_set():
+                # Timed out or the conversation was cancelled, the expectation
+                # must not swallow the next message
+                self.expire_at = 0
 
 
 class MessageFromUserExpectation(TimedEventMessageExpectation):
@@ -158,7 +165,9 @@ def message_intent_is(intent: str):
 def wait_for_message_from_user_with_intents(intents: list[str], seconds: float = 7):
     async def _fn(ctx: Context):
         expectation = MessageFromUserWithIntentExpectation(
-            expected_user_id=ctx.message.author.id, intents=intents, timeout=seconds
+            expected_user_id=ctx.message.author.id,
+            intents=intents,
+            timeout=ctx.clamp_timeout(seconds),
         )
         ctx.expect(expectation)
         try:
@@ -172,7 +181,9 @@ def wait_for_message_from_user_with_intents(intents: list[str], seconds: float =
 
 def wait_for_message_from_user(seconds: float = 7):
     async def _fn(ctx: Context):
-        expectation = MessageFromUserExpectation(ctx.message.author.id, timeout=seconds)
+        expectation = MessageFromUserExpectation(
+            ctx.message.author.id, timeout=ctx.clamp_timeout(seconds)
+        )
         ctx.expect(expectation)
         try:
             await expectation.wait_for_event()
@@ -186,7 +197,7 @@ def wait_for_message_from_user(seconds: float = 7):
 def wait_for_message_from_channel(seconds: float = 7):
     async def _fn(ctx: Context):
         expectation = MessageFromChannelExpectation(
-            ctx.message.channel.id, timeout=seconds
+            ctx.message.channel.id, timeout=ctx.clamp_timeout(seconds)
         )
         ctx.expect(expectation)
         try:
@@ -203,18 +214,20 @@ def send_message_to_channel(msg: str):
         if msg:
             rendered = context.render_template(msg)
             answer_message = await context.message.channel.send(rendered)
-            context.bot.last_answer = answer_message
+            context.answered(answer_message)
         return True
 
     return _fn
 
 
 def send_message_to_channel2(msg: IExpression[str]):
+    msg = memoized(compile_expression(msg))
+
     async def _fn(context: Context):
         message = msg.evaluate(context)
         if message:
             answer_message = await context.message.channel.send(message)
-            context.bot.last_answer = answer_message
+            context.answered(answer_message)
         return True
 
     return _fn
@@ -229,13 +242,15 @@ def reply_to_message(msg: str):
                 answer_message = await context.message.channel.send(rendered)
             else:
                 answer_message = await context.message.reply(rendered)
-            context.bot.last_answer = answer_message
+            context.answered(answer_message)
         return True
 
     return _fn
 
 
 def reply_to_message2(msg: IExpression[str]):
+    msg = memoized(compile_expression(msg))
+
     async def _fn(context: Context):
         value = msg.evaluate(context)
         if value:
@@ -244,7 +259,7 @@ def reply_to_message2(msg: IExpression[str]):
                 answer_message = await context.message.channel.send(value)
             else:
                 answer_message = await context.message.reply(value)
-            context.bot.last_answer = answer_message
+            context.answered(answer_message)
         return True
 
     return _fn
@@ -310,6 +325,12 @@ class SendEmbed:
     video_height: Optional[IExpression[str]] = None
     video_width: Optional[IExpression[str]] = None
 
+    def __post_init__(self):
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if value is not None:
+                setattr(self, f.name, memoized(compile_expression(value)))
+
     async def __call__(self, context: Context) -> bool:
         title = self.title.evaluate(context)
         embed_type = self.type.evaluate(context)
@@ -356,5 +377,5 @@ class SendEmbed:
             if video_width:
                 embed.video.width = video_width
 
-        await context.message.channel.send(embed=embed)
+        context.answered(await context.message.channel.send(embed=embed))
         return True
@@ -1,12 +1,22 @@
-from typing import Dict, Any, Mapping, Iterable, TypeVar, Generic
+from typing import (
+    Dict,
+    Any,
+    Mapping,
+    Iterable,
+    TypeVar,
+    Generic,
+    Optional,
+    Tuple,
+    Set,
+)
 import os
+import asyncio
+import threading
 import pathlib
 import aiohttp
 import uuid
 import time
 import json
-import yaml
-import hashlib
 import logging
 import requests
 from dataclasses import dataclass, field
@@ -14,6 +24,15 @@ from dataclasses import dataclass, field
 
 from aiohttp.typedefs import StrOrURL
 
+from ggbot.cache import CacheStore, get_default_cache_store
+from ggbot.utils import (
+    BACKGROUND_REFRESH_TIMEOUT,
+    conditional_request_headers,
+    response_validators,
+    load_yaml,
+    load_yaml_file,
+)
+
 
 __all__ = [
     "Source",
@@ -49,6 +68,18 @@ class Source:
     async def get_as_text_async(self, encoding: str = "utf-8") -> str:
         return self.get_as_text(encoding)
 
+    def get_as_binary_if_modified(
+        self, validators: Mapping[str, str]
+    ) -> Tuple[Optional[bytes], Dict[str, str]]:
+        """Returns (None, validators) if the content is unchanged since validators
+        were issued, otherwise the content and its new validators"""
+        return self.get_as_binary(), {}
+
+    async def get_as_binary_if_modified_async(
+        self, validators: Mapping[str, str]
+    ) -> Tuple[Optional[bytes], Dict[str, str]]:
+        return await self.get_as_binary_async(), {}
+
 
 @dataclass
 class FileSource(Source):
@@ -83,6 +114,43 @@ class UrlSource(Source):
     def get_as_text(self, encoding: str = "utf-8") -> str:
         return self.get_as_binary().decode(encoding)
 
+    def get_as_binary_if_modified(
+        self, validators: Mapping[str, str]
+    ) -> Tuple[Optional[bytes], Dict[str, str]]:
+        kwargs = self._conditional_request_kwargs(validators)
+        response = requests.request(self.method, str(self.url), **kwargs)
+        if response.status_code == 304:
+            return None, dict(validators)
+        self._check_status(response.status_code)
+        return response.content, response_validators(response.headers)
+
+    async def get_as_binary_if_modified_async(
+        self, validators: Mapping[str, str]
+    ) -> Tuple[Optional[bytes], Dict[str, str]]:
+        kwargs = self._conditional_request_kwargs(validators)
+        async with aiohttp.ClientSession() as session:
+            _logger.debug(f"Performing conditional {self.method} to {self.url}")
+            response = await session.request(method=self.method, url=self.url, **kwargs)
+            if response.status == 304:
+                return None, dict(validators)
+            self._check_status(response.status)
+            return await response.read(), response_validators(response.headers)
+
+    def _check_status(self, status: int):
+        # Error pages must not replace the cached copy
+        if not 200 <= status < 300:
+            raise ValueError(f"Failed to get data from url: {self.url} ({status})")
+
+    def _conditional_request_kwargs(
+        self, validators: Mapping[str, str]
+    ) -> Dict[str, Any]:
+        kwargs = dict(self.request_kwargs)
+        kwargs["headers"] = {
+            **conditional_request_headers(validators),
+            **kwargs.get("headers", {}),
+        }
+        return kwargs
+
     async def request(self, session: aiohttp.ClientSession):
         _logger.debug(f"Performing {self.method} to {self.url}")
         return await session.request(
@@ -109,68 +177,158 @@ def generate_id() -> str:
 
 def cached(
     source: Source,
-    cache_dir: str = os.getenv("CACHE_DIR") or ".cache",
+    store: Optional[CacheStore] = None,
     lifetime_seconds: float = 24 * 60 * 60,
+    max_stale_seconds: float = 0,
 ):
-    filename = hashlib.md5(source.get_uri().encode()).hexdigest()[:8]
-    cache_path = pathlib.Path(cache_dir, f"{filename}.dat")
-    os.makedirs(cache_dir, exist_ok=True)
-    return Cached(source, cache_path, lifetime_seconds)
+    if store is None:
+        store = get_default_cache_store()
+    return Cached(source, store, lifetime_seconds, max_stale_seconds)
+
+
+_background_tasks: Set[asyncio.Task] = set()
 
 
 @dataclass
 class Cached(Source):
+    """Source cached in the compressed cache store.
+
+    Expired cache younger than ``lifetime_seconds + max_stale_seconds`` is
+    served immediately while the source is re-fetched in background.
+    """
+
     source: Source
-    _cache_path: pathlib.Path
+    store: CacheStore
     lifetime_seconds: float
+    max_stale_seconds: float = 0
+    _refresh_lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    @property
+    def key(self) -> str:
+        return self.source.get_uri()
 
     def get_uri(self) -> str:
-        return str(self._cache_path.absolute())
+        return f"cache:{self.key}"
 
     @property
     def valid_cache_exists(self) -> bool:
-        if not self._cache_path.exists():
-            return False
+        entry = self.store.get_entry(self.key)
+        return entry is not None and entry.age < self.lifetime_seconds
+
+    def _read_usable_cache(self) -> Optional[bytes]:
+        """Returns cached contents if they can be served, schedules a refresh
+        if they are stale"""
+        entry = self.store.get_entry(self.key)
+        if entry is None:
+            return None
+        age = entry.age
+        if age >= self.lifetime_seconds + self.max_stale_seconds:
+            return None
+        contents = self.store.read_bytes(entry)
+        if age >= self.lifetime_seconds:
+            self._refresh_in_background()
+        return contents
 
-        modified_time = os.path.getmtime(self._cache_path.absolute())
-        now = time.time()
-        return now - modified_time < self.lifetime_seconds
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            # Already refreshing
+            return
+
+        _logger.debug(f"Serving stale cache, refreshing {self.source!r}")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is not None:
+            # The loop only keeps weak references to tasks
+            task = loop.create_task(self._refresh_async())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        else:
+            threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self._fetch()
+        except Exception as err:
+            _logger.warning(f"Background refresh of {self.source!r} failed: {err}")
+        finally:
+            self._refresh_lock.release()
+
+    async def _refresh_async(self):
+        try:
+            await asyncio.wait_for(
+                self._fetch_async(), timeout=BACKGROUND_REFRESH_TIMEOUT
+            )
+        except Exception as err:
+            _logger.warning(f"Background refresh of {self.source!r} failed: {err}")
+        finally:
+            self._refresh_lock.release()
+
+    def _validators(self) -> Mapping[str, str]:
+        entry = self.store.get_entry(self.key)
+        return entry.validators if entry is not None else {}
+
+    def _keep_cached(self) -> Optional[bytes]:
+        """Contents of the cached copy the source confirmed not to be modified,
+        None if the copy is gone in the meantime"""
+        entry = self.store.get_entry(self.key)
+        if entry is None:
+            return None
+        # Not modified: only the lifetime of the cached copy is refreshed
+        _logger.debug(f"{self.source!r} is not modified, keeping cache")
+        self.store.touch(entry)
+        return self.store.read_bytes(entry)
+
+    def _store(self, contents: bytes, validators: Dict[str, str]) -> bytes:
+        self.store.put(self.key, contents, validators)
+        return contents
+
+    def _fetch(self) -> bytes:
+        validators = self._validators()
+        contents, validators = self.source.get_as_binary_if_modified(validators)
+        if contents is None:
+            contents = self._keep_cached()
+            if contents is not None:
+                return contents
+            contents, validators = self.source.get_as_binary(), {}
+        return self._store(contents, validators)
+
+    async def _fetch_async(self) -> bytes:
+        validators = self._validators()
+        contents, validators = await self.source.get_as_binary_if_modified_async(
+            validators
+        )
+        if contents is None:
+            contents = self._keep_cached()
+            if contents is not None:
+                return contents
+            contents, validators = await self.source.get_as_binary_async(), {}
+        return self._store(contents, validators)
 
     def invalidate_cache(self):
-        if self._cache_path.exists():
-            os.remove(self._cache_path.absolute())
+        self.store.delete(self.key)
 
     def get_as_binary(self) -> bytes:
-        if self.valid_cache_exists:
-            return self._cache_path.read_bytes()
-
-        contents = self.source.get_as_binary()
-        self._cache_path.write_bytes(contents)
+        contents = self._read_usable_cache()
+        if contents is None:
+            contents = self._fetch()
         return contents
 
     def get_as_text(self, encoding: str = "utf-8") -> str:
-        if self.valid_cache_exists:
-            return self._cache_path.read_text(encoding=encoding)
-
-        contents = self.source.get_as_text()
-        self._cache_path.write_text(contents, encoding)
-        return contents
+        return self.get_as_binary().decode(encoding)
 
     async def get_as_binary_async(self) -> bytes:
-        if self.valid_cache_exists:
-            return self._cache_path.read_bytes()
-
-        contents = await self.source.get_as_binary_async()
-        self._cache_path.write_bytes(contents)
+        contents = self._read_usable_cache()
+        if contents is None:
+            contents = await self._fetch_async()
         return contents
 
     async def get_as_text_async(self, encoding: str = "utf-8") -> str:
-        if self.valid_cache_exists:
-            return self._cache_path.read_text(encoding=encoding)
-
-        contents = await self.source.get_as_text_async(encoding)
-        self._cache_path.write_text(contents, encoding)
-        return contents
+        return (await self.get_as_binary_async()).decode(encoding)
 
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.source!r}>"
@@ -206,7 +364,7 @@ class DictAsset(Mapping[str, Any]):
         return len(self.data)
 
     def __contains__(self, item):
-        return len(self.data)
+        return item in self.data
 
     def __iter__(self):
         return iter(self.data)
@@ -239,7 +397,11 @@ class YamlDictAsset(DictAsset):
     encoding: str = "utf-8"
 
     def get_data(self) -> Dict[str, Any]:
-        return yaml.full_load(self.source.get_as_text(self.encoding))
+        # Files are parsed once per modification, DictAsset accessors call
+        # get_data every time
+        if isinstance(self.source, FileSource):
+            return load_yaml_file(str(self.source.path), self.encoding)
+        return load_yaml(self.source.get_as_text(self.encoding))
 
 
 T = TypeVar("T")
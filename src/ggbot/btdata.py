@@ -1,10 +1,20 @@
-from typing import Dict, Union, TypeVar, Optional, List, Callable, Any, Generic
+from typing import (
+    Dict,
+    Union,
+    TypeVar,
+    Optional,
+    List,
+    Callable,
+    Any,
+    Generic,
+    FrozenSet,
+)
 import random
 
 from attr import dataclass
 
 from ggbot.bttypes import *
-from ggbot.context import Context, IVariable, IExpression
+from ggbot.context import Context, IVariable, IExpression, dependencies_of
 
 
 __all__ = [
@@ -31,6 +41,8 @@ __all__ = [
     "SelectFromMap",
     "JoinedString",
     "RandomElementOf",
+    "Memoized",
+    "memoized",
 ]
 
 
@@ -47,6 +59,9 @@ class Const(IExpression[T]):
     def evaluate(self, ctx) -> T:
         return self._value
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return frozenset()
+
     def get_return_type(self) -> IType:
         return self._type
 
@@ -81,6 +96,9 @@ class Attr(IExpression[Any]):
     def evaluate(self, context: Context) -> Any:
         return getattr(self.object.evaluate(context), self.attr)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.object)
+
     def get_return_type(self) -> IType:
         obj = self.object.get_return_type()
         assert isinstance(obj, STRUCT)
@@ -98,6 +116,9 @@ class StringDictionary(IExpression[Dict[str, str]]):
     def evaluate(self, context: Context) -> Dict[str, str]:
         return {k: v.evaluate(context) for k, v in self.value.items()}
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(*self.value.values())
+
     def get_return_type(self) -> IType:
         return MAP(STRING, STRING)
 
@@ -117,6 +138,9 @@ class Item(IExpression[Optional[TVar]]):
         v_key = self.key.evaluate(context)
         return v_map.get(v_key)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.map, self.key)
+
     def get_return_type(self) -> IType:
         map_type = self.map.get_return_type()
         assert isinstance(map_type, MAP)
@@ -142,6 +166,9 @@ class AsString(IExpression[str]):
     def evaluate(self, context: Context) -> str:
         return str(self.value.evaluate(context))
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.value)
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -159,6 +186,9 @@ class Formatted(IExpression[str]):
         kwargs = {k: v.evaluate(context) for k, v in self.kwargs.items()}
         return self.template.format(**kwargs)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(*self.kwargs.values())
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -170,6 +200,10 @@ class SlotExpression(IExpression[str]):
     def evaluate(self, context: Context) -> str:
         return context.match.get_slot_value(self.slot_name)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        # Only reads the match, memoized values are checked against it
+        return frozenset()
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -183,6 +217,9 @@ class NumberSlotExpression(IExpression[int]):
         assert isinstance(value, int)
         return value
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return frozenset()
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -206,6 +243,9 @@ class Fallback(IExpression):
             return value
         return self.fallback_value.evaluate(ctx)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.value, self.fallback_value)
+
     def get_return_type(self) -> IType:
         return self.tp
 
@@ -236,6 +276,9 @@ class Divided(IExpression[float]):
     def evaluate(self, context: Context) -> float:
         return self.a.evaluate(context) / self.b.evaluate(context)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.a, self.b)
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -252,6 +295,9 @@ class Sum(IExpression[float]):
     def evaluate(self, context: Context) -> float:
         return self.a.evaluate(context) + self.b.evaluate(context)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.a, self.b)
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -266,6 +312,9 @@ class Rounded(IExpression[int]):
     def evaluate(self, context: Context) -> int:
         return round(self.a.evaluate(context))
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.a)
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -351,6 +400,9 @@ class JoinedString(IExpression[str]):
         items = self.collection.evaluate(context)
         return self.join_by.join(items)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.collection)
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -372,3 +424,38 @@ class RandomElementOf(IExpression[Optional[TVar]]):
         collection_type = self.collection.get_return_type()
         assert isinstance(collection_type, ARRAY)
         return ONEOF(NULL_TYPE, collection_type.get_item_type())
+
+
+class Memoized(IExpression[T]):
+    """Pure expression evaluated once per context until a variable it depends
+    on changes"""
+
+    __slots__ = ("expression", "dependencies")
+
+    def __init__(self, expression: IExpression[T]):
+        dependencies = expression.get_dependencies()
+        assert dependencies is not None, f"Pure expression expected: {expression}"
+        self.expression = expression
+        self.dependencies = tuple(sorted(dependencies))
+
+    def evaluate(self, context: Context) -> T:
+        return context.evaluate_memoized(self.expression, self.dependencies)
+
+    def get_return_type(self) -> IType:
+        return self.expression.get_return_type()
+
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return frozenset(self.dependencies)
+
+    def __repr__(self):
+        return f"Memoized({self.expression!r})"
+
+
+def memoized(expression: IExpression[T]) -> IExpression[T]:
+    """Memoized expression if it is pure. Constants and variables are cheaper
+    to evaluate than to look up"""
+    if isinstance(expression, (Const, IVariable, Memoized)):
+        return expression
+    if not expression.is_pure():
+        return expression
+    return Memoized(expression)
@@ -0,0 +1,438 @@
+from typing import Any, Dict, List, Optional, Tuple, Callable, TypeVar, FrozenSet
+from string import Formatter
+import logging
+import math
+import random
+
+import attr
+
+from ggbot.bttypes import *
+from ggbot.context import Context, IExpression, Variable
+from ggbot.btdata import (
+    Const,
+    Factory,
+    Attr,
+    StringDictionary,
+    Item,
+    AsString,
+    Formatted,
+    Fallback,
+    Divided,
+    Sum,
+    Rounded,
+    Filtered,
+    SelectFromArray,
+    SelectFromMap,
+    JoinedString,
+    RandomElementOf,
+    memoized,
+)
+
+
+__all__ = ["CompiledExpression", "compile_expression"]
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Nodes without side effects, folded when all their children are constants
+_PURE = (
+    Const,
+    Attr,
+    StringDictionary,
+    Item,
+    AsString,
+    Formatted,
+    Fallback,
+    Divided,
+    Sum,
+    Rounded,
+    JoinedString,
+)
+
+# Nodes the code is generated for, others are evaluated by the interpreter
+# with their subexpressions compiled
+_NATIVE = (
+    *_PURE,
+    Variable,
+    Factory,
+    RandomElementOf,
+    Filtered,
+    SelectFromArray,
+    SelectFromMap,
+)
+
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+# Nodes whose value is a str whenever the type says so
+_PRODUCES_STR = (AsString, Formatted, JoinedString)
+
+
+class CompiledExpression(IExpression[T]):
+    """Expression tree compiled into a single python function.
+
+    Behaves exactly like the tree it was compiled from. The code is generated
+    on the first evaluation (or ``compile()``) so that building trees at
+    startup stays cheap, ``source`` is the generated code.
+    """
+
+    def __init__(self, expression: IExpression[T]):
+        self.expression = expression
+        self._source: Optional[str] = None
+
+    def compile(self) -> "CompiledExpression[T]":
+        if self._source is None:
+            # Instance attribute shadows the method from now on
+            self.evaluate, self._source = _generate(self.expression)
+        return self
+
+    def evaluate(self, context: Context) -> T:
+        return self.compile().evaluate(context)
+
+    @property
+    def source(self) -> str:
+        return self.compile()._source
+
+    def get_return_type(self) -> IType:
+        return self.expression.get_return_type()
+
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return self.expression.get_dependencies()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} of {type(self.expression).__name__}>"
+
+
+def _children(expr: IExpression) -> List[IExpression]:
+    if isinstance(expr, Attr):
+        return [expr.object]
+    if isinstance(expr, StringDictionary):
+        return list(expr.value.values())
+    if isinstance(expr, Item):
+        return [expr.map, expr.key]
+    if isinstance(expr, (AsString, Rounded)):
+        return [expr.value if isinstance(expr, AsString) else expr.a]
+    if isinstance(expr, Formatted):
+        return list(expr.kwargs.values())
+    if isinstance(expr, Fallback):
+        return [expr.value, expr.fallback_value]
+    if isinstance(expr, (Divided, Sum)):
+        return [expr.a, expr.b]
+    if isinstance(expr, JoinedString):
+        return [expr.collection]
+    return []
+
+
+def _is_literal(value: Any) -> bool:
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return value is None or isinstance(value, (bool, int, str))
+
+
+def _parse_format(template: str) -> Optional[List[Tuple[str, Optional[str], str, str]]]:
+    """(literal, field, conversion, spec) parts of a format string, None if
+    it has fields that are not plain keyword names"""
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and not field.isidentifier():
+            return None
+        if spec and ("{" in spec):
+            return None
+        parts.append((literal, field, conversion or "", spec or ""))
+    return parts
+
+
+class _ExprCodeGen:
+    def __init__(self):
+        self.lines: List[str] = []
+        self.namespace: Dict[str, Any] = {"_choice": random.choice}
+        self.uses_locals = False
+        self._names = 0
+        self._bound: Dict[int, str] = {}
+        self._constants: Dict[int, Tuple[bool, Any]] = {}
+        # Names of loop variables -> python locals holding them
+        self._scope: Dict[str, str] = {}
+        # Names of variables -> python locals they were read to
+        self._reads: Dict[str, str] = {}
+
+    def _tmp(self) -> str:
+        self._names += 1
+        return f"t{self._names}"
+
+    def _emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def _bind(self, obj: Any, prefix: str = "_c") -> str:
+        name = self._bound.get(id(obj))
+        if name is None:
+            name = self._bound[id(obj)] = f"{prefix}{len(self._bound)}"
+            self.namespace[name] = obj
+        return name
+
+    def _literal(self, value: Any) -> str:
+        if _is_literal(value):
+            return repr(value)
+        return self._bind(value)
+
+    def _constant(self, expr: IExpression) -> Tuple[bool, Any]:
+        """(True, value) if the expression is pure and has constant inputs"""
+        key = id(expr)
+        if key in self._constants:
+            return self._constants[key]
+        result: Tuple[bool, Any] = (False, None)
+        if isinstance(expr, Const):
+            result = (True, expr.evaluate(None))
+        elif isinstance(expr, _PURE) and all(
+            self._constant(c)[0] for c in _children(expr)
+        ):
+            try:
+                value = expr.evaluate(None)
+            except Exception:
+                # E.g. division by zero, let it fail at runtime as before
+                value = None
+            else:
+                # Folded containers would be shared between evaluations
+                if _is_literal(value):
+                    result = (True, value)
+        self._constants[key] = result
+        return result
+
+    def _to_str(self, expr: IExpression, code: str) -> str:
+        if isinstance(expr, _PRODUCES_STR) and STRING.can_accept(
+            expr.get_return_type()
+        ):
+            return code
+        return f"str({code})"
+
+    def _opaque(self, expr: IExpression) -> str:
+        # Pure ones are evaluated once per context, e.g. hero names
+        expr = memoized(_compile_fields(expr))
+        if not expr.is_pure():
+            # Might set variables
+            self._reads.clear()
+        return f"{self._bind(expr, '_e')}.evaluate(ctx)"
+
+    def emit(self, expr: IExpression, indent: int) -> str:
+        """Emits statements needed for the expression and returns the python
+        expression of its value, every returned expression is used once"""
+        is_constant, value = self._constant(expr)
+        if is_constant:
+            return self._literal(value)
+
+        if isinstance(expr, Variable):
+            name = expr.get_name()
+            if name in self._scope:
+                return self._scope[name]
+            self.uses_locals = True
+            if indent > 1:
+                return f"_local.get({name!r})"
+            # Unconditional reads are done once, until something might have
+            # changed the variables
+            if name not in self._reads:
+                self._reads[name] = self._tmp()
+                self._emit(indent, f"{self._reads[name]} = _local.get({name!r})")
+            return self._reads[name]
+
+        if isinstance(expr, Attr):
+            struct = expr.object.get_return_type()
+            if not isinstance(struct, STRUCT):
+                raise TypeError(f"Struct type expected in {expr}, got {struct}")
+            try:
+                struct.get_attr_type(expr.attr)
+            except KeyError:
+                raise TypeError(f"{struct} has no attribute {expr.attr}") from None
+            return f"{self.emit(expr.object, indent)}.{expr.attr}"
+
+        if isinstance(expr, StringDictionary):
+            items = ", ".join(
+                f"{k!r}: {self.emit(v, indent)}" for k, v in expr.value.items()
+            )
+            return f"{{{items}}}"
+
+        if isinstance(expr, Item):
+            obj = self.emit(expr.map, indent)
+            return f"{obj}.get({self.emit(expr.key, indent)})"
+
+        if isinstance(expr, AsString):
+            return self._to_str(expr.value, self.emit(expr.value, indent))
+
+        if isinstance(expr, Formatted):
+            return self._formatted(expr, indent)
+
+        if isinstance(expr, Fallback):
+            target = self._tmp()
+            self._emit(indent, f"{target} = {self.emit(expr.value, indent)}")
+            self._emit(indent, f"if {target} is None:")
+            fallback = self.emit(expr.fallback_value, indent + 1)
+            self._emit(indent + 1, f"{target} = {fallback}")
+            return target
+
+        if isinstance(expr, (Divided, Sum)):
+            for operand in (expr.a, expr.b):
+                if not NUMBER.can_accept(operand.get_return_type()):
+                    raise TypeError(f"Number expected in {expr}")
+            op = "/" if isinstance(expr, Divided) else "+"
+            a = self.emit(expr.a, indent)
+            return f"({a} {op} {self.emit(expr.b, indent)})"
+
+        if isinstance(expr, Rounded):
+            return f"round({self.emit(expr.a, indent)})"
+
+        if isinstance(expr, JoinedString):
+            return f"{expr.join_by!r}.join({self.emit(expr.collection, indent)})"
+
+        if isinstance(expr, RandomElementOf):
+            items = self._tmp()
+            self._emit(indent, f"{items} = {self.emit(expr.collection, indent)}")
+            return f"(_choice({items}) if len({items}) > 0 else None)"
+
+        if isinstance(expr, (Filtered, SelectFromArray, SelectFromMap)):
+            return self._loop(expr, indent)
+
+        if isinstance(expr, Factory):
+            return f"{self._bind(expr._value)}()"
+
+        # Template, slots, dota specific nodes, ...
+        return self._opaque(expr)
+
+    def _formatted(self, expr: Formatted, indent: int) -> str:
+        parts = _parse_format(expr.template)
+        if parts is None or any(
+            f is not None and f not in expr.kwargs for _, f, _, _ in parts
+        ):
+            kwargs = ", ".join(
+                f"{k}={self.emit(v, indent)}" for k, v in expr.kwargs.items()
+            )
+            return f"{self._bind(expr.template)}.format({kwargs})"
+
+        # Unused keyword arguments are not evaluated, used ones are evaluated
+        # once even if referenced several times
+        values: Dict[str, Tuple[bool, Any]] = {}  # field -> (constant, value)
+        for _, field, _, _ in parts:
+            if field is None or field in values:
+                continue
+            kwarg = expr.kwargs[field]
+            is_constant, value = self._constant(kwarg)
+            if is_constant and _is_literal(value):
+                values[field] = (True, value)
+                continue
+            code = self.emit(kwarg, indent)
+            if not code.isidentifier():
+                name = self._tmp()
+                self._emit(indent, f"{name} = {code}")
+                code = name
+            values[field] = (False, code)
+
+        # Literal text and f-strings of the fields concatenated at compile
+        # time, formatting is the same as in str.format
+        text = ""
+        pieces = []
+        for literal, field, conversion, spec in parts:
+            text += literal
+            if field is None:
+                continue
+            is_constant, value = values[field]
+            if is_constant:
+                if conversion:
+                    value = _CONVERSIONS[conversion](value)
+                text += format(value, spec)
+                continue
+            if text:
+                pieces.append(repr(text))
+                text = ""
+            if any(c in spec for c in "'\"\\{}"):
+                # Such spec can not be a part of an f-string
+                name = self._tmp()
+                if conversion:
+                    value = f"{_CONVERSIONS[conversion].__name__}({value})"
+                self._emit(indent, f"{name} = format({value}, {spec!r})")
+                pieces.append(f"f'{{{name}}}'")
+                continue
+            conversion = f"!{conversion}" if conversion else ""
+            spec = f":{spec}" if spec else ""
+            pieces.append(f"f'{{{value}{conversion}{spec}}}'")
+        if text or not pieces:
+            pieces.append(repr(text))
+        if len(pieces) == 1:
+            return pieces[0]
+        return f"({' '.join(pieces)})"
+
+    def _loop(self, expr: IExpression, indent: int) -> str:
+        result = self._tmp()
+        collection = self.emit(expr.collection, indent)
+        self._emit(indent, f"{result} = []")
+        self.uses_locals = True
+
+        if isinstance(expr, SelectFromMap):
+            bound = [expr.key.get_name(), expr.value.get_name()]
+            names = [self._tmp(), self._tmp()]
+            self._emit(indent, f"for {names[0]}, {names[1]} in {collection}.items():")
+        else:
+            bound = [expr.x.get_name()]
+            names = [self._tmp()]
+            self._emit(indent, f"for {names[0]} in {collection}:")
+
+        saved = dict(self._scope)
+        for var, name in zip(bound, names):
+            # Still set for the nodes that are evaluated by the interpreter
+            self._emit(indent + 1, f"_local[{var!r}] = {name}")
+            self._scope[var] = name
+            self._reads.pop(var, None)
+        value = self.emit(expr.fn, indent + 1)
+        if isinstance(expr, Filtered):
+            self._emit(indent + 1, f"if {value}:")
+            self._emit(indent + 2, f"{result}.append({names[0]})")
+        else:
+            self._emit(indent + 1, f"{result}.append({value})")
+        self._scope = saved
+        return result
+
+
+def _compile_fields(expr: IExpression) -> IExpression:
+    """Compiles subexpressions of a node that is evaluated by the interpreter"""
+    if not attr.has(type(expr)):
+        return expr
+    changes = {}
+    for field in attr.fields(type(expr)):
+        value = getattr(expr, field.name)
+        if isinstance(value, IExpression):
+            compiled = compile_expression(value)
+            if compiled is not value:
+                changes[field.alias or field.name.lstrip("_")] = compiled
+    if not changes:
+        return expr
+    return attr.evolve(expr, **changes)
+
+
+# id of the tree -> (tree, compiled), trees are kept alive so ids are not reused
+_cache: Dict[int, Tuple[IExpression, IExpression]] = {}
+
+
+def _generate(expr: IExpression) -> Tuple[Callable[[Context], Any], str]:
+    gen = _ExprCodeGen()
+    value = gen.emit(expr, 1)
+    header = ["def _evaluate(ctx):"]
+    if gen.uses_locals:
+        header.append("    _local = ctx.local")
+    source = "\n".join([*header, *gen.lines, f"    return {value}"])
+    namespace = dict(gen.namespace)
+    exec(compile(source, f"<btexpr {type(expr).__name__}>", "exec"), namespace)
+    return namespace["_evaluate"], source
+
+
+def compile_expression(expr: IExpression[T]) -> IExpression[T]:
+    """Compiles the expression tree into a single function. Trees are
+    compiled once, the same compiled expression is returned for the same
+    tree instance. Constants and variables are returned as is, nodes the
+    compiler does not know get their subexpressions compiled"""
+    if isinstance(expr, (CompiledExpression, Const, Variable)):
+        return expr
+    cached = _cache.get(id(expr))
+    if cached is not None and cached[0] is expr:
+        return cached[1]
+    if isinstance(expr, _NATIVE):
+        compiled = CompiledExpression(expr)
+    else:
+        compiled = _compile_fields(expr)
+    _cache[id(expr)] = expr, compiled
+    return compiled
@@ -0,0 +1,591 @@
+from typing import Optional, Tuple, List, Iterable, Callable, Awaitable, Union, Any
+import asyncio
+import random
+import logging
+
+from jinja2 import Template, nodes
+from jinja2.nativetypes import NativeEnvironment
+from jinja2.exceptions import TemplateError
+from jinja2.optimizer import optimize as optimize_template
+
+from ggbot.context import Context
+from ggbot.bttrace import node_name, is_instrumented, retrace
+
+
+__all__ = [
+    "Node",
+    "Constant",
+    "Sequence",
+    "Selector",
+    "AlwaysFail",
+    "AlwaysSuccess",
+    "CheckCondition",
+    "RetryUntilSuccess",
+    "RepeatUntilTimerExpires",
+    "Inverter",
+    "NoLongerThan",
+    "RandomOneOf",
+    "ParallelAll",
+    "ParallelAny",
+    "Race",
+    "run_with_timeout",
+    "constant_condition",
+    "optimize",
+    "compile_tree",
+]
+
+_logger = logging.getLogger(__name__)
+
+Action = Callable[[Context], Awaitable[bool]]
+
+
+class Node:
+    """Behavior tree node: an action that keeps its children, so that the tree
+    can be inspected and rewritten by ``optimize``"""
+
+    __slots__ = ()
+    bt_name = "node"
+    children: Tuple[Action, ...] = ()
+
+    async def __call__(self, ctx: Context) -> bool:
+        raise NotImplementedError
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        return self
+
+    def _args(self) -> List[str]:
+        return [_describe(c) for c in self.children]
+
+    def __repr__(self):
+        return f"{self.bt_name}({', '.join(self._args())})"
+
+
+def _describe(action: Action) -> str:
+    if isinstance(action, Node):
+        return repr(action)
+    return node_name(action)
+
+
+class Constant(Node):
+    __slots__ = ("value",)
+    bt_name = "constant"
+
+    def __init__(self, value: bool):
+        self.value = value
+
+    async def __call__(self, ctx: Context) -> bool:
+        return self.value
+
+    def _args(self) -> List[str]:
+        return [repr(self.value)]
+
+
+SUCCESS = Constant(True)
+FAILURE = Constant(False)
+
+
+class _Composite(Node):
+    __slots__ = ("children",)
+
+    def __init__(self, children: Iterable[Action]):
+        self.children = tuple(children)
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        return type(self)(children)
+
+
+class Sequence(_Composite):
+    __slots__ = ()
+    bt_name = "sequence"
+
+    async def __call__(self, ctx: Context) -> bool:
+        for f in self.children:
+            res = await f(ctx)
+            if not res:
+                return False
+        return True
+
+
+class Selector(_Composite):
+    __slots__ = ()
+    bt_name = "selector"
+
+    async def __call__(self, ctx: Context) -> bool:
+        for f in self.children:
+            res = await f(ctx)
+            if res:
+                return True
+        return False
+
+
+class RandomOneOf(_Composite):
+    __slots__ = ()
+    bt_name = "random_one_of"
+
+    async def __call__(self, ctx: Context) -> bool:
+        if not self.children:
+            return True
+
+        option = random.choice(self.children)
+        return await option(ctx)
+
+
+class _Decorator(Node):
+    __slots__ = ("child",)
+
+    def __init__(self, child: Action):
+        self.child = child
+
+    @property
+    def children(self) -> Tuple[Action, ...]:
+        return (self.child,)
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        (child,) = children
+        return type(self)(child)
+
+
+class AlwaysFail(_Decorator):
+    __slots__ = ()
+    bt_name = "always_fail"
+
+    async def __call__(self, ctx: Context) -> bool:
+        await self.child(ctx)
+        return False
+
+
+class AlwaysSuccess(_Decorator):
+    __slots__ = ()
+    bt_name = "always_success"
+
+    async def __call__(self, ctx: Context) -> bool:
+        await self.child(ctx)
+        return True
+
+
+class Inverter(_Decorator):
+    __slots__ = ()
+    bt_name = "inverter"
+
+    async def __call__(self, ctx: Context) -> bool:
+        res = await self.child(ctx)
+        return not res
+
+
+class RetryUntilSuccess(_Decorator):
+    __slots__ = ("times",)
+    bt_name = "retry_until_success"
+
+    def __init__(self, times: int, child: Action):
+        super().__init__(child)
+        self.times = times
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        (child,) = children
+        return RetryUntilSuccess(self.times, child)
+
+    async def __call__(self, ctx: Context) -> bool:
+        for i in range(self.times):
+            res = await self.child(ctx)
+            if res:
+                return True
+        return False
+
+    def _args(self) -> List[str]:
+        return [str(self.times), *super()._args()]
+
+
+class _Timed(_Decorator):
+    __slots__ = ("seconds",)
+
+    def __init__(self, seconds: float, child: Action):
+        super().__init__(child)
+        self.seconds = seconds
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        (child,) = children
+        return type(self)(self.seconds, child)
+
+    def _args(self) -> List[str]:
+        return [str(self.seconds), *super()._args()]
+
+
+async def run_with_timeout(action: Action, ctx: Context, seconds: float) -> bool:
+    """Runs the action with the deadline of the context shrunk to seconds.
+
+    Once the deadline (own or an outer one, whichever is earlier) expires the
+    action is cancelled and awaited, then ``asyncio.TimeoutError`` is raised.
+    """
+    with ctx.timeout(seconds):
+        remaining = ctx.remaining()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return await asyncio.wait_for(action(ctx), timeout=remaining)
+
+
+class NoLongerThan(_Timed):
+    __slots__ = ()
+    bt_name = "no_longer_than"
+
+    async def __call__(self, ctx: Context) -> bool:
+        try:
+            res = await run_with_timeout(self.child, ctx, self.seconds)
+            return res
+        except asyncio.TimeoutError:
+            return False
+
+
+async def _repeat_until_failure(action: Action, ctx: Context):
+    while True:
+        result = await action(ctx)
+        if not result:
+            return False
+
+
+class RepeatUntilTimerExpires(_Timed):
+    __slots__ = ()
+    bt_name = "repeat_until_timer_expires"
+
+    async def __call__(self, ctx: Context) -> bool:
+        async def _repeat(child_ctx: Context):
+            return await _repeat_until_failure(self.child, child_ctx)
+
+        try:
+            result = await run_with_timeout(_repeat, ctx, self.seconds)
+            return result
+        except asyncio.TimeoutError:
+            return True
+
+
+class _Parallel(_Composite):
+    """Runs children concurrently, each in its own ``Context.overlay``.
+
+    Once the outcome is known (or the timeout expires, which is a failure as
+    in ``no_longer_than``) the children still running are cancelled and
+    awaited. Variables assigned by the children that finished are then
+    merged into the context in the order of children, so the result does not
+    depend on the order in which they completed. An exception of a child
+    cancels the others and is re-raised, the first one in the order of
+    children if several failed together.
+    """
+
+    __slots__ = ("timeout",)
+
+    def __init__(self, children: Iterable[Action], timeout: Optional[float] = None):
+        super().__init__(children)
+        self.timeout = timeout
+
+    def with_children(self, children: Iterable[Action]) -> "Node":
+        return type(self)(children, self.timeout)
+
+    def _decide(self, result: bool) -> Optional[bool]:
+        """Outcome decided by a finished child, None to wait for others"""
+        raise NotImplementedError
+
+    def _default(self) -> bool:
+        """Outcome when all children finished without deciding it"""
+        raise NotImplementedError
+
+    async def __call__(self, ctx: Context) -> bool:
+        if not self.children:
+            return self._default()
+
+        if self.timeout is None:
+            return await self._run_children(ctx)
+        with ctx.timeout(self.timeout):
+            return await self._run_children(ctx)
+
+    async def _run_children(self, ctx: Context) -> bool:
+        overlays = [ctx.overlay() for _ in self.children]
+        tasks = [
+            asyncio.create_task(child(overlay), name=f"{ctx.name}-{self.bt_name}-{i}")
+            for i, (child, overlay) in enumerate(zip(self.children, overlays))
+        ]
+        index = {task: i for i, task in enumerate(tasks)}
+        finished = []
+        outcome = None
+        pending = set(tasks)
+        try:
+            while pending and outcome is None:
+                remaining = ctx.remaining()
+                timeout = None if remaining is None else max(0.0, remaining)
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    _logger.debug(f"{self.bt_name} reached the deadline")
+                    outcome = False
+                    break
+                done = sorted(done, key=index.__getitem__)
+                # Retrieve the exception of every finished child, so none of
+                # them is reported as never retrieved once the first is raised
+                errors = [task.exception() for task in done if not task.cancelled()]
+                error = next((err for err in errors if err is not None), None)
+                if error is not None:
+                    raise error
+                for task in done:
+                    finished.append(index[task])
+                    outcome = self._decide(bool(task.result()))
+                    if outcome is not None:
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        for i in sorted(finished):
+            ctx.merge(overlays[i])
+        return self._default() if outcome is None else outcome
+
+    def _args(self) -> List[str]:
+        args = super()._args()
+        if self.timeout is not None:
+            args.append(f"timeout={self.timeout}")
+        return args
+
+
+class ParallelAll(_Parallel):
+    __slots__ = ()
+    bt_name = "parallel_all"
+
+    def _decide(self, result: bool) -> Optional[bool]:
+        return None if result else False
+
+    def _default(self) -> bool:
+        return True
+
+
+class ParallelAny(_Parallel):
+    __slots__ = ()
+    bt_name = "parallel_any"
+
+    def _decide(self, result: bool) -> Optional[bool]:
+        return True if result else None
+
+    def _default(self) -> bool:
+        return False
+
+
+class Race(_Parallel):
+    __slots__ = ()
+    bt_name = "race"
+
+    def _decide(self, result: bool) -> Optional[bool]:
+        return result
+
+    def _default(self) -> bool:
+        return True
+
+
+_constant_env = NativeEnvironment()
+
+
+def constant_condition(condition: Union[str, Template]) -> Optional[bool]:
+    """Truthiness of the condition if it does not depend on the context.
+
+    Uses jinja's own constant folding: the condition is constant if the
+    optimized template only outputs constants. Compiled templates are opaque.
+    """
+    if not isinstance(condition, str):
+        return None
+    try:
+        ast = optimize_template(_constant_env.parse(condition), _constant_env)
+    except TemplateError:
+        return None
+    for node in ast.body:
+        if not isinstance(node, nodes.Output):
+            return None
+        if not all(isinstance(n, nodes.Const) for n in node.nodes):
+            return None
+    return bool(_constant_env.from_string(condition).render())
+
+
+class CheckCondition(Node):
+    __slots__ = ("condition",)
+    bt_name = "check_condition"
+
+    def __init__(self, condition: Union[str, Template]):
+        self.condition = condition
+
+    async def __call__(self, ctx: Context) -> bool:
+        return bool(ctx.render_template(self.condition))
+
+    def _args(self) -> List[str]:
+        return [repr(self.condition)]
+
+
+def _flatten(node_type: type, children: Iterable[Action]) -> List[Action]:
+    flat = []
+    for child in children:
+        if type(child) is node_type:
+            flat.extend(child.children)
+        else:
+            flat.append(child)
+    return flat
+
+
+def _optimize_composite(node: _Composite, children: List[Action]) -> Action:
+    # Sequence stops at the first failure and selector at the first success:
+    # constants equal to `stop` end the node, the opposite ones are no-ops
+    stop = isinstance(node, Selector)
+    result = []
+    for child in _flatten(type(node), children):
+        if isinstance(child, Constant):
+            if child.value == stop:
+                result.append(child)
+                break
+            continue
+        result.append(child)
+
+    if not result:
+        return Constant(not stop)
+    if len(result) == 1:
+        return result[0]
+    return node.with_children(result)
+
+
+def optimize(action: Action) -> Action:
+    """Rewrites the tree into an equivalent one with less nodes.
+
+    Nested sequences and selectors are flattened, no-op children (constants
+    that do not change the outcome) and unreachable children are removed,
+    constant conditions are folded and nodes with constant children are
+    replaced by constants where the outcome is known. Instrumented (traced)
+    nodes are optimized inside their wrappers, which are kept so that every
+    traced node still shows up in traces.
+    """
+    if is_instrumented(action):
+        inner = optimize(action.__wrapped__)
+        # Nothing to trace, constants are folded into their parents
+        return inner if isinstance(inner, Constant) else retrace(action, inner)
+
+    if not isinstance(action, Node):
+        return action
+
+    if isinstance(action, CheckCondition):
+        value = constant_condition(action.condition)
+        return action if value is None else Constant(value)
+
+    children = [optimize(c) for c in action.children]
+
+    if isinstance(action, (Sequence, Selector)):
+        return _optimize_composite(action, children)
+
+    if isinstance(action, RandomOneOf):
+        if not children:
+            return SUCCESS
+        if len(children) == 1:
+            return children[0]
+        return action.with_children(children)
+
+    if isinstance(action, (AlwaysSuccess, AlwaysFail)):
+        (child,) = children
+        if isinstance(child, Constant):
+            return Constant(isinstance(action, AlwaysSuccess))
+        if isinstance(child, (AlwaysSuccess, AlwaysFail)):
+            child = child.child
+        return action.with_children([child])
+
+    if isinstance(action, Inverter):
+        (child,) = children
+        if isinstance(child, Constant):
+            return Constant(not child.value)
+        return action.with_children(children)
+
+    if isinstance(action, RetryUntilSuccess):
+        (child,) = children
+        if isinstance(child, Constant):
+            return Constant(child.value and action.times > 0)
+        return action.with_children(children)
+
+    return action.with_children(children)
+
+
+_INLINED = (Sequence, Selector, Inverter, AlwaysSuccess, AlwaysFail, RetryUntilSuccess)
+
+
+class _CodeGen:
+    """Emits a single coroutine for sequences, selectors, inverters, retries
+    and always_* nodes. Everything else is awaited as a leaf, leaves that are
+    nodes get their children compiled separately"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.leaves: List[Action] = []
+        self._vars = 0
+
+    def _var(self) -> str:
+        self._vars += 1
+        return f"r{self._vars}"
+
+    def _emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def _leaf(self, action: Action) -> str:
+        self.leaves.append(_compile(action))
+        return f"_leaf{len(self.leaves) - 1}"
+
+    def emit(self, action: Action, target: str, indent: int):
+        if isinstance(action, Constant):
+            self._emit(indent, f"{target} = {action.value!r}")
+        elif isinstance(action, (Sequence, Selector)):
+            stop = isinstance(action, Selector)
+            check = "if r:" if stop else "if not r:"
+            self._emit(indent, "while True:")
+            for child in action.children:
+                self.emit(child, "r", indent + 1)
+                self._emit(indent + 1, check)
+                self._emit(indent + 2, f"{target} = {stop!r}")
+                self._emit(indent + 2, "break")
+            self._emit(indent + 1, f"{target} = {not stop!r}")
+            self._emit(indent + 1, "break")
+        elif isinstance(action, Inverter):
+            self.emit(action.child, "r", indent)
+            self._emit(indent, f"{target} = not r")
+        elif isinstance(action, (AlwaysSuccess, AlwaysFail)):
+            self.emit(action.child, "r", indent)
+            self._emit(indent, f"{target} = {isinstance(action, AlwaysSuccess)!r}")
+        elif isinstance(action, RetryUntilSuccess):
+            self._emit(indent, f"{target} = False")
+            self._emit(indent, f"for _ in range({action.times!r}):")
+            self.emit(action.child, "r", indent + 1)
+            self._emit(indent + 1, "if r:")
+            self._emit(indent + 2, f"{target} = True")
+            self._emit(indent + 2, "break")
+        else:
+            self._emit(indent, f"{target} = await {self._leaf(action)}(ctx)")
+
+
+def _compile(action: Action) -> Action:
+    if is_instrumented(action):
+        return retrace(action, _compile(action.__wrapped__))
+    if not isinstance(action, Node) or isinstance(action, Constant):
+        return action
+    if not isinstance(action, _INLINED):
+        return _compile_children(action)
+
+    gen = _CodeGen()
+    gen.emit(action, "result", 1)
+    source = "\n".join(["async def _run(ctx):", *gen.lines, "    return result"])
+    namespace: dict[str, Any] = {f"_leaf{i}": a for i, a in enumerate(gen.leaves)}
+    exec(compile(source, f"<btree {_describe(action)[:60]}>", "exec"), namespace)
+    run = namespace["_run"]
+    run.__bt_source__ = source
+    run.__bt_tree__ = action
+    return run
+
+
+def _compile_children(action: Node) -> Node:
+    if not action.children:
+        return action
+    return action.with_children([_compile(c) for c in action.children])
+
+
+def compile_tree(action: Action) -> Action:
+    """Optimizes the tree and compiles it into a coroutine function in which
+    only the leaves (and nodes with their own scheduling like timeouts)
+    are awaited. With tracing enabled every node is instrumented and so is a
+    leaf of its parent: each node is compiled on its own instead of being
+    inlined into the parent"""
+    return _compile(optimize(action))
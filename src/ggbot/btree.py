@@ -1,12 +1,27 @@
-from typing import Callable, Awaitable, TypeVar, Dict, Union
+from typing import Callable, Awaitable, TypeVar, Dict, Union, Optional
 import asyncio
-import random
 import logging
 
 from jinja2 import Template
 
 from ggbot.context import Context, IExpression, IVariable
 from ggbot.bttypes import *
+from ggbot.bttrace import instrument, instrument_children
+from ggbot.btnodes import (
+    Sequence,
+    Selector,
+    AlwaysFail,
+    AlwaysSuccess,
+    CheckCondition,
+    RetryUntilSuccess,
+    RepeatUntilTimerExpires,
+    Inverter,
+    NoLongerThan,
+    RandomOneOf,
+    ParallelAll,
+    ParallelAny,
+    Race,
+)
 
 
 __all__ = [
@@ -23,6 +38,9 @@ __all__ = [
     "inverter",
     "no_longer_than",
     "random_one_of",
+    "parallel_all",
+    "parallel_any",
+    "race",
     "do_action",
     "do_print",
     "ask_input",
@@ -37,41 +55,19 @@ Action = Callable[[Context], Awaitable[bool]]
 
 
 def sequence(*child: Action) -> Action:
-    async def _fn(ctx: Context):
-        for f in child:
-            res = await f(ctx)
-            if not res:
-                return False
-        return True
-
-    return _fn
+    return Sequence(instrument_children(child))
 
 
 def selector(*child: Action) -> Action:
-    async def _fn(ctx: Context):
-        for f in child:
-            res = await f(ctx)
-            if res:
-                return True
-        return False
-
-    return _fn
+    return Selector(instrument_children(child))
 
 
 def always_fail(child: Action) -> Action:
-    async def _fn(ctx: Context):
-        await child(ctx)
-        return False
-
-    return _fn
+    return AlwaysFail(instrument(child))
 
 
 def always_success(child: Action) -> Action:
-    async def _fn(ctx: Context):
-        await child(ctx)
-        return True
-
-    return _fn
+    return AlwaysSuccess(instrument(child))
 
 
 def set_var(var: str, value) -> Action:
@@ -91,28 +87,11 @@ def ensure_var(var: str) -> Action:
 
 
 def check_condition(condition: Union[str, Template]) -> Action:
-    async def _fn(ctx: Context):
-        return bool(ctx.render_template(condition))
-
-    return _fn
+    return CheckCondition(condition)
 
 
 def retry_until_success(times: int, child: Action) -> Action:
-    async def _fn(ctx: Context):
-        for i in range(times):
-            res = await child(ctx)
-            if res:
-                return True
-        return False
-
-    return _fn
-
-
-async def _repeat_until_failure(action: Action, ctx: Context):
-    while True:
-        result = await action(ctx)
-        if not result:
-            return False
+    return RetryUntilSuccess(times, instrument(child))
 
 
 async def _wait_then_succeed(seconds: float):
@@ -121,48 +100,34 @@ async def _wait_then_succeed(seconds: float):
 
 
 def repeat_until_timer_expires(seconds: float, action: Action) -> Action:
-    async def _fn(ctx: Context):
-        try:
-            result = await asyncio.wait_for(
-                _repeat_until_failure(action, ctx), timeout=seconds
-            )
-            return result
-        except asyncio.TimeoutError:
-            return True
-
-    return _fn
+    return RepeatUntilTimerExpires(seconds, instrument(action))
 
 
 def inverter(child: Action) -> Action:
-    async def _fn(ctx: Context):
-        res = await child(ctx)
-        return not res
-
-    return _fn
+    return Inverter(instrument(child))
 
 
 def no_longer_than(seconds: float, child: Action):
-    async def _fn(ctx: Context):
-        try:
-            res = await asyncio.wait_for(child(ctx), timeout=seconds)
-            return res
-        except TimeoutError:
-            return False
-
-    return _fn
+    return NoLongerThan(seconds, instrument(child))
 
 
 def random_one_of(*child: Action) -> Action:
-    options = list(child)
+    return RandomOneOf(instrument_children(child))
 
-    async def _fn(ctx: Context):
-        if not options:
-            return True
 
-        option = random.choice(options)
-        return await option(ctx)
+def parallel_all(*child: Action, timeout: Optional[float] = None) -> Action:
+    """Runs children concurrently, fails as soon as any of them fails"""
+    return ParallelAll(instrument_children(child), timeout)
 
-    return _fn
+
+def parallel_any(*child: Action, timeout: Optional[float] = None) -> Action:
+    """Runs children concurrently, succeeds as soon as any of them succeeds"""
+    return ParallelAny(instrument_children(child), timeout)
+
+
+def race(*child: Action, timeout: Optional[float] = None) -> Action:
+    """Runs children concurrently, the first one to finish decides"""
+    return Race(instrument_children(child), timeout)
 
 
 def do_action(fn: Callable[[Context], None]) -> Action:
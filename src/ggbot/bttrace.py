@@ -0,0 +1,274 @@
+from typing import Optional, Dict, Tuple, Deque, Callable, Awaitable, Sequence
+from collections import deque, Counter
+from contextvars import ContextVar
+import os
+import asyncio
+import logging
+import time
+
+from ggbot.context import Context, BotContext
+from ggbot.component import BotComponent
+from ggbot.cache import write_file_atomic
+
+
+__all__ = [
+    "NodeStats",
+    "Tracer",
+    "enable_tracing",
+    "disable_tracing",
+    "get_tracer",
+    "instrument",
+    "instrument_children",
+    "is_instrumented",
+    "retrace",
+    "node_name",
+]
+
+_logger = logging.getLogger(__name__)
+
+Action = Callable[[Context], Awaitable[bool]]
+Path = Tuple[str, ...]
+
+
+class NodeStats:
+    """Call counters of a tree node and its latest latencies in a ring buffer"""
+
+    __slots__ = ("calls", "successes", "errors", "latencies")
+
+    def __init__(self, buffer_size: int = 256):
+        self.calls = 0
+        self.successes = 0
+        self.errors = 0  # raised or cancelled
+        self.latencies: Deque[float] = deque(maxlen=buffer_size)
+
+    def add(self, seconds: float, result: Optional[bool]):
+        self.calls += 1
+        if result is None:
+            self.errors += 1
+        elif result:
+            self.successes += 1
+        self.latencies.append(seconds)
+
+    @property
+    def success_ratio(self) -> float:
+        return self.successes / self.calls if self.calls else 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Frame:
+    __slots__ = ("path", "children_time")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.children_time = 0.0
+
+
+_current_frame: ContextVar[Optional[_Frame]] = ContextVar("bt_frame", default=None)
+
+
+class Tracer(BotComponent):
+    """Collects per node stats and flame graph traces of behavior trees.
+
+    Nodes are identified by their path from the root: names of the nodes
+    (combinator or action factory names, intent name for the root) joined
+    while the tree is running. Every conversation produces a trace in the
+    folded stacks format (``root;child;leaf <self time in us>`` per line)
+    accepted by flamegraph.pl, speedscope and alike.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 256,
+        max_traces: int = 32,
+        trace_dir: Optional[str] = None,
+        report_interval: Optional[float] = None,
+    ):
+        self.buffer_size = buffer_size
+        self.trace_dir = trace_dir
+        self.report_interval = report_interval
+        self.stats: Dict[Path, NodeStats] = {}
+        # conversation name -> folded stack -> self seconds
+        self._running: Dict[str, Dict[str, float]] = {}
+        self.traces: Deque[Tuple[str, Dict[str, float]]] = deque(maxlen=max_traces)
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self, context: BotContext):
+        if self.report_interval:
+            self._task = asyncio.create_task(self._run(), name="bt-trace-report")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            if self.stats:
+                _logger.info(f"Behavior tree stats:\n{self.format_stats()}")
+
+    async def run_node(self, name: str, action: Action, ctx: Context) -> bool:
+        parent = _current_frame.get()
+        frame = _Frame((*parent.path, name) if parent is not None else (name,))
+        token = _current_frame.set(frame)
+        result = None
+        started = time.perf_counter()
+        try:
+            result = await action(ctx)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_frame.reset(token)
+            if parent is not None:
+                parent.children_time += elapsed
+            ok = None if result is None else bool(result)
+            self._record(ctx.name, frame, elapsed, ok, parent is None)
+
+    def _record(
+        self,
+        conversation: str,
+        frame: _Frame,
+        elapsed: float,
+        result: Optional[bool],
+        is_root: bool,
+    ):
+        stats = self.stats.get(frame.path)
+        if stats is None:
+            stats = self.stats[frame.path] = NodeStats(self.buffer_size)
+        stats.add(elapsed, result)
+
+        trace = self._running.setdefault(conversation, {})
+        stack = ";".join(frame.path)
+        # Children of parallel nodes may take longer in total than the node
+        self_time = max(0.0, elapsed - frame.children_time)
+        trace[stack] = trace.get(stack, 0.0) + self_time
+
+        if is_root:
+            del self._running[conversation]
+            self.traces.append((conversation, trace))
+            if self.trace_dir is not None:
+                self._write_trace(conversation, trace)
+
+    @staticmethod
+    def folded(trace: Dict[str, float]) -> str:
+        return "".join(
+            f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in trace.items()
+        )
+
+    def get_trace(self, conversation: str) -> Optional[Dict[str, float]]:
+        for name, trace in reversed(self.traces):
+            if name == conversation:
+                return trace
+        return self._running.get(conversation)
+
+    def _write_trace(self, conversation: str, trace: Dict[str, float]):
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            write_file_atomic(
+                os.path.join(self.trace_dir, f"{conversation}.folded"),
+                self.folded(trace).encode("utf-8"),
+            )
+        except OSError as err:
+            _logger.warning(f"Failed to write trace of {conversation}: {err}")
+
+    def format_stats(self, limit: Optional[int] = None) -> str:
+        """Table of node stats, slowest p95 first"""
+        rows = sorted(self.stats.items(), key=lambda kv: -kv[1].percentile(0.95))
+        lines = [f"{'calls':>7} {'ok':>5} {'p50 ms':>9} {'p95 ms':>9}  node"]
+        for path, stats in rows[:limit]:
+            lines.append(
+                f"{stats.calls:>7} {stats.success_ratio:>5.0%} "
+                f"{stats.percentile(0.5) * 1000:>9.1f} "
+                f"{stats.percentile(0.95) * 1000:>9.1f}  {'/'.join(path)}"
+            )
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} nodes={len(self.stats)}>"
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing(tracer: Optional[Tracer] = None) -> Tracer:
+    """Trees built after this call are instrumented"""
+    global _tracer
+    _tracer = tracer or Tracer()
+    return _tracer
+
+
+def disable_tracing():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def node_name(action: Action) -> str:
+    name = getattr(action, "__bt_node__", None)
+    if name is not None:
+        return name
+    name = getattr(action, "bt_name", None)  # tree nodes
+    if name is not None:
+        return name
+    qualname = getattr(action, "__qualname__", None)
+    if qualname is None:
+        # Callable objects, e.g. action dataclasses
+        return type(action).__name__
+    # Closures are named after the factory that created them
+    return qualname.split(".<locals>", 1)[0]
+
+
+def instrument(action: Action, name: Optional[str] = None) -> Action:
+    """Wraps the action to be traced if tracing is enabled"""
+    tracer = _tracer
+    if tracer is None:
+        return action
+    if hasattr(action, "__bt_node__"):
+        if name is None:
+            return action
+        action = action.__wrapped__
+
+    return _wrap(tracer, name or node_name(action), action)
+
+
+def _wrap(tracer: Tracer, name: str, action: Action) -> Action:
+    async def _fn(ctx: Context):
+        return await tracer.run_node(name, action, ctx)
+
+    _fn.__bt_node__ = name
+    _fn.__bt_tracer__ = tracer
+    _fn.__wrapped__ = action
+    return _fn
+
+
+def is_instrumented(action: Action) -> bool:
+    return hasattr(action, "__bt_node__")
+
+
+def retrace(instrumented: Action, action: Action) -> Action:
+    """Action traced under the same name and by the same tracer as the
+    instrumented one, used to replace the wrapped action, e.g. by its
+    optimized version"""
+    if action is instrumented.__wrapped__:
+        return instrumented
+    return _wrap(instrumented.__bt_tracer__, instrumented.__bt_node__, action)
+
+
+def instrument_children(children: Sequence[Action]) -> Sequence[Action]:
+    if _tracer is None:
+        return children
+    # Siblings with the same name are told apart by their index
+    names = [node_name(c) for c in children]
+    counts = Counter(names)
+    return tuple(
+        instrument(c, f"{n}[{i}]" if counts[n] > 1 else n)
+        for i, (c, n) in enumerate(zip(children, names))
+    )
@@ -1,6 +1,7 @@
-from typing import Union, Any, Type, Literal
+from typing import Union, Any, Type, Literal, Dict, Tuple, Hashable
 from abc import ABCMeta, abstractmethod
 from decimal import Decimal
+from functools import lru_cache
 from inspect import signature, isclass
 
 __all__ = [
@@ -20,15 +21,47 @@ __all__ = [
 InternalNumber = Union[int, float, Decimal]
 
 
-class IType(metaclass=ABCMeta):
+class _InternedType(ABCMeta):
+    """Types constructed from the same arguments are the same object. As the
+    arguments are types themselves, structurally equal types are identical"""
+
+    def __call__(cls, *args, **kwargs):
+        key = (cls, cls._intern_key(*args, **kwargs))
+        instance = _interned.get(key)
+        if instance is None:
+            instance = _interned.setdefault(key, super().__call__(*args, **kwargs))
+        return instance
+
+
+_interned: Dict[Tuple[type, Hashable], "IType"] = {}
+# (type, other) -> type.can_accept(other)
+_accept_memo: Dict[Tuple["IType", "IType"], bool] = {}
+
+
+class IType(metaclass=_InternedType):
     @abstractmethod
     def get_name(self) -> str:
         ...
 
-    @abstractmethod
     def can_accept(self, other: "IType") -> bool:
+        if other is self:
+            return True
+        key = (self, other)
+        result = _accept_memo.get(key)
+        if result is None:
+            result = _accept_memo[key] = self._accepts(other)
+        return result
+
+    @abstractmethod
+    def _accepts(self, other: "IType") -> bool:
         ...
 
+    @classmethod
+    def _intern_key(cls, *args, **kwargs) -> Hashable:
+        if kwargs:
+            return args, tuple(sorted(kwargs.items()))
+        return args
+
     def __str__(self) -> str:
         return self.get_name()
 
@@ -37,7 +70,7 @@ class _NumberType(IType):
     def get_name(self) -> str:
         return "Number"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         return isinstance(other, _NumberType)
 
 
@@ -45,7 +78,7 @@ class _StringType(IType):
     def get_name(self) -> str:
         return "String"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         return isinstance(other, _StringType)
 
 
@@ -53,7 +86,7 @@ class _BooleanType(IType):
     def get_name(self) -> str:
         return "Bool"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         return isinstance(other, _BooleanType)
 
 
@@ -61,7 +94,7 @@ class _NullType(IType):
     def get_name(self) -> str:
         return "Null"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         return isinstance(other, _NullType)
 
 
@@ -69,7 +102,7 @@ class _AnyType(IType):
     def get_name(self) -> str:
         return "*"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         return True
 
 
@@ -77,13 +110,17 @@ class _OneOfType(IType):
     __slots__ = "_types"
 
     def __init__(self, *types: IType):
-        self._types = set(types)
+        self._types = frozenset(types)
+
+    @classmethod
+    def _intern_key(cls, *types: IType) -> Hashable:
+        return frozenset(types)
 
     def get_name(self) -> str:
         fmt = ", ".join(t.get_name() for t in self._types)
         return f"OneOf<{fmt}>"
 
-    def can_accept(self, other: IType) -> bool:
+    def _accepts(self, other: IType) -> bool:
         if isinstance(other, _OneOfType):
             return self._types == other._types
         for t in self._types:
@@ -109,7 +146,7 @@ class _ArrayType(IType):
     def get_name(self) -> str:
         return f"Array<{self._item_type.get_name()}>"
 
-    def can_accept(self, other: "IType") -> bool:
+    def _accepts(self, other: "IType") -> bool:
         if isinstance(other, _ArrayType):
             return self._item_type.can_accept(other._item_type)
         return False
@@ -131,7 +168,7 @@ class _MapType(IType):
     def get_value_type(self) -> IType:
         return self._v_type
 
-    def can_accept(self, other: "IType") -> bool:
+    def _accepts(self, other: "IType") -> bool:
         if isinstance(other, _MapType):
             return self._k_type.can_accept(other._k_type) and self._v_type.can_accept(
                 other._v_type
@@ -152,7 +189,7 @@ class _StructType(IType):
     def get_attr_type(self, attr: str) -> IType:
         return self._attributes[attr]
 
-    def can_accept(self, other: "IType") -> bool:
+    def _accepts(self, other: "IType") -> bool:
         if isinstance(other, _StructType):
             return self._name == other._name and self._attributes == other._attributes
         return False
@@ -204,6 +241,7 @@ def _resolve_type_from_py_annotation(annotation: Any) -> IType:
     raise TypeError(f"Cannot convert annotation {annotation} to type")
 
 
+@lru_cache(maxsize=None)
 def make_struct_from_python_type(tp: Type) -> STRUCT:
     attrs = {}
     for param_name, param in signature(tp).parameters.items():
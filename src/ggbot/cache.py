@@ -0,0 +1,428 @@
+from typing import Optional, Dict, Any, Mapping, Iterator, BinaryIO, List
+from dataclasses import dataclass
+from collections import OrderedDict
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import re
+import hashlib
+import logging
+import argparse
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__all__ = [
+    "CacheEntry",
+    "CacheStore",
+    "write_file_atomic",
+    "get_default_cache_store",
+    "configure_default_cache_store",
+]
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+_META_SUFFIX = ".meta"
+_CODEC_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+# The directory is shared with other caches (grammar bundles and alike), only
+# these files belong to the store
+_SHARD_RE = re.compile(r"[0-9a-f]{2}")
+_ENTRY_FILE_RE = re.compile(r"[0-9a-f]{64}(\.meta|\.zst|\.gz)(\..*\.tmp)?")
+
+
+def write_file_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(data)
+    os.replace(tmp_path, path)
+
+
+def _default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    key: str
+    digest: str
+    path: str
+    codec: str
+    size: int  # compressed size on disk including metadata
+    modified_at: float
+    accessed_at: float
+    validators: Mapping[str, str]
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.modified_at
+
+
+class CacheStore:
+    """Compressed on-disk cache of binary blobs with LRU eviction.
+
+    Entries are stored under the full sha256 digest of their key as
+    ``<dir>/<digest[:2]>/<digest>.<ext>`` with a small json sidecar keeping the
+    original key, codec and response validators. File mtime is the time the
+    entry was last written (or confirmed fresh), atime is the last read.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        codec: Optional[str] = None,
+    ):
+        codec = codec or _default_codec()
+        if codec not in _CODEC_EXTENSIONS:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            _logger.warning("zstandard is not installed, falling back to gzip")
+            codec = "gzip"
+
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self._lock = threading.RLock()
+        # digest -> bytes on disk, least recently used first
+        self._sizes: Optional["OrderedDict[str, int]"] = None
+        self._total_size = 0
+
+    @staticmethod
+    def digest(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _base_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read_meta(self, digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._base_path(digest) + _META_SUFFIX, "rb") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _data_path(self, digest: str, codec: str) -> str:
+        return self._base_path(digest) + _CODEC_EXTENSIONS[codec]
+
+    def _entry_size(self, digest: str) -> int:
+        size = 0
+        base = self._base_path(digest)
+        for suffix in (_META_SUFFIX, *_CODEC_EXTENSIONS.values()):
+            try:
+                size += os.path.getsize(base + suffix)
+            except OSError:
+                pass
+        return size
+
+    def _accessed_at(self, digest: str) -> float:
+        base = self._base_path(digest)
+        for extension in _CODEC_EXTENSIONS.values():
+            try:
+                return os.stat(base + extension).st_atime
+            except OSError:
+                pass
+        return 0.0
+
+    def _ensure_index(self) -> "OrderedDict[str, int]":
+        if self._sizes is None:
+            found = []
+            for digest in self._iter_digests():
+                found.append(
+                    (self._accessed_at(digest), digest, self._entry_size(digest))
+                )
+            found.sort()
+            self._sizes = OrderedDict((digest, size) for _, digest, size in found)
+            self._total_size = sum(self._sizes.values())
+        return self._sizes
+
+    def _iter_shards(self) -> Iterator[str]:
+        if not os.path.isdir(self.directory):
+            return
+        for shard in sorted(os.listdir(self.directory)):
+            shard_path = os.path.join(self.directory, shard)
+            if _SHARD_RE.fullmatch(shard) and os.path.isdir(shard_path):
+                yield shard_path
+
+    def _iter_digests(self) -> Iterator[str]:
+        for shard_path in self._iter_shards():
+            for filename in sorted(os.listdir(shard_path)):
+                if filename.endswith(_META_SUFFIX):
+                    yield filename[: -len(_META_SUFFIX)]
+
+    def _update_size(self, digest: str):
+        """Re-reads the size of a written or removed entry, written entries
+        become the most recently used ones"""
+        sizes = self._ensure_index()
+        self._total_size -= sizes.pop(digest, 0)
+        size = self._entry_size(digest)
+        if size:
+            sizes[digest] = size
+            self._total_size += size
+
+    @property
+    def total_size(self) -> int:
+        with self._lock:
+            self._ensure_index()
+            return self._total_size
+
+    def _entry_from_digest(self, digest: str) -> Optional[CacheEntry]:
+        meta = self._read_meta(digest)
+        if meta is None:
+            return None
+        path = self._data_path(digest, meta.get("codec", "gzip"))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return CacheEntry(
+            key=meta.get("key", ""),
+            digest=digest,
+            path=path,
+            codec=meta.get("codec", "gzip"),
+            size=self._entry_size(digest),
+            modified_at=stat.st_mtime,
+            accessed_at=stat.st_atime,
+            validators=meta.get("validators", {}),
+        )
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        return self._entry_from_digest(self.digest(key))
+
+    def iter_entries(self) -> Iterator[CacheEntry]:
+        for digest in list(self._iter_digests()):
+            entry = self._entry_from_digest(digest)
+            if entry is not None:
+                yield entry
+
+    def open(self, entry: CacheEntry) -> BinaryIO:
+        """Opens a streaming decompressing reader of the entry"""
+        self._mark_accessed(entry)
+        if entry.codec == "zstd":
+            fp = open(entry.path, "rb")
+            return zstandard.ZstdDecompressor().stream_reader(fp, closefd=True)
+        return gzip.open(entry.path, "rb")
+
+    def read_bytes(self, entry: CacheEntry) -> bytes:
+        with self.open(entry) as stream:
+            return stream.read()
+
+    def load_json(self, entry: CacheEntry, encoding: str = "utf-8") -> Any:
+        with self.open(entry) as stream:
+            return json.load(io.TextIOWrapper(stream, encoding=encoding))
+
+    def _mark_accessed(self, entry: CacheEntry):
+        try:
+            # Keeps mtime since it is the time the entry was written
+            os.utime(entry.path, (time.time(), os.path.getmtime(entry.path)))
+        except OSError:
+            return
+        with self._lock:
+            if self._sizes is not None and entry.digest in self._sizes:
+                self._sizes.move_to_end(entry.digest)
+
+    def put(
+        self,
+        key: str,
+        data: bytes,
+        validators: Optional[Mapping[str, str]] = None,
+    ):
+        digest = self.digest(key)
+        base = self._base_path(digest)
+        meta = {"key": key, "codec": self.codec, "validators": dict(validators or {})}
+
+        with self._lock:
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            for codec, extension in _CODEC_EXTENSIONS.items():
+                if codec != self.codec and os.path.exists(base + extension):
+                    os.remove(base + extension)
+            write_file_atomic(
+                self._data_path(digest, self.codec), _compress(data, self.codec)
+            )
+            write_file_atomic(base + _META_SUFFIX, json.dumps(meta).encode("utf-8"))
+            self._update_size(digest)
+            self._evict_if_needed(keep=digest)
+
+    def touch(self, entry: CacheEntry):
+        """Marks entry as freshly written without rewriting it"""
+        os.utime(entry.path, None)
+
+    def _remove_files(self, digest: str):
+        base = self._base_path(digest)
+        for suffix in (*_CODEC_EXTENSIONS.values(), _META_SUFFIX):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+
+    def delete(self, key: str):
+        digest = self.digest(key)
+        with self._lock:
+            self._remove_files(digest)
+            self._update_size(digest)
+
+    def _evict_if_needed(self, keep: Optional[str] = None):
+        if self._total_size > self.max_bytes:
+            self._evict(self.max_bytes, keep=keep)
+
+    def _evict(self, max_bytes: int, keep: Optional[str] = None) -> List[CacheEntry]:
+        """Removes least recently used entries of the in-memory index until
+        the store fits max_bytes, only the evicted entries are touched on disk"""
+        with self._lock:
+            sizes = self._ensure_index()
+            victims = []
+            excess = self._total_size - max_bytes
+            for digest, size in sizes.items():
+                if excess <= 0:
+                    break
+                if digest != keep:
+                    victims.append(digest)
+                    excess -= size
+
+            removed = []
+            for digest in victims:
+                entry = self._entry_from_digest(digest)
+                self._remove_files(digest)
+                self._update_size(digest)
+                if entry is not None:
+                    removed.append(entry)
+
+        if removed:
+            _logger.debug(f"Evicted {len(removed)} entries from {self.directory}")
+        return removed
+
+    def prune(
+        self,
+        max_bytes: Optional[int] = None,
+        older_than: Optional[float] = None,
+        keep: Optional[str] = None,
+    ) -> List[CacheEntry]:
+        """Removes least recently used entries until the store fits max_bytes
+        and entries not written for older_than seconds"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if older_than is None:
+            return self._evict(max_bytes, keep=keep)
+        removed = []
+
+        with self._lock:
+            self._ensure_index()
+            entries = sorted(self.iter_entries(), key=lambda e: e.accessed_at)
+            for entry in entries:
+                if entry.digest == keep:
+                    continue
+                too_old = older_than is not None and entry.age > older_than
+                if not too_old and self._total_size <= max_bytes:
+                    continue
+                self._remove_files(entry.digest)
+                self._update_size(entry.digest)
+                removed.append(entry)
+
+        if removed:
+            _logger.debug(f"Evicted {len(removed)} entries from {self.directory}")
+        return removed
+
+    def clear(self):
+        """Removes all entries, other files in the directory are kept"""
+        with self._lock:
+            for shard_path in list(self._iter_shards()):
+                for filename in os.listdir(shard_path):
+                    if _ENTRY_FILE_RE.fullmatch(filename):
+                        try:
+                            os.remove(os.path.join(shard_path, filename))
+                        except FileNotFoundError:
+                            pass
+                try:
+                    os.rmdir(shard_path)
+                except OSError:
+                    # Not empty
+                    pass
+            self._sizes = None
+            self._total_size = 0
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.directory} codec={self.codec}>"
+
+
+_default_store: Optional[CacheStore] = None
+
+
+def configure_default_cache_store(
+    directory: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    codec: Optional[str] = None,
+) -> CacheStore:
+    global _default_store
+    _default_store = CacheStore(
+        directory=directory or os.getenv("CACHE_DIR") or ".cache",
+        max_bytes=max_bytes or int(os.getenv("CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES),
+        codec=codec or os.getenv("CACHE_CODEC") or None,
+    )
+    return _default_store
+
+
+def get_default_cache_store() -> CacheStore:
+    if _default_store is None:
+        return configure_default_cache_store()
+    return _default_store
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def main(*args: str):
+    parser = argparse.ArgumentParser(
+        prog="python -m ggbot.cache", description="Inspect and prune response cache"
+    )
+    parser.add_argument("--dir", default=os.getenv("CACHE_DIR") or ".cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="show number of entries and total size")
+    list_parser = commands.add_parser("list", help="list entries, most recent first")
+    list_parser.add_argument("--limit", type=int, default=50)
+    prune_parser = commands.add_parser("prune", help="evict entries")
+    prune_parser.add_argument("--max-bytes", type=int, default=None)
+    prune_parser.add_argument("--older-than", type=float, default=None)
+    commands.add_parser("clear", help="remove all entries")
+    ns = parser.parse_args(args)
+
+    store = CacheStore(ns.dir)
+    if ns.command == "stats":
+        entries = list(store.iter_entries())
+        print(f"Directory: {store.directory}")
+        print(f"Entries:   {len(entries)}")
+        print(f"Size:      {_format_size(store.total_size)}")
+    elif ns.command == "list":
+        entries = sorted(store.iter_entries(), key=lambda e: -e.accessed_at)
+        for entry in entries[: ns.limit]:
+            age_minutes = entry.age / 60
+            print(
+                f"{entry.digest[:12]}  {_format_size(entry.size):>10}  "
+                f"{age_minutes:8.1f} min  {entry.key}"
+            )
+    elif ns.command == "prune":
+        removed = store.prune(max_bytes=ns.max_bytes, older_than=ns.older_than)
+        print(f"Removed {len(removed)} entries, {_format_size(store.total_size)} left")
+    elif ns.command == "clear":
+        store.clear()
+        print("Cache cleared")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
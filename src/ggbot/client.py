@@ -1,8 +1,10 @@
+from typing import Optional
 import logging
 
 import discord
 
 from .conversation import *
+from .startup import StartupProfiler
 
 
 _logger = logging.getLogger(__name__)
@@ -11,11 +13,16 @@ __all__ = ["Client"]
 
 
 class Client(discord.Client):
-    def __init__(self, conversation_manager: ConversationManager):
+    def __init__(
+        self,
+        conversation_manager: ConversationManager,
+        startup: Optional[StartupProfiler] = None,
+    ):
         intents = discord.Intents.default()
         intents.message_content = True
         super().__init__(intents=intents)
         self.cm = conversation_manager
+        self.startup = startup
 
     def is_mentioned(self, message: discord.Message):
         for mention in message.mentions:
@@ -25,6 +32,11 @@ class Client(discord.Client):
 
     async def on_ready(self):
         _logger.info("Ready")
+        if self.startup is not None:
+            # on_ready fires again after reconnects
+            self.startup.mark("discord ready")
+            self.startup.log_report()
+            self.startup = None
 
     async def on_message(self, message: discord.Message):
         if message.author == self.user:
@@ -1,6 +1,21 @@
-from typing import Any, Dict, Union, List, TypeVar, Generic, Optional
-from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Dict,
+    Union,
+    List,
+    TypeVar,
+    Generic,
+    Optional,
+    FrozenSet,
+    Tuple,
+    Iterator,
+)
+from dataclasses import dataclass, field, fields
+from collections import ChainMap
+from contextlib import contextmanager
+from contextvars import ContextVar
 from abc import ABCMeta, abstractmethod
+import asyncio
 import logging
 import uuid
 import re
@@ -20,6 +35,7 @@ __all__ = [
     "Context",
     "MessageExpectation",
     "Variable",
+    "dependencies_of",
 ]
 
 _logger = logging.getLogger(__name__)
@@ -34,6 +50,11 @@ T = TypeVar("T")
 
 EMOJI_RE = re.compile(r":[^:\s]+:")
 
+# Event loop time by which the running (sub)tree has to finish. Kept in the
+# task context rather than in Context: concurrent subtrees of the same
+# conversation have their own deadlines and tasks inherit the current one
+_deadline: ContextVar[Optional[float]] = ContextVar("bt_deadline", default=None)
+
 
 class IExpression(Generic[T]):
     @abstractmethod
@@ -44,6 +65,34 @@ class IExpression(Generic[T]):
     def get_return_type(self) -> types.IType:
         ...
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        """Names of the variables a pure expression reads. Pure expressions
+        have no side effects and their value only changes with these
+        variables (and the intent match of the context), so it can be
+        reused. None for impure expressions"""
+        return None
+
+    def is_pure(self) -> bool:
+        return self.get_dependencies() is not None
+
+
+_NO_DEPENDENCIES: FrozenSet[str] = frozenset()
+
+
+def dependencies_of(*expressions: Optional[IExpression]) -> Optional[FrozenSet[str]]:
+    """Dependencies of a pure node computed from its subexpressions, None if
+    any of them is impure"""
+    result = _NO_DEPENDENCIES
+    for expression in expressions:
+        if expression is None:
+            continue
+        dependencies = expression.get_dependencies()
+        if dependencies is None:
+            return None
+        if dependencies:
+            result = result | dependencies
+    return result
+
 
 class IVariable(IExpression[T], metaclass=ABCMeta):
     @abstractmethod
@@ -121,6 +170,13 @@ class Context:
     name: str = field(default_factory=_generate_uuid)
     expecting_message_from: List[discord.Message] = field(default_factory=list)
     _expectations: List[MessageExpectation] = field(default_factory=list)
+    # Messages sent by the bot in this conversation
+    answers: List[discord.Message] = field(default_factory=list)
+    # Waited for messages of users, so the replies depend on them
+    interactive: bool = False
+    # Values of pure expressions, see evaluate
+    _memo: Dict[int, tuple] = field(default_factory=dict, repr=False)
+    _versions: Dict[str, int] = field(default_factory=dict, repr=False)
 
     def get_template_params(self):
         params = {
@@ -151,7 +207,12 @@ class Context:
 
         return rendered
 
+    def answered(self, message: discord.Message):
+        self.answers.append(message)
+        self.bot.last_answer = message
+
     def expect(self, expectation: MessageExpectation):
+        self.interactive = True
         if expectation.is_active():
             self._expectations.append(expectation)
 
@@ -163,13 +224,125 @@ class Context:
         self._expectations = active
         return active
 
+    @property
+    def deadline(self) -> Optional[float]:
+        """Deadline of the running (sub)tree, see ``timeout``"""
+        return _deadline.get()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, None if there is no deadline"""
+        deadline = _deadline.get()
+        if deadline is None:
+            return None
+        return deadline - asyncio.get_running_loop().time()
+
+    @contextmanager
+    def timeout(self, seconds: float) -> Iterator[float]:
+        """Shrinks the deadline to at most seconds from now for the code run
+        within, tasks created there inherit it. Nested timeouts never extend
+        the outer ones"""
+        deadline = asyncio.get_running_loop().time() + seconds
+        current = _deadline.get()
+        if current is not None and current <= deadline:
+            yield current
+            return
+        token = _deadline.set(deadline)
+        try:
+            yield deadline
+        finally:
+            _deadline.reset(token)
+
+    def clamp_timeout(self, seconds: float) -> float:
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return max(0.0, min(seconds, remaining))
+
+    def overlay(self) -> "Context":
+        """View of this context with its own layer of local variables on top
+        of the variables of this one. Assignments stay in the layer, see
+        ``local_changes`` and ``merge``, everything else (message, match,
+        expectations, answers...) is read from and written to this context"""
+        return _Overlay(self)
+
+    def merge(self, overlay: "Context"):
+        """Assigns the variables set in the layer of the overlay"""
+        for name, value in overlay.local_changes().items():
+            self.local[name] = value
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def local_changes(self) -> Dict[str, Any]:
+        if isinstance(self.local, ChainMap):
+            return self.local.maps[0]
+        return self.local
+
     def set_variable(self, variable: IVariable[T], value: T) -> None:
-        self.local[variable.get_name()] = value
+        name = variable.get_name()
+        self.local[name] = value
+        # Same (possibly mutated) object might be set again
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def _dependency_stamp(self, dependencies: Tuple[str, ...]) -> tuple:
+        local = self.local
+        versions = self._versions
+        return tuple((versions.get(n, 0), local.get(n)) for n in dependencies)
+
+    def evaluate_memoized(
+        self, expression: IExpression[T], dependencies: Tuple[str, ...]
+    ) -> T:
+        """Value of a pure expression, reused while its dependencies are the
+        same objects and were not set again and the match is the same.
+        Expectations replace the match with the one of the awaited message"""
+        entry = self._memo.get(id(expression))
+        if entry is not None and entry[0] is expression and entry[3] is self.match:
+            stamp = entry[1]
+            local = self.local
+            versions = self._versions
+            for name, (version, value) in zip(dependencies, stamp):
+                if versions.get(name, 0) != version or local.get(name) is not value:
+                    break
+            else:
+                return entry[2]
+        value = expression.evaluate(self)
+        self._memo[id(expression)] = (
+            expression,
+            self._dependency_stamp(dependencies),
+            value,
+            self.match,
+        )
+        return value
 
     def get_var_value(self, variable: IVariable[T]) -> T:
         return self.local.get(variable.get_name())  # type: ignore
 
 
+def _delegated(name: str) -> property:
+    def _get(self: "_Overlay"):
+        return getattr(self._parent, name)
+
+    def _set(self: "_Overlay", value):
+        setattr(self._parent, name, value)
+
+    return property(_get, _set)
+
+
+class _Overlay(Context):
+    """Context sharing all the state but local variables (and the values of
+    pure expressions computed from them) with the parent"""
+
+    def __init__(self, parent: Context):
+        self._parent = parent
+        self.local = ChainMap({}, parent.local)
+        self._memo = {}
+        self._versions = ChainMap({}, parent._versions)
+
+
+for _field in fields(Context):
+    if _field.name not in ("local", "_memo", "_versions"):
+        setattr(_Overlay, _field.name, _delegated(_field.name))
+del _field
+
+
 @dataclass(frozen=True)
 class Variable(IVariable[T]):
     name: str
@@ -181,5 +354,8 @@ class Variable(IVariable[T]):
     def get_return_type(self) -> types.IType:
         return self.type
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return frozenset((self.name,))
+
     def evaluate(self, context: Context) -> T:
         return context.get_var_value(self)
@@ -1,12 +1,19 @@
 from typing import Optional, Callable, Awaitable, List, Mapping
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import logging
-import asyncio
 
 import discord
 
 from ggbot.text import NluBase
 from ggbot.context import *
+from ggbot.supervisor import ConversationSupervisor, ConversationTask
+from ggbot.ratelimit import IntentRateLimiter
+from ggbot.replies import (
+    ReplyCache,
+    record_replies,
+    reply_cache_key,
+    send_recorded_replies,
+)
 
 
 __all__ = ["ConversationManager", "IntentHandler", "ScenarioHandler"]
@@ -22,25 +29,31 @@ class IntentHandler:
 @dataclass
 class ScenarioHandler(IntentHandler):
     action: Callable[[Context], Awaitable[bool]]
+    # Replies of successful runs that did not wait for user messages are sent
+    # again to the same author asking with the same slots for reply_ttl
+    # seconds without running the action
+    reply_ttl: Optional[float] = None
+    reply_cache: Optional[ReplyCache] = field(default=None, repr=False)
 
-    async def run(self, context: Context) -> bool:
-        return await self.action(context)
-
-
-@dataclass
-class ConversationTask:
-    task: asyncio.Task
-    context: Context
+    def __post_init__(self):
+        if self.reply_ttl and self.reply_cache is None:
+            self.reply_cache = ReplyCache(self.reply_ttl)
 
-    def is_active(self) -> bool:
-        return not self.task.done()
+    async def run(self, context: Context) -> bool:
+        if self.reply_cache is None:
+            return await self.action(context)
 
+        key = reply_cache_key(context)
+        replies = self.reply_cache.get(key)
+        if replies is not None:
+            _logger.debug(f"Sending cached replies in {context.name}")
+            await send_recorded_replies(context, replies)
+            return True
 
-async def try_run(coroutine):
-    try:
-        return await coroutine
-    except Exception as err:
-        logging.exception(err)
+        result = await self.action(context)
+        if result and not context.interactive:
+            self.reply_cache.put(key, record_replies(context))
+        return result
 
 
 class ConversationManager:
@@ -49,6 +62,9 @@ class ConversationManager:
         nlu: NluBase,
         intent_handlers: Mapping[str, IntentHandler],
         context: BotContext,
+        supervisor: Optional[ConversationSupervisor] = None,
+        rate_limiter: Optional[IntentRateLimiter] = None,
+        throttled_reaction: Optional[str] = "⏳",
     ):
         self.nlu = nlu
         self.intent_handlers = intent_handlers
@@ -56,16 +72,23 @@ class ConversationManager:
             k for k in intent_handlers if k.startswith("intent")
         ]
         self.bot_context = context
-        self.conversations = []  # type: List[ConversationTask]
+        self.supervisor = supervisor or ConversationSupervisor()
+        self.rate_limiter = rate_limiter
+        self.throttled_reaction = throttled_reaction
+
+    @property
+    def conversations(self) -> List[ConversationTask]:
+        return self.supervisor.active()
 
     async def handle_mentioned_message(self, message: discord.Message):
-        # Filter out inactive conversations
-        self.conversations = [conv for conv in self.conversations if conv.is_active()]
+        # Nlu might be still loading right after the start
+        await self.nlu.wait_ready()
 
         # Try to continue active conversations if possible
-        if self.conversations:
+        conversations = self.conversations
+        if conversations:
             expectations = []  # type: List[tuple[MessageExpectation, float, Context]]
-            for conversation in self.conversations:
+            for conversation in conversations:
                 for e in conversation.context.get_active_message_expectations():
                     expectations.append((e, e.get_priority(), conversation.context))
 
@@ -96,9 +119,45 @@ class ConversationManager:
                 match=match,
             )
 
-            task = asyncio.create_task(try_run(handler.run(context)), name=context.name)
-            dialog = ConversationTask(task=task, context=context)
-            self.conversations.append(dialog)
+            runner = handler.run
+            limiter = self.rate_limiter
+            if limiter is not None and limiter.is_limited(intent):
+                reply_key = limiter.reply_key(
+                    intent, message.author.id, match.get_all_slots() if match else None
+                )
+                if not limiter.allows(intent, message.author.id, message.channel.id):
+                    await self.answer_throttled(context, reply_key)
+                    return
+                runner = self._remembering_replies(handler, reply_key)
+
+            # Starts right away or waits for a free slot, bursts beyond the
+            # limits are dropped. Only admitted conversations count against
+            # the rate limits
+            if self.supervisor.submit(runner, context) and limiter is not None:
+                limiter.add(intent, message.author.id, message.channel.id)
+
+    def _remembering_replies(self, handler: IntentHandler, reply_key):
+        async def _run(context: Context) -> bool:
+            result = await handler.run(context)
+            # Replies of failed or interactive conversations are not worth
+            # repeating to a throttled request
+            if result and not context.interactive:
+                self.rate_limiter.remember_replies(reply_key, record_replies(context))
+            return result
+
+        return _run
+
+    async def answer_throttled(self, context: Context, reply_key):
+        """Repeats the latest replies to the same request if there are any,
+        otherwise only reacts to the message"""
+        replies = self.rate_limiter.cached_replies(reply_key)
+        try:
+            if replies:
+                await send_recorded_replies(context, replies)
+            elif self.throttled_reaction:
+                await context.message.add_reaction(self.throttled_reaction)
+        except discord.HTTPException as err:
+            _logger.warning(f"Failed to answer throttled message: {err}")
 
     async def handle_added_reaction(
         self, reaction: discord.Reaction, user: discord.User
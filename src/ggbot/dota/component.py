@@ -1,17 +1,32 @@
-from typing import Iterable, Optional, List, Dict
+from typing import Iterable, Optional, List, Dict, Tuple, FrozenSet
 import re
 import logging
 import time
 import aiohttp
 
+import attr
 from attr import dataclass
 
-from ggbot.context import BotContext, Context, IVariable, IExpression
+from ggbot.context import (
+    BotContext,
+    Context,
+    IVariable,
+    IExpression,
+    dependencies_of,
+)
 from ggbot.component import BotComponent
-from ggbot.assets import cached, JsonAsset, IndexedCollection, UrlSource
-from ggbot.utils import local_time_cache
-from ggbot.opendota import OpenDotaApi, DotaMatch, Player, PlayerRanking, HeroMatchup
+from ggbot.assets import cached, JsonAsset, UrlSource
+from ggbot.utils import CachePolicy
+from ggbot.opendota import (
+    OpenDotaApi,
+    DotaMatch,
+    Player,
+    PlayerRanking,
+    HeroMatchup,
+    DEFAULT_CACHE_POLICIES,
+)
 from ggbot.dota.phrases import PhraseGenerator
+from ggbot.dota.heroes import HeroesCollection
 from ggbot.dota.medals import *
 from ggbot.dota.predicates import find_player_by_steam_id, Just
 from ggbot.bttypes import *
@@ -25,11 +40,14 @@ __all__ = [
     "DOTA_PLAYER_MEDAL",
     "OPENDOTA_API_URL",
     "Dota",
+    "PrefetchedMatch",
+    "calculate_player_medals",
     "RequestOpenDotaAction",
     "RequestPlayerRankings",
     "RequestTopHeroMatchups",
     "CountMatchupsAction",
     "GeneratePhraseForPlayer",
+    "GeneratePhrasesForMatch",
     "parse_steam_id_from_message",
     "RequestMatch",
     "FetchLastMatchId",
@@ -74,40 +92,75 @@ def player_slot_is_dire(slot: int) -> bool:
 
 
 @dataclass
-class HeroesCollection(IndexedCollection[dict]):
-    asset: JsonAsset
-
-    @property
-    @local_time_cache(5 * 60)
-    def data(self):
-        data = self.asset.get_data()
-        return {h["id"]: h for h in data}
+class PrefetchedMatch:
+    """Match data of a known user computed ahead of the request"""
 
-    def iter_items(self) -> Iterable[dict]:
-        yield from self.data.values()
+    match_id: int
+    account_id: int
+    match: DotaMatch
+    is_parsed: bool
+    medals: List[PlayerMedal]
+    # Phrases per display name of the user, names differ from guild to guild
+    phrases: Dict[str, str] = attr.Factory(dict)
 
-    def get_item_by_index(self, index) -> Optional[dict]:
-        return self.data.get(index)
 
-    def __len__(self):
-        return len(self.data)
+def calculate_player_medals(match: DotaMatch, player: Player) -> List[PlayerMedal]:
+    medals = []
+    for medal in PLAYER_MEDALS:
+        if medal.predicate.check(match, player):
+            medals.append(medal)
+    return medals
 
 
 class Dota(BotComponent):
-    def __init__(self, opendota_api_key: str, phrase_generator: PhraseGenerator):
+    def __init__(
+        self,
+        opendota_api_key: str,
+        phrase_generator: PhraseGenerator,
+        max_prefetched_matches: int = 256,
+        constants_cache_policy: CachePolicy = DEFAULT_CACHE_POLICIES["constants"],
+    ):
         self.api_key = opendota_api_key
         self.heroes = HeroesCollection(
-            JsonAsset(cached(UrlSource(f"{OPENDOTA_API_URL}heroes")))
+            JsonAsset(
+                cached(
+                    UrlSource(f"{OPENDOTA_API_URL}heroes"),
+                    lifetime_seconds=constants_cache_policy.lifetime,
+                    max_stale_seconds=constants_cache_policy.max_stale,
+                )
+            )
         )
         self.phrase_generator = phrase_generator
+        self.max_prefetched_matches = max_prefetched_matches
+        self._prefetched: Dict[Tuple[int, int], PrefetchedMatch] = {}
+
+    def store_prefetched(self, prefetched: PrefetchedMatch):
+        key = (prefetched.match_id, prefetched.account_id)
+        self._prefetched.pop(key, None)
+        self._prefetched[key] = prefetched
+
+        # Dicts preserve insertion order, so the first key is the oldest one
+        while len(self._prefetched) > self.max_prefetched_matches:
+            del self._prefetched[next(iter(self._prefetched))]
 
-    def hero_id_to_name(self, id: int):
-        return self.heroes.get_item_by_index(id)["name"]
+    def get_prefetched(
+        self, match_id: int, account_id: Optional[int]
+    ) -> Optional[PrefetchedMatch]:
+        if account_id is None:
+            return None
+        return self._prefetched.get((match_id, account_id))
 
-    def hero_id_to_localized_name(self, id: int):
-        return self.heroes.get_item_by_index(id)["localized_name"]
+    def hero_id_to_name(self, id: int) -> str:
+        return self.heroes.table.name(id)
+
+    def hero_id_to_localized_name(self, id: int) -> str:
+        return self.heroes.table.localized_name(id)
+
+    def hero_id_to_icon_url(self, id: int) -> str:
+        return self.heroes.table.icon_url(id)
 
     async def init(self, context: BotContext):
+        self.heroes.start_background_refresh()
         context.template_env.filters["dota_hero_id_to_name"] = self.hero_id_to_name
         context.template_env.filters[
             "dota_hero_id_to_localized_name"
@@ -177,18 +230,60 @@ class GeneratePhraseForPlayer:
     async def __call__(self, context: Context) -> bool:
         player = self.match_player.evaluate(context)
         match = self.match.evaluate(context)
-        hero_name = self.dota.hero_id_to_localized_name(player.hero_id)
+        player_name = context.author.member.display_name
+
+        prefetched = self.dota.get_prefetched(match.match_id, player.account_id)
+        if (
+            prefetched is not None
+            and prefetched.is_parsed
+            and player_name in prefetched.phrases
+        ):
+            context.set_variable(self.result, prefetched.phrases[player_name])
+            return True
 
+        hero_name = self.dota.hero_id_to_localized_name(player.hero_id)
         phrase = self.phrase_generator.generate_phrase(
             match_id=match.match_id,
             player=player,
-            player_name=context.author.member.display_name,
+            player_name=player_name,
             hero_name=hero_name,
         )
         context.set_variable(self.result, phrase)
         return True
 
 
+@dataclass
+class GeneratePhrasesForMatch:
+    """Phrases for every player of the match, one line per player"""
+
+    phrase_generator: PhraseGenerator
+    match: IExpression[DotaMatch]
+    result: IVariable
+    dota: Dota
+
+    def __attrs_post_init__(self):
+        assert DOTA_MATCH.can_accept(self.match.get_return_type())
+        assert self.result.get_return_type().can_accept(STRING)
+
+    async def __call__(self, context: Context) -> bool:
+        match = self.match.evaluate(context)
+        players = match.players
+        player_names = [p.personaname or "Аноним" for p in players]
+        hero_names = [self.dota.hero_id_to_localized_name(p.hero_id) for p in players]
+        phrases = self.phrase_generator.generate_phrases(
+            match_id=match.match_id,
+            players=players,
+            player_names=player_names,
+            hero_names=hero_names,
+        )
+
+        lines = []
+        for name, hero_name, phrase in zip(player_names, hero_names, phrases):
+            lines.append(f"**{name}** ({hero_name}): {phrase or '...'}")
+        context.set_variable(self.result, "\n".join(lines))
+        return True
+
+
 STEAM_ID_REGEXES = (
     re.compile(r"dotabuff.com/players/(\d+)"),
     re.compile(r"opendota.com/players/(\d+)"),
@@ -392,6 +487,7 @@ class CalculateMedals:
     match: IExpression[DotaMatch]
     steam_id: IExpression[int]
     result: IVariable[List[PlayerMedal]]
+    dota: Optional[Dota] = None
 
     def __attrs_post_init__(self):
         assert NUMBER.can_accept(self.steam_id.get_return_type())
@@ -401,18 +497,20 @@ class CalculateMedals:
     async def __call__(self, context: Context) -> bool:
         steam_id = self.steam_id.evaluate(context)
         match = self.match.evaluate(context)
+
+        if self.dota is not None:
+            prefetched = self.dota.get_prefetched(match.match_id, steam_id)
+            if prefetched is not None and prefetched.is_parsed:
+                context.set_variable(self.result, prefetched.medals)
+                return True
+
         player = find_player_by_steam_id(match, steam_id)
 
         if not player:
             # No player in that match
             return False
 
-        medals = []
-        for medal in PLAYER_MEDALS:
-            if medal.predicate.check(match, player):
-                medals.append(medal)
-
-        context.set_variable(self.result, medals)
+        context.set_variable(self.result, calculate_player_medals(match, player))
         return True
 
 
@@ -460,6 +558,9 @@ class FormattedMedals(IExpression[str]):
             result += f"{medal.icon} **{medal.name}** *{medal.description}*\n"
         return result
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.medals_ids)
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -478,6 +579,9 @@ class MedalFromId(IExpression[PlayerMedal]):
             return medal
         return PlayerMedal(id="non-existent", name="non-existent", predicate=Just(True))
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.medal_id)
+
     def get_return_type(self) -> IType:
         return DOTA_PLAYER_MEDAL
 
@@ -494,6 +598,9 @@ class HeroName(IExpression[str]):
         hero_id = self.hero_id.evaluate(context)
         return self.dota.hero_id_to_localized_name(hero_id)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.hero_id)
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -513,6 +620,9 @@ class MatchPlayer(IExpression[Optional[Player]]):
         player = find_player_by_steam_id(match, steam_id)
         return player
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.match, self.steam_id)
+
     def get_return_type(self) -> IType:
         return ONEOF(NULL_TYPE, DOTA_MATCH_PLAYER)
 
@@ -528,6 +638,9 @@ class PlayerHeroId(IExpression[int]):
         player = self.player.evaluate(context)
         return player.hero_id
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.player)
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -543,6 +656,9 @@ class MatchDurationMinutes(IExpression[int]):
         match = self.match.evaluate(context)
         return round(match.duration / 60)
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.match)
+
     def get_return_type(self) -> IType:
         return NUMBER
 
@@ -560,6 +676,9 @@ class MatchPlayerResultString(IExpression[str]):
             return "Победа"
         return "Поражение"
 
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.player)
+
     def get_return_type(self) -> IType:
         return STRING
 
@@ -574,8 +693,10 @@ class PlayerHeroIconUrl(IExpression[str]):
 
     def evaluate(self, context: Context) -> str:
         player = self.player.evaluate(context)
-        hero_name = self.dota.hero_id_to_name(player.hero_id)[14:]
-        return f"https://cdn.origin.steamstatic.com/apps/dota2/images/heroes/{hero_name}_icon.png"
+        return self.dota.hero_id_to_icon_url(player.hero_id)
+
+    def get_dependencies(self) -> Optional[FrozenSet[str]]:
+        return dependencies_of(self.player)
 
     def get_return_type(self) -> IType:
         return STRING
@@ -0,0 +1,159 @@
+from typing import Iterable, Optional, Tuple, Mapping, Dict, Any
+from types import MappingProxyType
+import asyncio
+import logging
+
+from attr import dataclass
+
+from ggbot.assets import IndexedCollection, JsonAsset
+
+
+__all__ = ["HeroTable", "HeroesCollection", "hero_icon_url"]
+
+_logger = logging.getLogger(__name__)
+
+HERO_NAME_PREFIX = "npc_dota_hero_"
+HERO_ICON_URL = (
+    "https://cdn.origin.steamstatic.com/apps/dota2/images/heroes/{}_icon.png"
+)
+
+
+def hero_icon_url(name: str) -> str:
+    if name.startswith(HERO_NAME_PREFIX):
+        name = name[len(HERO_NAME_PREFIX) :]
+    return HERO_ICON_URL.format(name)
+
+
+@dataclass(frozen=True, slots=True)
+class HeroTable:
+    """Immutable preindexed view of the heroes constants.
+
+    Per-hero tuples are indexed directly by hero id (ids are small and dense),
+    missing ids hold None.
+    """
+
+    heroes: Tuple[Optional[Dict[str, Any]], ...]
+    names: Tuple[Optional[str], ...]
+    localized_names: Tuple[Optional[str], ...]
+    icon_urls: Tuple[Optional[str], ...]
+    name_to_id: Mapping[str, int]
+    localized_name_to_id: Mapping[str, int]
+
+    @staticmethod
+    def from_data(data: Iterable[Dict[str, Any]]) -> "HeroTable":
+        data = list(data)
+        size = max((h["id"] for h in data), default=-1) + 1
+        heroes = [None] * size
+        names = [None] * size
+        localized_names = [None] * size
+        icon_urls = [None] * size
+        name_to_id = {}
+        localized_name_to_id = {}
+
+        for hero in data:
+            hero_id = hero["id"]
+            heroes[hero_id] = hero
+            names[hero_id] = hero["name"]
+            localized_names[hero_id] = hero["localized_name"]
+            icon_urls[hero_id] = hero_icon_url(hero["name"])
+            name_to_id[hero["name"]] = hero_id
+            localized_name_to_id[hero["localized_name"].lower()] = hero_id
+
+        return HeroTable(
+            heroes=tuple(heroes),
+            names=tuple(names),
+            localized_names=tuple(localized_names),
+            icon_urls=tuple(icon_urls),
+            name_to_id=MappingProxyType(name_to_id),
+            localized_name_to_id=MappingProxyType(localized_name_to_id),
+        )
+
+    def _lookup(self, column: Tuple[Optional[str], ...], hero_id: int) -> str:
+        if 0 <= hero_id < len(column):
+            value = column[hero_id]
+            if value is not None:
+                return value
+        raise KeyError(f"Unknown hero id: {hero_id}")
+
+    def get(self, hero_id: int) -> Optional[Dict[str, Any]]:
+        if 0 <= hero_id < len(self.heroes):
+            return self.heroes[hero_id]
+        return None
+
+    def name(self, hero_id: int) -> str:
+        return self._lookup(self.names, hero_id)
+
+    def localized_name(self, hero_id: int) -> str:
+        return self._lookup(self.localized_names, hero_id)
+
+    def icon_url(self, hero_id: int) -> str:
+        return self._lookup(self.icon_urls, hero_id)
+
+    def id_from_name(self, name: str) -> Optional[int]:
+        return self.name_to_id.get(name)
+
+    def id_from_localized_name(self, localized_name: str) -> Optional[int]:
+        return self.localized_name_to_id.get(localized_name.lower())
+
+    def __len__(self):
+        return len(self.name_to_id)
+
+
+class HeroesCollection(IndexedCollection[dict]):
+    """Heroes constants backed by a HeroTable.
+
+    The table is rebuilt off the request path by ``refresh`` and swapped in
+    with a single assignment, readers always see a consistent table.
+    Only the very first access loads it synchronously if no refresh happened.
+    """
+
+    def __init__(self, asset: JsonAsset, refresh_interval: float = 5 * 60):
+        self.asset = asset
+        self.refresh_interval = refresh_interval
+        self._table: Optional[HeroTable] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def table(self) -> HeroTable:
+        table = self._table
+        if table is None:
+            table = self.refresh()
+        return table
+
+    def refresh(self) -> HeroTable:
+        table = HeroTable.from_data(self.asset.get_data())
+        self._table = table
+        return table
+
+    async def refresh_async(self) -> HeroTable:
+        # Reading and parsing the asset may hit the disk or network
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    def start_background_refresh(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="heroes-refresh")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_async()
+            except Exception as err:
+                _logger.warning(f"Failed to refresh heroes: {err}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def iter_items(self) -> Iterable[dict]:
+        yield from (h for h in self.table.heroes if h is not None)
+
+    def get_item_by_index(self, index) -> Optional[dict]:
+        return self.table.get(index)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.asset!r}>"
@@ -0,0 +1,222 @@
+from typing import Optional, List, Dict, Any, Callable, Iterable, Sequence
+import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+
+from ggbot.assets import IndexedCollection
+from ggbot.cache import write_file_atomic
+from ggbot.component import BotComponent
+from ggbot.context import BotContext
+from ggbot.fuzzy import Variable
+from ggbot.text.base import NluBase, DeferredNlu
+from ggbot.spreadsheet import SnapshotTable
+from ggbot.dota.phrases import (
+    PhraseGenerator,
+    PhraseRule,
+    build_rules,
+    get_dota_variables,
+)
+
+
+__all__ = ["PhraseRulesRefresher", "row_hash", "phrase_row", "grammar_hash"]
+
+_logger = logging.getLogger(__name__)
+
+_CACHE_VERSION = 1
+
+
+def row_hash(row: Iterable[str]) -> str:
+    return hashlib.sha1("\x1f".join(row).encode("utf-8")).hexdigest()
+
+
+def grammar_hash(filenames: Sequence[str]) -> str:
+    """Hash of the contents of the grammar files conditions are parsed with"""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        digest.update(filename.encode("utf-8") + b"\0")
+        try:
+            with open(filename, "rb") as fp:
+                digest.update(fp.read())
+        except OSError:
+            digest.update(b"\0missing")
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def phrase_row(row: List[str]) -> List[str]:
+    """(condition, weight, phrase) row, tables without the weight column
+    (condition, phrase) get weight 1"""
+    if len(row) == 2:
+        return [row[0], "1", row[1]]
+    return list(row)
+
+
+class PhraseRulesRefresher(BotComponent):
+    """Keeps PhraseGenerator rules in sync with the phrases table.
+
+    Rows are diffed by content hash, only new or changed rows go through
+    ``build_rules`` and the new rules list is swapped into the generator at
+    once. Rows and parsed conditions are persisted to ``cache_file`` so that
+    the next start builds the rules without the table and the nlu. Parsed
+    conditions are dropped once any of ``grammar_files`` changes.
+    """
+
+    def __init__(
+        self,
+        generator: PhraseGenerator,
+        table: IndexedCollection[list],
+        nlu_factory: Callable[[], NluBase],
+        cache_file: Optional[str] = None,
+        interval: float = 5 * 60,
+        variables: Optional[List[Variable]] = None,
+        grammar_files: Sequence[str] = (),
+    ):
+        self.generator = generator
+        self.table = table
+        # Warm restarts with all the conditions already parsed never build it
+        self.nlu = DeferredNlu(nlu_factory, name="phrases nlu")
+        self.cache_file = cache_file
+        self.interval = interval
+        self.variables = variables or get_dota_variables()
+        self.grammar_files = list(grammar_files)
+        self._grammar_hash: Optional[str] = None
+        self._rows: List[List[str]] = []
+        self._hashes: List[str] = []
+        self._rules: Dict[str, Optional[PhraseRule]] = {}  # row hash -> rule
+        self._parsed: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self, context: BotContext):
+        # Cache is cheap to load, everything else needs the nlu and happens in
+        # background so that the startup is not blocked by it
+        if not self._hashes:
+            self.load_cache()
+        self._task = asyncio.create_task(self._run(), name="phrase-rules-refresh")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        if not self._hashes:
+            # Nothing to serve phrases from yet: build from the table as it is
+            # now (its snapshot if it has one) before pulling it
+            try:
+                await loop.run_in_executor(None, self._apply_table)
+            except Exception as err:
+                _logger.exception(err)
+
+        while True:
+            try:
+                await self.refresh()
+            except Exception as err:
+                _logger.exception(err)
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> bool:
+        # Both fetching the table and parsing are blocking
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh_sync)
+
+    def refresh_sync(self) -> bool:
+        if isinstance(self.table, SnapshotTable):
+            self.table.refresh()
+        return self._apply_table()
+
+    def _apply_table(self) -> bool:
+        changed = self.apply_rows([phrase_row(row) for row in self.table])
+        if changed:
+            self.save_cache()
+        return changed
+
+    def apply_rows(self, rows: List[List[str]]) -> bool:
+        """Rebuilds rules of changed rows and swaps the rules of the generator.
+        Returns False if nothing changed"""
+        hashes = [row_hash(row) for row in rows]
+        if hashes == self._hashes:
+            return False
+
+        started = time.perf_counter()
+        rules: Dict[str, Optional[PhraseRule]] = {}
+        for h, row in zip(hashes, rows):
+            if h in rules:
+                continue
+            if h in self._rules:
+                rules[h] = self._rules[h]
+                continue
+            try:
+                built = build_rules([row], self.nlu, self.variables, self._parsed)
+            except (ValueError, KeyError) as err:
+                _logger.warning(f"Invalid phrase row {row}: {err}")
+                built = []
+            rules[h] = built[0] if built else None
+
+        rebuilt = len(rules.keys() - self._rules.keys())
+        removed = len(self._rules.keys() - rules.keys())
+        self._rows = rows
+        self._hashes = hashes
+        self._rules = rules
+        self.generator.set_rules([rules[h] for h in hashes if rules[h] is not None])
+        _logger.info(
+            f"Phrase rules updated: {len(self.generator.phrase_rules)} rules, "
+            f"{rebuilt} rows rebuilt, {removed} removed "
+            f"in {time.perf_counter() - started:.3f} seconds"
+        )
+        return True
+
+    @property
+    def grammar_hash(self) -> str:
+        # Grammar is only loaded once, by the nlu of this process
+        if self._grammar_hash is None:
+            self._grammar_hash = grammar_hash(self.grammar_files)
+        return self._grammar_hash
+
+    def load_cache(self) -> bool:
+        if self.cache_file is None:
+            return False
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as err:
+            _logger.warning(f"Failed to load phrase rules cache: {err}")
+            return False
+
+        if data.get("version") != _CACHE_VERSION:
+            return False
+
+        if data.get("grammar") != self.grammar_hash:
+            # Parsing the rows again needs the nlu, that is done in background
+            _logger.info("Phrase grammar changed, ignoring phrase rules cache")
+            return False
+
+        self._parsed = data["conditions"]
+        self.apply_rows(data["rows"])
+        return True
+
+    def save_cache(self):
+        if self.cache_file is None:
+            return
+
+        # Only keep conditions of the current rows
+        conditions = {row[0].strip() for row in self._rows if row}
+        data = {
+            "version": _CACHE_VERSION,
+            "grammar": self.grammar_hash,
+            "rows": self._rows,
+            "conditions": {c: v for c, v in self._parsed.items() if c in conditions},
+        }
+        directory = os.path.dirname(self.cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_file_atomic(
+            self.cache_file, json.dumps(data, ensure_ascii=False).encode("utf-8")
+        )
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} interval={self.interval}>"
@@ -1,8 +1,9 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple, Any, Callable
 import random
 import logging
 
-from attr import dataclass, asdict
+import numpy as np
+from attr import dataclass
 
 import ctor
 
@@ -12,7 +13,16 @@ from ggbot.text.base import NluBase
 from ggbot.opendota import Player
 
 
-__all__ = ["build_rules", "parse_rules", "PhraseGenerator", "get_dota_variables"]
+__all__ = [
+    "build_rules",
+    "build_rule",
+    "parse_condition",
+    "parse_rules",
+    "PhraseGenerator",
+    "CompiledPhraseRules",
+    "player_phrase_context",
+    "get_dota_variables",
+]
 
 _logger = logging.getLogger(__name__)
 
@@ -42,10 +52,67 @@ class PhraseRule:
     weight: float
 
 
+def parse_condition(condition: str, nlu: NluBase) -> Optional[List[Dict[str, Any]]]:
+    """Parses condition text into a list of ``{var, value}`` statements"""
+    match = nlu.match_intent_one_of(condition, ["statements"])
+    if not match:
+        _logger.warning(f"Failed to parse: {condition}")
+        return None
+
+    match_rules = match.get_slot_value("rules")
+    if not match_rules:
+        _logger.warning(f"No rules in match: {match}")
+        return None
+    return list(match_rules)
+
+
+def build_rule(
+    statements: List[Dict[str, Any]],
+    phrase: str,
+    weight: float,
+    variables_dict: Dict[str, Variable],
+) -> PhraseRule:
+    operands = []
+    for r in statements:
+        var_name = r["var"]
+        value_name = r["value"]
+
+        if var_name == "player":
+            # Common python rule
+            operands.append(EqualsValue(var_name, value_name))
+        elif var_name == "hero_id":
+            operands.append(ValueIsOneOf(var_name, set(value_name)))
+        else:
+            # Linguistic
+            v = variables_dict[var_name]
+            operands.append(Is(v, value_name))
+
+    rule_condition = And(*operands)
+    _logger.debug(phrase)
+    _logger.debug(rule_condition)
+
+    return PhraseRule(
+        condition=rule_condition,
+        phrase_template=phrase,
+        weight=weight
+        + 0.5 * len(operands),  # Longer the AND statement -> higher the weight
+    )
+
+
 def build_rules(
-    phrases: IndexedCollection[list], nlu: NluBase, variables: List[Variable]
+    phrases: IndexedCollection[list],
+    nlu: NluBase,
+    variables: List[Variable],
+    parsed_conditions: Optional[Dict[str, Optional[List[Dict[str, Any]]]]] = None,
 ) -> List[PhraseRule]:
+    """Builds rules from (condition, weight, phrase) rows.
+
+    ``parsed_conditions`` caches parsed statements by condition text, only the
+    conditions missing from it are parsed with nlu (and added to it).
+    """
     variables_dict = {v.name: v for v in variables}
+    if parsed_conditions is None:
+        parsed_conditions = {}
 
     phrase_rules = []
     for condition, weight, phrase in phrases:
@@ -56,44 +123,14 @@ def build_rules(
         if not condition or not phrase:
             continue
 
-        match = nlu.match_intent_one_of(condition, ["statements"])
-        if not match:
-            _logger.warning(f"Failed to parse: {condition}")
+        if condition not in parsed_conditions:
+            parsed_conditions[condition] = parse_condition(condition, nlu)
+        statements = parsed_conditions[condition]
+        if not statements:
             continue
 
-        match_rules = match.get_slot_value("rules")
-        if not match_rules:
-            _logger.warning(f"No rules in match: {match}")
-            continue
-
-        operands = []
-        for r in match_rules:
-            var_name = r["var"]
-            value_name = r["value"]
-
-            if var_name == "player":
-                # Common python rule
-                operands.append(EqualsValue(var_name, value_name))
-            elif var_name == "hero_id":
-                operands.append(ValueIsOneOf(var_name, set(value_name)))
-            else:
-                # Linguistic
-                v = variables_dict[var_name]
-                operands.append(Is(v, value_name))
-
-        rule_condition = And(*operands)
-        _logger.debug(phrase)
         _logger.debug(condition)
-        _logger.debug(rule_condition)
-
-        phrase_rule = PhraseRule(
-            condition=rule_condition,
-            phrase_template=phrase,
-            weight=weight
-            + 0.5 * len(operands),  # Longer the AND statement -> higher the weight
-        )
-
-        phrase_rules.append(phrase_rule)
+        phrase_rules.append(build_rule(statements, phrase, weight, variables_dict))
     return phrase_rules
 
 
@@ -127,65 +164,302 @@ def parse_rules(raw_phrases: IndexedCollection, nlu: NluBase) -> List[PhraseRule
     return build_rules(raw_phrases, nlu, variables)
 
 
-_CTX = ctor.JsonSerializationContext()
-_PLAYER_CONVERTER = _CTX.get_converter(Player)
+# Player fields the phrase rules are evaluated against
+PLAYER_FEATURE_FIELDS = (
+    "hero_id",
+    "kills",
+    "deaths",
+    "assists",
+    "gold_per_min",
+    "xp_per_min",
+    "hero_damage",
+    "tower_damage",
+    "hero_healing",
+    "duration",
+    "last_hits",
+)
 
 
-@dataclass
-class PhraseGenerator:
-    phrase_rules: List[PhraseRule]
-    threshold: float = 0.1
+def player_phrase_context(player: Player, player_name: str) -> Dict[str, Any]:
+    """Values phrase rule conditions are evaluated against.
 
-    def generate_phrase(
-        self, match_id: int, player: Player, player_name: str, hero_name: str
-    ) -> Optional[str]:
-        is_radiant = player.player_slot < 128
-        radiant_win = player.radiant_win is True
-        context = asdict(player)
+    Only the fields used by the rules are read, converting the whole player
+    with asdict would deep-copy purchase logs and other nested data.
+    """
+    context = {name: getattr(player, name) for name in PLAYER_FEATURE_FIELDS}
+    context["player"] = player_name.lower()
 
-        context["player"] = player_name.lower()
+    is_radiant = player.player_slot < 128
+    if player.radiant_win is True:
+        context["result"] = is_radiant
+    else:
+        context["result"] = not is_radiant
 
-        if radiant_win:
-            context["result"] = is_radiant
-        else:
-            context["result"] = not is_radiant
+    k = context.get("kills", 0)
+    a = context.get("assists", 0)
+    d = context.get("deaths", 0)
+    ka = k + a
 
-        k = context.get("kills", 0)
-        a = context.get("assists", 0)
-        d = context.get("deaths", 0)
-        ka = k + a
+    if d > 0:
+        context["kda"] = ka / d
+    else:
+        context["kda"] = ka
+
+    duration_minutes = context.get("duration", 0) / 60.0
+    context["kills_per_min"] = k / duration_minutes
+    context["deaths_per_min"] = d / duration_minutes
+    context["assists_per_min"] = a / duration_minutes
+    context["ka_per_min"] = (k + a) / duration_minutes
+    return context
+
+
+class _Atom:
+    """Single operand of the rule conditions"""
+
+    def evaluate(self, context: Dict[str, Any]) -> float:
+        raise NotImplementedError
+
+    def evaluate_batch(
+        self, features: np.ndarray, contexts: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        return np.fromiter(map(self.evaluate, contexts), float, len(contexts))
+
+
+class _IsAtom(_Atom):
+    def __init__(self, condition: Is, column: int):
+        self.name = condition.variable.name
+        # Lookup table if the variable is discretized
+        self.mf = condition.variable.get_sampler(condition.mf)
+        self.x_min, self.x_max = condition.variable.bounds
+        self.column = column
+
+    def evaluate(self, context: Dict[str, Any]) -> float:
+        x = context[self.name]
+        return self.mf.sample(max(min(x, self.x_max), self.x_min))
+
+    def evaluate_batch(
+        self, features: np.ndarray, contexts: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        x = np.clip(features[:, self.column], self.x_min, self.x_max)
+        return self.mf.sample_array(x)
+
+
+class _EqualsAtom(_Atom):
+    def __init__(self, condition: EqualsValue):
+        self.name = condition.name
+        self.expected = condition.expected
+
+    def evaluate(self, context: Dict[str, Any]) -> float:
+        return float(context.get(self.name) == self.expected)
+
+
+class _OneOfAtom(_Atom):
+    def __init__(self, condition: ValueIsOneOf):
+        self.name = condition.name
+        self.expected = condition.expected
+
+    def evaluate(self, context: Dict[str, Any]) -> float:
+        return float(context.get(self.name) in self.expected)
+
+
+class _ConditionAtom(_Atom):
+    def __init__(self, condition: ConditionStatement):
+        self.condition = condition
+
+    def evaluate(self, context: Dict[str, Any]) -> float:
+        return self.condition.evaluate(**context)
+
+
+def _select_top(scores: np.ndarray, threshold: float, n: int) -> np.ndarray:
+    # Stable sort keeps the order of rules with equal scores
+    candidates = np.flatnonzero(scores > threshold)
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order[:n]]
 
-        if d > 0:
-            context["kda"] = ka / d
-        else:
-            context["kda"] = ka
 
-        duration_minutes = context.get("duration", 0) / 60.0
-        context["kills_per_min"] = k / duration_minutes
-        context["deaths_per_min"] = d / duration_minutes
-        context["assists_per_min"] = a / duration_minutes
-        context["ka_per_min"] = (k + a) / duration_minutes
+class CompiledPhraseRules:
+    """Phrase rules compiled to a matrix form.
 
-        population = []
-        for phrase_rule in self.phrase_rules:
-            res = phrase_rule.condition.evaluate(**context) * phrase_rule.weight
+    Every distinct operand (atom) of the rule conditions is evaluated once per
+    context, ``index`` is a (rules x max operands) matrix of atom indices padded
+    with an always-1 atom, so all rule activations are a single min-reduction.
+    Operands are fuzzified exactly as ``And.evaluate`` would do it, so scores
+    are identical to evaluating the conditions one by one.
 
-            if res > self.threshold:
-                phrase = phrase_rule.phrase_template.format(
-                    name=player_name, hero=hero_name
-                )
-                _logger.debug(f"{res:.2f}  {phrase}")
-                population.append((phrase, res))
+    Several contexts (e.g. all players of a match) are scored together from a
+    (contexts x features) matrix of the linguistic variables values.
+    """
 
-        if not population:
+    def __init__(self, rules: List[PhraseRule]):
+        self.rules = rules
+        self.feature_names: List[str] = []
+        self._atoms: List[_Atom] = []
+        atom_ids: Dict[Tuple, int] = {}
+
+        def _atom_id(condition: ConditionStatement) -> int:
+            if isinstance(condition, Is):
+                key = ("is", condition.variable.name, id(condition.mf))
+            elif isinstance(condition, EqualsValue):
+                key = ("eq", condition.name, condition.expected)
+            elif isinstance(condition, ValueIsOneOf):
+                key = ("in", condition.name, frozenset(condition.expected))
+            else:
+                key = ("any", id(condition))
+
+            if key in atom_ids:
+                return atom_ids[key]
+
+            if isinstance(condition, Is):
+                name = condition.variable.name
+                if name not in self.feature_names:
+                    self.feature_names.append(name)
+                atom = _IsAtom(condition, self.feature_names.index(name))
+            elif isinstance(condition, EqualsValue):
+                atom = _EqualsAtom(condition)
+            elif isinstance(condition, ValueIsOneOf):
+                atom = _OneOfAtom(condition)
+            else:
+                atom = _ConditionAtom(condition)
+
+            atom_ids[key] = len(self._atoms)
+            self._atoms.append(atom)
+            return atom_ids[key]
+
+        rows = []
+        for rule in rules:
+            if isinstance(rule.condition, And) and rule.condition.operands:
+                rows.append([_atom_id(op) for op in rule.condition.operands])
+            else:
+                rows.append([_atom_id(rule.condition)])
+
+        # Last atom is the padding, neutral for min
+        self._padding = len(self._atoms)
+        width = max(map(len, rows), default=0)
+        self.index = np.full((len(rows), width), self._padding, dtype=np.intp)
+        for i, row in enumerate(rows):
+            self.index[i, : len(row)] = row
+        self.weights = np.array([rule.weight for rule in rules], dtype=float)
+
+    def evaluate_atoms(self, context: Dict[str, Any]) -> np.ndarray:
+        values = np.empty(len(self._atoms) + 1, dtype=float)
+        for i, atom in enumerate(self._atoms):
+            values[i] = atom.evaluate(context)
+        values[self._padding] = 1.0
+        return values
+
+    def scores(self, context: Dict[str, Any]) -> np.ndarray:
+        if not self.rules:
+            return np.empty(0)
+        atoms = self.evaluate_atoms(context)
+        return atoms[self.index].min(axis=1) * self.weights
+
+    def features(self, contexts: List[Dict[str, Any]]) -> np.ndarray:
+        rows = [[ctx[name] for name in self.feature_names] for ctx in contexts]
+        return np.array(rows, dtype=float).reshape(
+            len(contexts), len(self.feature_names)
+        )
+
+    def scores_batch(self, contexts: List[Dict[str, Any]]) -> np.ndarray:
+        """Scores of all rules for every context, (contexts x rules)"""
+        if not self.rules or not contexts:
+            return np.empty((len(contexts), len(self.rules)))
+        features = self.features(contexts)
+        atoms = np.empty((len(contexts), len(self._atoms) + 1), dtype=float)
+        for i, atom in enumerate(self._atoms):
+            atoms[:, i] = atom.evaluate_batch(features, contexts)
+        atoms[:, self._padding] = 1.0
+        return atoms[:, self.index].min(axis=2) * self.weights
+
+    def top(
+        self, context: Dict[str, Any], threshold: float, n: int = 3
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices of at most n best rules scoring above the threshold (equal
+        scores keep the order of rules) and scores of all rules"""
+        scores = self.scores(context)
+        return _select_top(scores, threshold, n), scores
+
+    def top_batch(
+        self, contexts: List[Dict[str, Any]], threshold: float, n: int = 3
+    ) -> Tuple[List[np.ndarray], np.ndarray]:
+        scores = self.scores_batch(contexts)
+        return [_select_top(row, threshold, n) for row in scores], scores
+
+
+_CTX = ctor.JsonSerializationContext()
+_PLAYER_CONVERTER = _CTX.get_converter(Player)
+
+
+@dataclass
+class PhraseGenerator:
+    phrase_rules: List[PhraseRule]
+    threshold: float = 0.1
+
+    def __attrs_post_init__(self):
+        self._compiled: Optional[CompiledPhraseRules] = None
+
+    def set_rules(self, phrase_rules: List[PhraseRule]):
+        """Replaces the rules, compiling them before the swap"""
+        self._compiled = CompiledPhraseRules(phrase_rules)
+        self.phrase_rules = phrase_rules
+
+    @property
+    def compiled_rules(self) -> CompiledPhraseRules:
+        # Recompiled whenever the rules list is replaced
+        compiled = self._compiled
+        if compiled is None or compiled.rules is not self.phrase_rules:
+            compiled = CompiledPhraseRules(self.phrase_rules)
+            self._compiled = compiled
+        return compiled
+
+    def _choose(
+        self,
+        compiled: CompiledPhraseRules,
+        best: np.ndarray,
+        scores: np.ndarray,
+        match_id: int,
+        player_name: str,
+        hero_name: str,
+    ) -> Optional[str]:
+        if len(best) == 0:
             return None
 
-        population = sorted(population, key=lambda _: _[1], reverse=True)
-        population = population[:3]
+        population = []
+        for i in best:
+            phrase = compiled.rules[i].phrase_template.format(
+                name=player_name, hero=hero_name
+            )
+            _logger.debug(f"{scores[i]:.2f}  {phrase}")
+            population.append((phrase, float(scores[i])))
 
-        rnd = random.Random()
-        rnd.seed(match_id)
-        p, res = rnd.choice(population)
+        p, res = random.Random(match_id).choice(population)
 
         _logger.debug(f"Selected: {p}")
         return p
+
+    def generate_phrase(
+        self, match_id: int, player: Player, player_name: str, hero_name: str
+    ) -> Optional[str]:
+        context = player_phrase_context(player, player_name)
+        compiled = self.compiled_rules
+        best, scores = compiled.top(context, self.threshold, n=3)
+        return self._choose(compiled, best, scores, match_id, player_name, hero_name)
+
+    def generate_phrases(
+        self,
+        match_id: int,
+        players: List[Player],
+        player_names: List[str],
+        hero_names: List[str],
+    ) -> List[Optional[str]]:
+        """Phrases for several players of a match at once, same as calling
+        generate_phrase for each of them"""
+        contexts = [
+            player_phrase_context(player, name)
+            for player, name in zip(players, player_names)
+        ]
+        compiled = self.compiled_rules
+        best, scores = compiled.top_batch(contexts, self.threshold, n=3)
+        return [
+            self._choose(compiled, best[i], scores[i], match_id, name, hero)
+            for i, (name, hero) in enumerate(zip(player_names, hero_names))
+        ]
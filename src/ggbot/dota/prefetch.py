@@ -0,0 +1,193 @@
+from typing import Optional, Dict, List
+import asyncio
+import logging
+import time
+
+from ggbot.context import BotContext
+from ggbot.component import BotComponent
+from ggbot.memory import Memory
+from ggbot.opendota import OpenDotaApi, DotaMatch
+from ggbot.dota.component import Dota, PrefetchedMatch, calculate_player_medals
+from ggbot.dota.predicates import find_player_by_steam_id
+
+
+__all__ = ["RateBudget", "RecentMatchesWatcher"]
+
+_logger = logging.getLogger(__name__)
+
+
+class RateBudget:
+    """Token bucket limiting the rate of outgoing API requests"""
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class RecentMatchesWatcher(BotComponent):
+    """Periodically checks recent matches of users with a known steam_id.
+
+    Once a new match shows up it is fetched (and its parse is requested from
+    OpenDota if needed), medals and the phrase are computed and stored in
+    Dota component so that the following user request is served from cache.
+    """
+
+    def __init__(
+        self,
+        memory: Memory,
+        dota: Dota,
+        api: OpenDotaApi,
+        interval: float = 2 * 60,
+        max_concurrency: int = 4,
+        requests_per_minute: float = 30,
+        request_parse: bool = True,
+        steam_id_user_var: str = "steam_id",
+    ):
+        self.memory = memory
+        self.dota = dota
+        self.api = api
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.budget = RateBudget(requests_per_minute)
+        self.request_parse = request_parse
+        self.steam_id_user_var = steam_id_user_var
+        self._bot: Optional[BotContext] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_seen: Dict[int, int] = {}  # steam_id -> last prefetched match
+        self._parse_requested: Dict[int, float] = {}  # match_id -> time
+
+    async def init(self, context: BotContext):
+        self._bot = context
+        self._task = asyncio.create_task(self._run(), name="recent-matches-watcher")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as err:
+                _logger.exception(err)
+            await asyncio.sleep(self.interval)
+
+    async def poll(self):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _check(user_id: int, steam_id: int):
+            async with semaphore:
+                try:
+                    await self.check_user(user_id, steam_id)
+                except Exception as err:
+                    _logger.warning(f"Failed to prefetch for steam_id={steam_id}: {err}")
+
+        users = list(self.memory.iter_user_var(self.steam_id_user_var))
+        _logger.debug(f"Checking recent matches of {len(users)} users")
+        await asyncio.gather(*(_check(user_id, int(sid)) for user_id, sid in users))
+
+    async def check_user(self, user_id: int, steam_id: int):
+        await self.budget.acquire()
+        matches = await self.api.get_player_recent_matches(steam_id)
+        if not matches:
+            return
+
+        match_id = matches[0].match_id
+        if self._last_seen.get(steam_id) == match_id:
+            return
+
+        # Not yet parsed matches are re-fetched on the next poll
+        await self.budget.acquire()
+        match = await self.api.get_match(
+            match_id, cache_lifetime=self.interval * 0.5
+        )
+        is_parsed = match.radiant_gold_adv is not None
+
+        if not is_parsed and self.request_parse:
+            await self._request_parse(match_id)
+
+        self._store(user_id, steam_id, match, is_parsed)
+
+        if is_parsed:
+            self._last_seen[steam_id] = match_id
+            self._parse_requested.pop(match_id, None)
+
+    async def _request_parse(self, match_id: int):
+        requested_at = self._parse_requested.get(match_id)
+        if requested_at is not None and time.time() - requested_at < 10 * 60:
+            return
+
+        _logger.info(f"Requesting parse of match {match_id}")
+        await self.budget.acquire()
+        await self.api.request_match_parse(match_id)
+        self._parse_requested[match_id] = time.time()
+
+    def _get_display_names(self, user_id: int) -> List[str]:
+        """Names the user is addressed by: nicknames in the guilds of the bot
+        and the global name used in direct messages"""
+        if self._bot is None or self._bot.client is None:
+            return []
+        client = self._bot.client
+        names = []
+        for guild in client.guilds:
+            member = guild.get_member(user_id)
+            if member is not None:
+                names.append(member.display_name)
+        user = client.get_user(user_id)
+        if user is not None:
+            names.append(user.display_name)
+        return list(dict.fromkeys(names))
+
+    def _store(self, user_id: int, steam_id: int, match: DotaMatch, is_parsed: bool):
+        player = find_player_by_steam_id(match, steam_id)
+        if player is None:
+            return
+
+        medals = calculate_player_medals(match, player) if is_parsed else []
+
+        # Phrases of not yet parsed matches would miss most of the stats
+        phrases = {}
+        names = self._get_display_names(user_id) if is_parsed else []
+        for player_name in names:
+            phrase = self.dota.phrase_generator.generate_phrase(
+                match_id=match.match_id,
+                player=player,
+                player_name=player_name,
+                hero_name=self.dota.hero_id_to_localized_name(player.hero_id),
+            )
+            if phrase is not None:
+                phrases[player_name] = phrase
+
+        self.dota.store_prefetched(
+            PrefetchedMatch(
+                match_id=match.match_id,
+                account_id=steam_id,
+                match=match,
+                is_parsed=is_parsed,
+                medals=medals,
+                phrases=phrases,
+            )
+        )
+        _logger.debug(f"Prefetched match {match.match_id} for steam_id={steam_id}")
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} interval={self.interval}>"
@@ -239,6 +239,28 @@ def create_dota_scenario_handlers(
         ),
     )
 
+    intent_roast_lobby = sequence(
+        require_steam_id(memory, steam_id),
+        FetchLastMatchId(api=api, steam_id=steam_id, result=last_match_id),
+        RequestMatch(api=api, match_id=last_match_id, result=last_match),
+        GeneratePhrasesForMatch(
+            phrase_generator=dota.phrase_generator,
+            match=last_match,
+            result=phrase,
+            dota=dota,
+        ),
+        SendEmbed(
+            title=Const(STRING, "Прожарка лобби"),
+            description=Formatted(
+                "{phrases}"
+                "\n\nПосмотреть на [Dotabuff](https://www.dotabuff.com/matches/{match_id}), "
+                "[OpenDota](https://www.opendota.com/matches/{match_id})",
+                phrases=phrase,
+                match_id=last_match_id,
+            ),
+        ),
+    )
+
     intent_dota_pick_against = sequence(
         RequestTopHeroMatchups(
             api=api, hero_id=NumberSlotExpression("hero_id"), result=matchups, limit=6
@@ -258,8 +280,11 @@ def create_dota_scenario_handlers(
 
     intent_last_match_medals = sequence(
         require_steam_id(memory, steam_id),
-        load_or_create_medals(memory, user_medals, user_medals_matches),
-        FetchLastMatchId(api=api, steam_id=steam_id, result=last_match_id),
+        # Independent, medals are read from memory while the match id is fetched
+        parallel_all(
+            load_or_create_medals(memory, user_medals, user_medals_matches),
+            FetchLastMatchId(api=api, steam_id=steam_id, result=last_match_id),
+        ),
         selector(
             CheckSecondsSinceRecentMatchGreaterThan(
                 api, steam_id, seconds=Const(NUMBER, 2 * 60)
@@ -311,7 +336,9 @@ def create_dota_scenario_handlers(
         set_var_from(
             var=match_player, value=MatchPlayer(match=last_match, steam_id=steam_id)
         ),
-        CalculateMedals(match=last_match, steam_id=steam_id, result=match_medals),
+        CalculateMedals(
+            match=last_match, steam_id=steam_id, result=match_medals, dota=dota
+        ),
         selector(
             sequence(
                 AssignPlayerMedals(
@@ -456,7 +483,9 @@ def create_dota_scenario_handlers(
         set_var_from(
             var=match_player, value=MatchPlayer(match=last_match, steam_id=steam_id)
         ),
-        CalculateMedals(match=last_match, steam_id=steam_id, result=match_medals),
+        CalculateMedals(
+            match=last_match, steam_id=steam_id, result=match_medals, dota=dota
+        ),
         selector(
             sequence(
                 AssignPlayerMedals(
@@ -483,6 +512,7 @@ def create_dota_scenario_handlers(
         "intent-my-mmr": ScenarioHandler(intent_my_mmr),
         "intent-my-best-heroes": ScenarioHandler(intent_my_best_heroes),
         "intent-my-last-match": ScenarioHandler(intent_my_last_match),
+        "intent-dota-roast-lobby": ScenarioHandler(intent_roast_lobby),
         "intent-dota-pick-against": ScenarioHandler(intent_dota_pick_against),
         "intent-list-medals": ScenarioHandler(intent_list_medals),
         "intent-last-match-medals": ScenarioHandler(intent_last_match_medals),
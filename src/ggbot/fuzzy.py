@@ -1,6 +1,8 @@
-from typing import Optional, Union, Tuple, List
+from typing import Optional, Union, Tuple, List, Dict
 import math
 
+import numpy as np
+
 __all__ = [
     "FuzzySet",
     "DiscreteFuzzySet",
@@ -27,6 +29,8 @@ __all__ = [
     "R",
     "plot_variable",
     "iter_linear_space",
+    "linear_space",
+    "centroid",
 ]
 
 
@@ -38,28 +42,40 @@ def iter_linear_space(x_min: float, x_max: float, steps: int):
         x += dx
 
 
+def linear_space(x_min: float, x_max: float, steps: int) -> np.ndarray:
+    return np.linspace(x_min, x_max, steps)
+
+
+def centroid(x: np.ndarray, samples: np.ndarray) -> float:
+    area = samples.sum()
+    if area < 1e-8:
+        return 0
+    return float(np.dot(x, samples) / area)
+
+
 class FuzzySet:
+    """Fuzzy set with scalar (``sample``) and vectorized (``sample_array``)
+    membership evaluation.
+
+    Subclasses implementing only ``sample`` still work, ``sample_array`` then
+    falls back to sampling point by point.
+    """
+
     def sample(self, x):
         raise NotImplementedError
 
-    def calculate_centroid(self, x_min=0.0, x_max=1.0, steps=100):
-        s1 = 0.0
-        area = 0.0
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return np.fromiter(map(self.sample, x), dtype=float, count=len(x))
 
-        for x in iter_linear_space(x_min, x_max, steps):
-            sample = self.sample(x)
-            s1 += x * sample
-            area += sample
-
-        if area < 1e-8:
-            return 0
-        return s1 / area
+    def calculate_centroid(self, x_min=0.0, x_max=1.0, steps=100):
+        x = linear_space(x_min, x_max, steps)
+        return centroid(x, self.sample_array(x))
 
     def center(self):
         return None
 
     def to_discrete(self, x_min=0.0, x_max=1.0, steps=100):
-        values = list(map(self.sample, iter_linear_space(x_min, x_max, steps)))
+        values = self.sample_array(linear_space(x_min, x_max, steps))
         return DiscreteFuzzySet(values, (x_min, x_max))
 
     def __call__(self, x):
@@ -71,29 +87,38 @@ class FuzzySet:
 
 class DiscreteFuzzySet(FuzzySet):
     def __init__(self, values, bounds):
-        self._values = values
+        self._values = np.asarray(values, dtype=float)
         self._x_min, self._x_max = bounds
         self._x_range = self._x_max - self._x_min
+        self._x = linear_space(self._x_min, self._x_max, len(self._values))
+
+        # Plain list since indexing numpy arrays with scalars is slow
+        self._table: List[float] = self._values.tolist()
+        self._last = len(self._table) - 1
+        self._scale = self._last / self._x_range
+
+    @property
+    def resolution(self) -> int:
+        return len(self._table)
 
     def sample(self, x):
-        n = len(self._values)
-        k = (x - self._x_min) / self._x_range
-        i = k * (n - 1)  # float index
+        i = (x - self._x_min) * self._scale  # float index
 
         # Bounds
         if i <= 0:
-            return self._values[0]
+            return self._table[0]
 
-        if i >= n - 1:
-            return self._values[-1]
+        if i >= self._last:
+            return self._table[-1]
 
         # Linear interpolation between two nearest indices
-        i1 = math.floor(i)
-        i2 = math.ceil(i)
-        p = i - i1  # 0..1 point on a line between i1 and i2
-        y1 = self._values[i1]
-        y2 = self._values[i2]
-        return y1 + p * (y2 - y1)
+        i1 = int(i)
+        y1 = self._table[i1]
+        return y1 + (i - i1) * (self._table[i1 + 1] - y1)
+
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        # Clamps to the boundary values outside of bounds as sample does
+        return np.interp(x, self._x, self._values)
 
 
 class FuzzySetCompound(FuzzySet):
@@ -108,21 +133,33 @@ class FuzzyUnion(FuzzySetCompound):
     def sample(self, x):
         return max(a.sample(x) for a in self.args)
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return np.maximum.reduce([a.sample_array(x) for a in self.args])
+
 
 class FuzzyIntersection(FuzzySetCompound):
     def sample(self, x):
         return min(a.sample(x) for a in self.args)
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return np.minimum.reduce([a.sample_array(x) for a in self.args])
+
 
 class FuzzyMultiply(FuzzySetCompound):
     def sample(self, x):
         return self.args[0].sample(x) * self.args[1].sample(x)
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return self.args[0].sample_array(x) * self.args[1].sample_array(x)
+
 
 class FuzzyNegate(FuzzySetCompound):
     def sample(self, x):
         return 1 - self.args[0].sample(x)
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return 1 - self.args[0].sample_array(x)
+
 
 class FuzzySum(FuzzySetCompound):
     def sample(self, x):
@@ -130,6 +167,11 @@ class FuzzySum(FuzzySetCompound):
         b = self.args[1].sample(x)
         return a + b - a * b
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        a = self.args[0].sample_array(x)
+        b = self.args[1].sample_array(x)
+        return a + b - a * b
+
 
 class MembershipFunction(FuzzySet):
     def sample(self, x):
@@ -143,6 +185,9 @@ class ConstMf(MembershipFunction):
     def sample(self, x):
         return self.value
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return np.full(np.shape(x), self.value, dtype=float)
+
     def center(self):
         return self.value
 
@@ -161,6 +206,11 @@ class TriangularMf(MembershipFunction):
         right = (self.right - x) / (self.right - self.support)
         return max(0, min(left, right))
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        left = (x - self.left) / (self.support - self.left)
+        right = (self.right - x) / (self.right - self.support)
+        return np.maximum(0, np.minimum(left, right))
+
     def center(self):
         return self.support
 
@@ -180,6 +230,11 @@ class TrapezoidalMf(MembershipFunction):
         v = min(left, right)
         return max(0, min(v, 1))  # clip v to 0..1
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        left = (x - self.left) / (self.left_support - self.left)
+        right = (self.right - x) / (self.right - self.right_support)
+        return np.clip(np.minimum(left, right), 0, 1)
+
     def center(self):
         # NOT ACCURATE :D
         return 0.5 * self.right_support - 0.5 * self.left_support
@@ -202,6 +257,9 @@ class GaussianMf(MembershipFunction):
     def sample(self, x):
         return math.exp(-((x - self.mean) ** 2) / (2 * self.std**2))
 
+    def sample_array(self, x: np.ndarray) -> np.ndarray:
+        return np.exp(-((x - self.mean) ** 2) / (2 * self.std**2))
+
     def center(self):
         return self.mean
 
@@ -211,17 +269,89 @@ class GaussianMf(MembershipFunction):
 
 _MF = Union[str, MembershipFunction]
 
+DEFAULT_RESOLUTION = 129
+MAX_RESOLUTION = 65537
+
 
 class Variable:
+    """Linguistic variable.
+
+    With ``resolution`` or ``max_error`` terms are discretized: membership of
+    each term is precomputed into a table over ``bounds`` and evaluated by
+    linear interpolation instead of the analytic function, see ``discretize``.
+    """
+
     def __init__(
         self,
         name: Optional[str] = None,
         bounds: Tuple[float, float] = (0, 1),
+        resolution: Optional[int] = None,
+        max_error: Optional[float] = None,
         **terms: MembershipFunction,
     ):
         self.membership_functions = terms
         self.name = name
         self.bounds = bounds
+        self._sampled: Dict[Tuple[int, int], np.ndarray] = {}
+        self._tables: Dict[int, DiscreteFuzzySet] = {}
+        self.discretization_error: Dict[str, float] = {}
+        if resolution is not None or max_error is not None:
+            self.discretize(resolution, max_error)
+
+    def discretize(
+        self, resolution: Optional[int] = None, max_error: Optional[float] = None
+    ) -> Dict[str, float]:
+        """Precomputes every term into a lookup table of ``resolution`` points.
+
+        If ``max_error`` is set, resolution of a term is doubled until the
+        error measured on an 8 times finer grid is within it (up to
+        MAX_RESOLUTION). Returns the measured error of each term.
+        """
+        x_min, x_max = self.bounds
+        tables = {}
+        errors = {}
+        for name, mf in self.membership_functions.items():
+            steps = resolution or DEFAULT_RESOLUTION
+            while True:
+                table = mf.to_discrete(x_min, x_max, steps)
+                x = linear_space(x_min, x_max, 8 * (steps - 1) + 1)
+                error = float(np.abs(table.sample_array(x) - mf.sample_array(x)).max())
+                if max_error is None or error <= max_error or steps >= MAX_RESOLUTION:
+                    break
+                steps = 2 * steps - 1  # Keeps previous points
+
+            tables[id(mf)] = table
+            errors[name] = error
+
+        # Swapped at once, concurrent readers see either old or new tables
+        self._tables = tables
+        self.discretization_error = errors
+        return errors
+
+    @property
+    def is_discrete(self) -> bool:
+        return bool(self._tables)
+
+    def get_sampler(self, mf: _MF) -> FuzzySet:
+        """Lookup table of the term if discretized, the term itself otherwise.
+        Tables are only valid within bounds."""
+        mf = self.get_mf(mf)
+        return self._tables.get(id(mf), mf)
+
+    def grid(self, steps: int = 100) -> np.ndarray:
+        return linear_space(self.bounds[0], self.bounds[1], steps)
+
+    def sample_grid(self, mf: _MF, steps: int = 100) -> np.ndarray:
+        """Membership values of mf over the variable bounds, cached since
+        membership functions do not change once defined"""
+        mf = self.get_mf(mf)
+        key = (id(mf), steps)
+        values = self._sampled.get(key)
+        if values is None:
+            values = mf.sample_array(self.grid(steps))
+            values.setflags(write=False)
+            self._sampled[key] = values
+        return values
 
     def fuzzify_all(self, x):
         result = {}
@@ -242,7 +372,10 @@ class Variable:
     def fuzzify(self, mf: _MF, x):
         if isinstance(mf, str):
             # Try to get mf by key
-            return self.membership_functions[mf].sample(x)
+            mf = self.membership_functions[mf]
+        table = self._tables.get(id(mf))
+        if table is not None and self.bounds[0] <= x <= self.bounds[1]:
+            return table.sample(x)
         return mf.sample(x)
 
     def defuzzify(self, mf: _MF):
@@ -253,7 +386,7 @@ class Variable:
         return mf.calculate_centroid(bounds_min, bounds_max)
 
     def get_mf(self, mf: _MF) -> MembershipFunction:
-        if not isinstance(mf, MembershipFunction):
+        if isinstance(mf, str):
             # Try to get mf by key
             mf = self.membership_functions[mf]
         return mf
@@ -299,6 +432,14 @@ class Is(ConditionStatement):
         self._var = variable
         self._mf = self._var.get_mf(mf)
 
+    @property
+    def variable(self) -> Variable:
+        return self._var
+
+    @property
+    def mf(self) -> MembershipFunction:
+        return self._mf
+
     def evaluate(self, **kwargs):
         x = kwargs[self._var.name]
         x_min, x_max = self._var.bounds
@@ -344,6 +485,10 @@ class And(ConditionStatement):
     def __init__(self, *operands: ConditionStatement):
         self._operands = operands
 
+    @property
+    def operands(self) -> Tuple[ConditionStatement, ...]:
+        return self._operands
+
     def evaluate(self, **kwargs):
         results = (op.evaluate(**kwargs) for op in self._operands)
         return min(results)
@@ -390,11 +535,10 @@ class R:
         self.condition = when
 
     def evaluate(self, **kwargs) -> float:
-        # Mamdani inference
+        # Mamdani inference: centroid of the mf clipped at alpha
         alpha = self.condition.evaluate(**kwargs)
-        intersection = FuzzyIntersection(self.mf, ConstMf(alpha))
-        return intersection.calculate_centroid(
-            x_min=self.var.bounds[0], x_max=self.var.bounds[1]
+        return centroid(
+            self.var.grid(), np.minimum(self.var.sample_grid(self.mf), alpha)
         )
 
     def __call__(self, **kwargs):
@@ -410,14 +554,11 @@ class Rules:
         self.rules.append((term, condition))
 
     def evaluate(self, **kwargs):
-        # Mamdani inference
-        rule_fs = []
-        for term, condition in self.rules:
-            alpha = condition.evaluate(**kwargs)
-            mf = FuzzyIntersection(self.var.get_mf(term), ConstMf(alpha))
-            rule_fs.append(mf)
-        result_fs = FuzzyUnion(*rule_fs)
-        return result_fs.calculate_centroid(*self.var.bounds)
+        # Mamdani inference: centroid of the union of the clipped rule mfs
+        terms = np.stack([self.var.sample_grid(term) for term, _ in self.rules])
+        alpha = np.array([condition.evaluate(**kwargs) for _, condition in self.rules])
+        result = np.minimum(terms, alpha[:, np.newaxis]).max(axis=0)
+        return centroid(self.var.grid(), result)
 
     def __call__(self, **kwargs):
         return self.evaluate(**kwargs)
@@ -427,10 +568,10 @@ def plot_variable(v: Variable):
     import matplotlib.pyplot as plt
 
     x_min, x_max = v.bounds
-    x = list(iter_linear_space(x_min, x_max, 100))
+    x = linear_space(x_min, x_max, 100)
 
     for mf_name, mf in v.membership_functions.items():
-        plt.plot(x, mf.sample(x), label=mf_name)
+        plt.plot(x, mf.sample_array(x), label=mf_name)
 
     plt.title(v.name)
     plt.legend()
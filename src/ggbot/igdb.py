@@ -147,8 +147,10 @@ class IgdbClient(BotComponent):
                 for video in game.get("videos", []):
                     video_id = video.get("video_id")
                     if video_id:
-                        await context.message.channel.send(
-                            f"https://youtu.be/{video_id}"
+                        context.answered(
+                            await context.message.channel.send(
+                                f"https://youtu.be/{video_id}"
+                            )
                         )
                         break
 
@@ -157,9 +159,9 @@ class IgdbClient(BotComponent):
                     embed.url = website["url"]
 
             embed.set_footer(text=game["summary"][:180] + "...")
-            await context.message.channel.send(embed=embed)
+            context.answered(await context.message.channel.send(embed=embed))
 
-        await context.message.channel.send("\n".join(game_names))
+        context.answered(await context.message.channel.send("\n".join(game_names)))
 
     async def init(self, context: BotContext):
         pass
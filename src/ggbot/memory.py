@@ -1,4 +1,5 @@
-from typing import Any, Optional
+from typing import Any, Optional, Iterable, Tuple
+import threading
 
 import pickledb
 
@@ -9,6 +10,9 @@ __all__ = ["BaseStorage", "DictStorage", "PickleDbStorage", "Memory"]
 
 
 class BaseStorage:
+    def open(self):
+        """Loads the storage, called on init"""
+
     def get(self, key: str) -> Optional[Any]:
         raise NotImplementedError
 
@@ -18,6 +22,9 @@ class BaseStorage:
     def contains_key(self, key: str) -> bool:
         raise NotImplementedError
 
+    def keys(self) -> Iterable[str]:
+        raise NotImplementedError
+
 
 class DictStorage(BaseStorage):
     def __init__(self, data: Optional[dict] = None):
@@ -32,10 +39,26 @@ class DictStorage(BaseStorage):
     def contains_key(self, key: str) -> bool:
         return key in self.data
 
+    def keys(self) -> Iterable[str]:
+        return list(self.data.keys())
+
 
 class PickleDbStorage(BaseStorage):
     def __init__(self, filename: str = "storage.db"):
-        self.db = pickledb.load(filename, auto_dump=True)
+        self.filename = filename
+        self._db: Optional[pickledb.PickleDB] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        with self._lock:
+            if self._db is None:
+                self._db = pickledb.load(self.filename, auto_dump=True)
+
+    @property
+    def db(self) -> pickledb.PickleDB:
+        if self._db is None:
+            self.open()
+        return self._db
 
     def get(self, key: str) -> Optional[Any]:
         return self.db.get(key)
@@ -46,16 +69,33 @@ class PickleDbStorage(BaseStorage):
     def contains_key(self, key: str) -> bool:
         return self.db.exists(key)
 
+    def keys(self) -> Iterable[str]:
+        return list(self.db.getall())
+
 
 class Memory(BotComponent):
     def __init__(self, storage: BaseStorage):
         self.storage = storage
 
     async def init(self, context: BotContext):
+        # Not in executor: pickledb installs a signal handler which only works
+        # in the main thread
+        self.storage.open()
         context.template_env.globals["has_memory"] = self.storage.contains_key
         context.template_env.globals["set_memory"] = self.storage.set
         context.template_env.globals["get_memory"] = self.storage.get
 
+    def iter_user_var(self, key: str) -> Iterable[Tuple[int, Any]]:
+        """Yields (user_id, value) for every user that has the user var stored"""
+        suffix = f"-{key}"
+        for storage_key in self.storage.keys():
+            if not storage_key.endswith(suffix):
+                continue
+            user_id = storage_key[: -len(suffix)]
+            if not user_id.isdigit():
+                continue
+            yield int(user_id), self.storage.get(storage_key)
+
     def save_global_var(self, key: str, value: str):
         async def _fn(context: Context):
             nonlocal self
@@ -1,11 +1,11 @@
 import typing
-from typing import Union, Literal, Optional
+from typing import Union, Literal, Optional, Mapping, Any
 import aiohttp
 
 from attr import dataclass, attrib
 import ctor
 
-from ggbot.utils import get_url_json_with_file_cache
+from ggbot.utils import get_url_json_with_file_cache, CachePolicy
 
 
 __all__ = [
@@ -20,12 +20,34 @@ __all__ = [
     "get_items",
     "get_item_ids",
     "OpenDotaApi",
+    "DEFAULT_CACHE_POLICIES",
+    "cache_policies_from_config",
 ]
 
 
 OPEN_DOTA_API_URL = "https://api.opendota.com/api"
 StrOrInt = Union[str, int]
 
+# Cache lifetime per endpoint, recent matches must never be served stale
+DEFAULT_CACHE_POLICIES = {
+    "recent_matches": CachePolicy(lifetime=5 * 60),
+    "rankings": CachePolicy(lifetime=5 * 60 * 60, max_stale=24 * 60 * 60),
+    "hero_matchups": CachePolicy(
+        lifetime=3 * 24 * 60 * 60, max_stale=7 * 24 * 60 * 60
+    ),
+    "constants": CachePolicy(lifetime=24 * 60 * 60, max_stale=30 * 24 * 60 * 60),
+}
+
+
+def cache_policies_from_config(
+    config: Optional[Mapping[str, Any]]
+) -> dict[str, CachePolicy]:
+    config = config or {}
+    return {
+        name: CachePolicy.from_dict(config.get(name), default)
+        for name, default in DEFAULT_CACHE_POLICIES.items()
+    }
+
 
 @dataclass(slots=True, frozen=True)
 class ChatEvent:
@@ -372,16 +394,24 @@ class HeroMatchup:
     wins: int
 
 
-async def get_items() -> dict[str, DotaItem]:
+async def get_items(
+    cache_policy: CachePolicy = DEFAULT_CACHE_POLICIES["constants"],
+) -> dict[str, DotaItem]:
     data = await get_url_json_with_file_cache(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/items.json"
+        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/items.json",
+        lifetime=cache_policy.lifetime,
+        max_stale=cache_policy.max_stale,
     )
     return ctor.load(dict[str, DotaItem], data)
 
 
-async def get_item_ids() -> dict[str, str]:
+async def get_item_ids(
+    cache_policy: CachePolicy = DEFAULT_CACHE_POLICIES["constants"],
+) -> dict[str, str]:
     data = await get_url_json_with_file_cache(
-        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/item_ids.json"
+        "https://raw.githubusercontent.com/odota/dotaconstants/master/build/item_ids.json",
+        lifetime=cache_policy.lifetime,
+        max_stale=cache_policy.max_stale,
     )
     return ctor.load(dict[str, str], data)
 
@@ -392,9 +422,23 @@ class OpenDotaApi:
     SEE: https://docs.opendota.com/#section/Introduction
     """
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        cache_policies: Optional[Mapping[str, CachePolicy]] = None,
+    ):
         self.key = api_key
         self._params = {"api_key": self.key}
+        self.cache_policies = {**DEFAULT_CACHE_POLICIES, **(cache_policies or {})}
+
+    async def _get_json(self, url: str, policy: str):
+        cache_policy = self.cache_policies[policy]
+        return await get_url_json_with_file_cache(
+            url,
+            params=self._params,
+            lifetime=cache_policy.lifetime,
+            max_stale=cache_policy.max_stale,
+        )
 
     async def get_match(
         self, match_id: StrOrInt, cache_lifetime: float = 24 * 60 * 60
@@ -417,9 +461,7 @@ class OpenDotaApi:
         https://docs.opendota.com/#tag/players%2Fpaths%2F~1players~1%7Baccount_id%7D~1recentMatches%2Fget
         """
         url = f"{OPEN_DOTA_API_URL}/players/{account_id}/recentMatches"
-        data = await get_url_json_with_file_cache(
-            url, params=self._params, lifetime=5 * 60
-        )
+        data = await self._get_json(url, "recent_matches")
         return ctor.load(list[PlayerRecentMatch], data)
 
     async def get_player_rankings(self, account_id: StrOrInt) -> list[PlayerRanking]:
@@ -429,9 +471,7 @@ class OpenDotaApi:
         https://blog.opendota.com/2016/09/30/explaining-rankings/
         """
         url = f"{OPEN_DOTA_API_URL}/players/{account_id}/rankings"
-        data = await get_url_json_with_file_cache(
-            url, params=self._params, lifetime=5 * 60 * 60
-        )
+        data = await self._get_json(url, "rankings")
         return ctor.load(list[PlayerRanking], data)
 
     async def get_hero_matchups(self, hero_id: StrOrInt) -> list[HeroMatchup]:
@@ -441,9 +481,7 @@ class OpenDotaApi:
         https://blog.opendota.com/2016/09/30/explaining-rankings/
         """
         url = f"{OPEN_DOTA_API_URL}/heroes/{hero_id}/matchups"
-        data = await get_url_json_with_file_cache(
-            url, params=self._params, lifetime=3 * 24 * 60 * 60
-        )
+        data = await self._get_json(url, "hero_matchups")
         return ctor.load(list[HeroMatchup], data)
 
     async def request_match_parse(self, match_id: StrOrInt) -> JobStatus:
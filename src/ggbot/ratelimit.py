@@ -0,0 +1,193 @@
+from typing import Optional, Dict, Tuple, List, Mapping, Hashable, Any, Callable
+from dataclasses import dataclass
+from collections import OrderedDict
+import logging
+import math
+import time
+
+
+__all__ = [
+    "SlidingWindowCounter",
+    "IntentRateLimit",
+    "IntentRateLimiter",
+    "intent_rate_limits_from_config",
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class SlidingWindowCounter:
+    """Approximate sliding window counter per key.
+
+    Keeps hit counts of the current and the previous fixed windows only, the
+    number of hits in the last ``window`` seconds is estimated by weighting
+    the previous window by its overlap with the sliding one.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        # key -> (window index, hits in it, hits in the previous window)
+        self._windows: Dict[Hashable, Tuple[int, int, int]] = {}
+
+    def _current(self, key: Hashable, now: float) -> Tuple[int, int, int]:
+        index = int(now // self.window)
+        stored = self._windows.get(key)
+        if stored is None:
+            return index, 0, 0
+        stored_index, hits, previous = stored
+        if stored_index == index:
+            return stored
+        if stored_index == index - 1:
+            return index, 0, hits
+        return index, 0, 0
+
+    def count(self, key: Hashable) -> float:
+        now = self.clock()
+        index, hits, previous = self._current(key, now)
+        overlap = 1.0 - (now / self.window - index)
+        return hits + previous * overlap
+
+    def allows(self, key: Hashable) -> bool:
+        return self.count(key) + 1 <= self.limit
+
+    def add(self, key: Hashable):
+        index, hits, previous = self._current(key, self.clock())
+        self._windows[key] = index, hits + 1, previous
+
+    def retry_after(self, key: Hashable) -> float:
+        """Seconds until the next hit of the key is allowed"""
+        now = self.clock()
+        index, hits, previous = self._current(key, now)
+        if hits + 1 > self.limit:
+            # Current window alone is over the limit
+            return (index + 1) * self.window - now
+        if previous == 0:
+            return 0.0
+        # Previous window weight has to drop so that the hit fits
+        overlap = (self.limit - 1 - hits) / previous
+        return max(0.0, (index + 1 - overlap) * self.window - now)
+
+    def prune(self):
+        index = int(self.clock() // self.window)
+        self._windows = {k: v for k, v in self._windows.items() if v[0] >= index - 1}
+
+    def __len__(self):
+        return len(self._windows)
+
+
+@dataclass(frozen=True)
+class IntentRateLimit:
+    window: float = 60
+    per_user: Optional[int] = None
+    per_channel: Optional[int] = None
+
+
+def intent_rate_limits_from_config(
+    config: Optional[Mapping[str, Mapping[str, Any]]]
+) -> Dict[str, IntentRateLimit]:
+    return {
+        intent: IntentRateLimit(
+            window=float(limits.get("window", 60)),
+            per_user=limits.get("per_user"),
+            per_channel=limits.get("per_channel"),
+        )
+        for intent, limits in (config or {}).items()
+    }
+
+
+class IntentRateLimiter:
+    """Per user and per channel sliding window limits of intents.
+
+    Latest replies of limited intents are remembered per (intent, user,
+    slots) so that a throttled request can still be answered with them.
+    """
+
+    def __init__(
+        self,
+        limits: Mapping[str, IntentRateLimit],
+        max_cached_replies: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = dict(limits)
+        self.max_cached_replies = max_cached_replies
+        self._counters: Dict[Tuple[str, str], SlidingWindowCounter] = {}
+        for intent, limit in self.limits.items():
+            for scope in ("user", "channel"):
+                value = getattr(limit, f"per_{scope}")
+                if value is not None:
+                    self._counters[intent, scope] = SlidingWindowCounter(
+                        value, limit.window, clock
+                    )
+        self._replies: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self._checks = 0
+
+    def is_limited(self, intent: str) -> bool:
+        return intent in self.limits
+
+    def _keyed(self, intent: str, user: Hashable, channel: Hashable):
+        return [
+            (counter, key)
+            for (counter, key) in (
+                (self._counters.get((intent, "user")), user),
+                (self._counters.get((intent, "channel")), channel),
+            )
+            if counter is not None
+        ]
+
+    def allows(self, intent: str, user: Hashable, channel: Hashable) -> bool:
+        """Whether the request fits into all the limits of the intent,
+        the request is not counted"""
+        if intent not in self.limits:
+            return True
+
+        keyed = self._keyed(intent, user, channel)
+        self._checks += 1
+        if self._checks % 1024 == 0:
+            for counter in self._counters.values():
+                counter.prune()
+
+        if not all(counter.allows(key) for counter, key in keyed):
+            retry = max(counter.retry_after(key) for counter, key in keyed)
+            _logger.info(
+                f"Intent {intent} of user {user} in channel {channel} is "
+                f"throttled, retry in {math.ceil(retry)}s"
+            )
+            return False
+        return True
+
+    def add(self, intent: str, user: Hashable, channel: Hashable):
+        """Counts the request against the limits of the intent"""
+        for counter, key in self._keyed(intent, user, channel):
+            counter.add(key)
+
+    def acquire(self, intent: str, user: Hashable, channel: Hashable) -> bool:
+        """Counts the request if it fits into all the limits of the intent"""
+        if not self.allows(intent, user, channel):
+            return False
+        self.add(intent, user, channel)
+        return True
+
+    @staticmethod
+    def reply_key(intent: str, user: Hashable, slots: Optional[Mapping[str, Any]]):
+        return intent, user, repr(sorted((slots or {}).items()))
+
+    def remember_replies(self, key: Hashable, replies: List[Any]):
+        if not replies:
+            return
+        self._replies[key] = replies
+        self._replies.move_to_end(key)
+        while len(self._replies) > self.max_cached_replies:
+            self._replies.popitem(last=False)
+
+    def cached_replies(self, key: Hashable) -> Optional[List[Any]]:
+        return self._replies.get(key)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} intents={list(self.limits)}>"
@@ -0,0 +1,115 @@
+from typing import Optional, List, Dict, Any, Hashable, Callable, Tuple
+from dataclasses import dataclass
+from collections import OrderedDict
+import logging
+import time
+
+import discord
+
+from ggbot.context import Context
+
+
+__all__ = [
+    "RecordedReply",
+    "record_replies",
+    "send_recorded_replies",
+    "reply_cache_key",
+    "ReplyCache",
+]
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecordedReply:
+    """Content of a sent message, enough to send it again"""
+
+    content: Optional[str] = None
+    embeds: Tuple[Dict[str, Any], ...] = ()
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "RecordedReply":
+        return cls(
+            content=message.content or None,
+            embeds=tuple(e.to_dict() for e in message.embeds),
+        )
+
+
+def record_replies(context: Context) -> List[RecordedReply]:
+    replies = [RecordedReply.from_message(m) for m in context.answers]
+    return [r for r in replies if r.content or r.embeds]
+
+
+async def send_recorded_replies(context: Context, replies: List[RecordedReply]):
+    message = context.message
+    is_dm = isinstance(message.channel, discord.DMChannel)
+    for reply in replies:
+        kwargs = {}
+        if reply.content:
+            kwargs["content"] = reply.content
+        if reply.embeds:
+            kwargs["embeds"] = [discord.Embed.from_dict(e) for e in reply.embeds]
+        if is_dm or not reply.content:
+            # Embeds were sent to the channel in the first place
+            answer = await message.channel.send(**kwargs)
+        else:
+            answer = await message.reply(**kwargs)
+        context.answered(answer)
+
+
+def reply_cache_key(context: Context) -> Hashable:
+    """Author and intent slots of the conversation"""
+    author = getattr(context.message.author, "id", None)
+    slots = context.match.get_all_slots() if context.match is not None else {}
+    return author, repr(sorted((slots or {}).items()))
+
+
+class ReplyCache:
+    """Replies of a scenario per author and slots, kept for ttl seconds"""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_size: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires at, replies)
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[RecordedReply]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: Hashable) -> Optional[List[RecordedReply]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, replies: List[RecordedReply]):
+        if not replies:
+            return
+        self._entries[key] = self.clock() + self.ttl, replies
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} ttl={self.ttl} size={len(self)} "
+            f"hits={self.hits} misses={self.misses}>"
+        )
@@ -1,13 +1,28 @@
-from typing import Optional, Dict, Tuple, Iterable
+from typing import Optional, Dict, Tuple, Iterable, List
 from dataclasses import dataclass
+import os
+import csv
+import json
+import asyncio
+import logging
 
 import gspread
 
 from ggbot.assets import IndexedCollection
+from ggbot.cache import write_file_atomic
 from ggbot.utils import local_time_cache
 
 
-__all__ = ["SpreadsheetTable", "GoogleSpreadsheetsClient"]
+__all__ = [
+    "SpreadsheetTable",
+    "GoogleSpreadsheetsClient",
+    "TableSource",
+    "LocalTableSource",
+    "GoogleSheetSource",
+    "SnapshotTable",
+]
+
+_logger = logging.getLogger(__name__)
 
 
 def trim_sequence(sequence: Iterable) -> Iterable:
@@ -87,3 +102,168 @@ class GoogleSpreadsheetsClient:
         return GoogleSpreadsheetsClient(
             gspread.service_account_from_dict(service_account)
         )
+
+
+class TableSource:
+    """Source of table rows, fetch_rows may block (disk or network)"""
+
+    def get_uri(self) -> str:
+        raise NotImplementedError
+
+    def fetch_rows(self) -> List[List[str]]:
+        raise NotImplementedError
+
+    async def fetch_rows_async(self) -> List[List[str]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.fetch_rows)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.get_uri()}>"
+
+
+@dataclass
+class LocalTableSource(TableSource):
+    """TSV or CSV file, delimiter is picked by the extension if not set"""
+
+    path: str
+    delimiter: Optional[str] = None
+    encoding: str = "utf-8"
+    skip_header: bool = False
+
+    def get_uri(self) -> str:
+        return f"file:{os.path.abspath(self.path)}"
+
+    def fetch_rows(self) -> List[List[str]]:
+        delimiter = self.delimiter
+        if delimiter is None:
+            delimiter = "," if self.path.endswith(".csv") else "\t"
+
+        with open(self.path, "r", encoding=self.encoding, newline="") as fp:
+            rows = [row for row in csv.reader(fp, delimiter=delimiter) if row]
+        if self.skip_header:
+            rows = rows[1:]
+        return rows
+
+
+@dataclass
+class GoogleSheetSource(TableSource):
+    """Worksheet of a google spreadsheet opened by title (or by key).
+
+    Without an explicit header the first row is the header, rows are trimmed
+    to its width.
+    """
+
+    client: GoogleSpreadsheetsClient
+    spreadsheet: str
+    worksheet: str
+    by_key: bool = False
+    header: Optional[Tuple[str, ...]] = None
+
+    def get_uri(self) -> str:
+        return f"gsheet:{self.spreadsheet}/{self.worksheet}"
+
+    def fetch_rows(self) -> List[List[str]]:
+        if self.by_key:
+            sheet = self.client.client.open_by_key(self.spreadsheet)
+        else:
+            sheet = self.client.client.open(self.spreadsheet)
+        values = sheet.worksheet(self.worksheet).get_all_values()
+
+        if self.header is not None:
+            n_cols = len(self.header)
+        elif values:
+            n_cols = len(trim_sequence(values[0]))
+            values = values[1:]
+        else:
+            return []
+        return [row[:n_cols] for row in values]
+
+
+class SnapshotTable(IndexedCollection[list]):
+    """Rows of a table source snapshotted to ``snapshot_file``.
+
+    Reading never touches the source once a snapshot exists, ``refresh``
+    pulls the source and replaces both the rows and the snapshot. Only
+    the very first start without a snapshot reads the source synchronously.
+    The snapshot is a file of its own rather than an entry of the response
+    cache, so it is never evicted by the traffic of other sources.
+    """
+
+    def __init__(self, source: TableSource, snapshot_file: Optional[str] = None):
+        self.source = source
+        self.snapshot_file = snapshot_file
+        self._rows: Optional[List[List[str]]] = None
+
+    @property
+    def rows(self) -> List[List[str]]:
+        rows = self._rows
+        if rows is None:
+            if not self.load_snapshot():
+                self.refresh()
+            rows = self._rows or []
+        return rows
+
+    def load_snapshot(self) -> bool:
+        if self.snapshot_file is None:
+            return False
+        try:
+            with open(self.snapshot_file, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as err:
+            _logger.warning(f"Failed to load snapshot of {self.source!r}: {err}")
+            return False
+
+        # Snapshot of another table
+        if data.get("uri") != self.source.get_uri():
+            return False
+        self._rows = data["rows"]
+        return True
+
+    def save_snapshot(self):
+        if self.snapshot_file is None or self._rows is None:
+            return
+        data = {"uri": self.source.get_uri(), "rows": self._rows}
+        directory = os.path.dirname(self.snapshot_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_file_atomic(
+            self.snapshot_file, json.dumps(data, ensure_ascii=False).encode("utf-8")
+        )
+
+    def _update(self, rows: List[List[str]]) -> bool:
+        changed = rows != self._rows
+        self._rows = rows
+        if changed:
+            self.save_snapshot()
+        return changed
+
+    def refresh(self) -> bool:
+        """Pulls rows from the source, keeps the old ones if it fails.
+        Returns True if rows have changed"""
+        try:
+            rows = self.source.fetch_rows()
+        except Exception as err:
+            _logger.warning(f"Failed to fetch {self.source!r}: {err}")
+            return False
+        return self._update(rows)
+
+    async def refresh_async(self) -> bool:
+        try:
+            rows = await self.source.fetch_rows_async()
+        except Exception as err:
+            _logger.warning(f"Failed to fetch {self.source!r}: {err}")
+            return False
+        return self._update(rows)
+
+    def get_item_by_index(self, index) -> list:
+        return self.rows[index]
+
+    def iter_items(self) -> Iterable[list]:
+        yield from self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.source!r}>"
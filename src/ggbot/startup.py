@@ -0,0 +1,95 @@
+from typing import Optional, List, Dict, Awaitable, Any, Iterator
+from dataclasses import dataclass
+from contextlib import contextmanager
+import asyncio
+import logging
+import time
+
+
+__all__ = ["StartupPhase", "StartupProfiler"]
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StartupPhase:
+    name: str
+    started_at: float  # seconds since the profiler start
+    finished_at: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+class StartupProfiler:
+    """Records timings of startup phases.
+
+    Sequential phases are measured with ``phase``, concurrent ones (component
+    initialization, background loading) with ``track`` / ``gather`` so their
+    intervals overlap in the report. ``mark`` records a zero length milestone,
+    e.g. the moment the gateway is connected.
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.phases: List[StartupPhase] = []
+        self._pending: Dict[str, float] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def record(self, name: str, started_at: float, finished_at: float):
+        """Records a phase measured outside the profiler (perf_counter values)"""
+        phase = StartupPhase(
+            name=name,
+            started_at=started_at - self.started_at,
+            finished_at=finished_at - self.started_at,
+        )
+        self.phases.append(phase)
+        _logger.debug(f"Startup phase {name} took {phase.duration:.3f}s")
+        return phase
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        self._pending[name] = started_at
+        try:
+            yield
+        finally:
+            del self._pending[name]
+            self.record(name, started_at, time.perf_counter())
+
+    async def track(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        with self.phase(name):
+            return await awaitable
+
+    async def gather(self, awaitables: Dict[str, Awaitable[Any]]) -> List[Any]:
+        """Awaits named awaitables concurrently recording each of them"""
+        return await asyncio.gather(
+            *(self.track(name, aw) for name, aw in awaitables.items())
+        )
+
+    def mark(self, name: str) -> StartupPhase:
+        now = time.perf_counter()
+        return self.record(name, now, now)
+
+    def report(self) -> str:
+        lines = [f"Startup timings ({self.elapsed():.3f}s since start):"]
+        width = max((len(p.name) for p in self.phases), default=0)
+        width = max([width, *(len(name) for name in self._pending)])
+        for phase in sorted(self.phases, key=lambda p: p.started_at):
+            lines.append(
+                f"  {phase.name:<{width}}  at {phase.started_at:7.3f}s"
+                f"  took {phase.duration:7.3f}s"
+            )
+        now = time.perf_counter()
+        for name, started_at in self._pending.items():
+            lines.append(
+                f"  {name:<{width}}  at {started_at - self.started_at:7.3f}s"
+                f"  running {now - started_at:7.3f}s"
+            )
+        return "\n".join(lines)
+
+    def log_report(self, level: int = logging.INFO):
+        _logger.log(level, self.report())
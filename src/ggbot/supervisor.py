@@ -0,0 +1,241 @@
+from typing import Optional, Callable, Awaitable, List, Dict, Deque, Hashable
+from dataclasses import dataclass, field
+from collections import deque
+import asyncio
+import logging
+import time
+
+from ggbot.context import Context, BotContext
+from ggbot.component import BotComponent
+
+
+__all__ = [
+    "ConversationTask",
+    "ConversationSupervisor",
+    "SupervisorMetrics",
+    "DROP_OLDEST",
+    "DROP_NEWEST",
+]
+
+_logger = logging.getLogger(__name__)
+
+Runner = Callable[[Context], Awaitable[bool]]
+
+# What happens to a new conversation when the admission queue is full
+DROP_OLDEST = "oldest"  # the longest waiting one is dropped to make room
+DROP_NEWEST = "newest"  # the new one is dropped
+
+
+@dataclass
+class ConversationTask:
+    task: asyncio.Task
+    context: Context
+    user: Optional[Hashable] = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    def is_active(self) -> bool:
+        return not self.task.done()
+
+
+@dataclass
+class _Pending:
+    runner: Runner
+    context: Context
+    user: Optional[Hashable]
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class SupervisorMetrics:
+    active: int = 0
+    queued: int = 0
+    peak_active: int = 0
+    started: int = 0
+    completed: int = 0
+    failed: int = 0  # raised or cancelled
+    dropped: int = 0  # queue overflow
+    rejected: int = 0  # per user limit
+    longest_wait: float = 0.0  # seconds spent in the queue
+
+
+def _user_of(context: Context) -> Optional[Hashable]:
+    message = context.message
+    author = getattr(message, "author", None)
+    return getattr(author, "id", None)
+
+
+class ConversationSupervisor(BotComponent):
+    """Runs conversations as tasks within concurrency limits.
+
+    At most ``max_active`` conversations run at once and a single user can
+    have at most ``max_per_user`` of them in flight (running or queued), the
+    rest wait in the admission queue of ``queue_size``. When the queue is full
+    either the oldest waiting conversation or the new one is dropped
+    (``drop_policy``). Finished tasks release their slots right away and are
+    additionally reaped every ``reap_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_active: int = 32,
+        max_per_user: int = 2,
+        queue_size: int = 64,
+        drop_policy: str = DROP_OLDEST,
+        reap_interval: float = 30,
+        report_interval: Optional[float] = None,
+    ):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.reap_interval = reap_interval
+        self.report_interval = report_interval
+        self.counters = SupervisorMetrics()
+        self._active: Dict[str, ConversationTask] = {}
+        self._queue: Deque[_Pending] = deque()
+        self._per_user: Dict[Hashable, int] = {}  # running and queued
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self, context: BotContext):
+        self._task = asyncio.create_task(self._run(), name="conversation-reaper")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queue.clear()
+        for conversation in list(self._active.values()):
+            conversation.task.cancel()
+
+    async def _run(self):
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            self.reap()
+            now = time.monotonic()
+            if self.report_interval and now - last_report >= self.report_interval:
+                last_report = now
+                _logger.info(f"Conversations: {self.format_metrics()}")
+
+    def submit(self, runner: Runner, context: Context) -> bool:
+        """Starts the conversation or queues it. Returns False if it was
+        rejected or dropped right away"""
+        user = _user_of(context)
+        if user is not None and self._per_user.get(user, 0) >= self.max_per_user:
+            self.counters.rejected += 1
+            _logger.info(f"Conversation {context.name} rejected: too many of {user}")
+            return False
+
+        if len(self._active) < self.max_active and not self._queue:
+            self._acquire(user)
+            self._start(_Pending(runner, context, user))
+            return True
+
+        if len(self._queue) >= self.queue_size:
+            if self.drop_policy == DROP_NEWEST or not self._queue:
+                self.counters.dropped += 1
+                _logger.warning(f"Conversation {context.name} dropped: queue is full")
+                return False
+            dropped = self._queue.popleft()
+            self._release(dropped.user)
+            self.counters.dropped += 1
+            _logger.warning(
+                f"Conversation {dropped.context.name} dropped: queue is full"
+            )
+
+        self._acquire(user)
+        self._queue.append(_Pending(runner, context, user))
+        _logger.debug(f"Conversation {context.name} queued ({len(self._queue)})")
+        return True
+
+    def active(self) -> List[ConversationTask]:
+        return [c for c in self._active.values() if c.is_active()]
+
+    def reap(self):
+        """Releases slots of finished tasks that were not released yet and
+        starts queued conversations"""
+        for name, conversation in list(self._active.items()):
+            if conversation.task.done():
+                self._finished(name, conversation)
+        self._start_queued()
+
+    def metrics(self) -> SupervisorMetrics:
+        m = self.counters
+        return SupervisorMetrics(
+            active=len(self._active),
+            queued=len(self._queue),
+            peak_active=m.peak_active,
+            started=m.started,
+            completed=m.completed,
+            failed=m.failed,
+            dropped=m.dropped,
+            rejected=m.rejected,
+            longest_wait=m.longest_wait,
+        )
+
+    def format_metrics(self) -> str:
+        m = self.metrics()
+        return (
+            f"active={m.active}/{self.max_active} (peak {m.peak_active}) "
+            f"queued={m.queued}/{self.queue_size} started={m.started} "
+            f"completed={m.completed} failed={m.failed} dropped={m.dropped} "
+            f"rejected={m.rejected} longest_wait={m.longest_wait:.2f}s"
+        )
+
+    def _acquire(self, user: Optional[Hashable]):
+        if user is not None:
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+
+    def _release(self, user: Optional[Hashable]):
+        if user is None:
+            return
+        count = self._per_user.get(user, 0) - 1
+        if count > 0:
+            self._per_user[user] = count
+        else:
+            self._per_user.pop(user, None)
+
+    def _start(self, pending: _Pending):
+        context = pending.context
+        wait = time.monotonic() - pending.queued_at
+        self.counters.longest_wait = max(self.counters.longest_wait, wait)
+        task = asyncio.create_task(
+            self._guarded(pending.runner, context), name=context.name
+        )
+        conversation = ConversationTask(task=task, context=context, user=pending.user)
+        self._active[context.name] = conversation
+        self.counters.started += 1
+        self.counters.peak_active = max(self.counters.peak_active, len(self._active))
+        task.add_done_callback(lambda _: self._on_done(context.name))
+
+    def _start_queued(self):
+        while self._queue and len(self._active) < self.max_active:
+            self._start(self._queue.popleft())
+
+    async def _guarded(self, runner: Runner, context: Context) -> bool:
+        try:
+            result = await runner(context)
+        except asyncio.CancelledError:
+            self.counters.failed += 1
+            raise
+        except Exception as err:
+            self.counters.failed += 1
+            _logger.exception(err)
+            return False
+        self.counters.completed += 1
+        return result
+
+    def _on_done(self, name: str):
+        conversation = self._active.get(name)
+        if conversation is not None:
+            self._finished(name, conversation)
+            self._start_queued()
+
+    def _finished(self, name: str, conversation: ConversationTask):
+        del self._active[name]
+        self._release(conversation.user)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.format_metrics()}>"
@@ -1,6 +1,12 @@
-from typing import Optional, Iterable, Dict
+from typing import Optional, Iterable, Dict, Callable
+import asyncio
+import logging
+import threading
+import time
 
-__all__ = ["IntentMatchResultBase", "NluBase"]
+__all__ = ["IntentMatchResultBase", "NluBase", "DeferredNlu"]
+
+_logger = logging.getLogger(__name__)
 
 
 class IntentMatchResultBase:
@@ -18,6 +24,9 @@ class IntentMatchResultBase:
 
 
 class NluBase:
+    async def wait_ready(self):
+        """Waits until the nlu is able to match without blocking"""
+
     def match_any_intent(self, text: str) -> Optional[IntentMatchResultBase]:
         raise NotImplementedError
 
@@ -25,3 +34,55 @@ class NluBase:
         self, text: str, intents: Iterable[str]
     ) -> Optional[IntentMatchResultBase]:
         raise NotImplementedError
+
+
+class DeferredNlu(NluBase):
+    """Builds the underlying nlu with the factory either in background
+    (``start``) or on first use, whichever comes first.
+
+    Building the grammar is slow, deferring it lets the rest of the bot start
+    meanwhile. Callers in the event loop should ``await wait_ready()`` before
+    matching, matching before that blocks until the nlu is built.
+    """
+
+    def __init__(self, factory: Callable[[], NluBase], name: str = "nlu"):
+        self._factory = factory
+        self._name = name
+        self._nlu: Optional[NluBase] = None
+        self._lock = threading.Lock()
+        self._future: Optional[asyncio.Future] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._nlu is not None
+
+    def get(self) -> NluBase:
+        if self._nlu is None:
+            with self._lock:
+                if self._nlu is None:
+                    started = time.perf_counter()
+                    self._nlu = self._factory()
+                    _logger.info(
+                        f"Created {self._name} "
+                        f"in {time.perf_counter() - started:.3f} seconds"
+                    )
+        return self._nlu
+
+    def start(self) -> asyncio.Future:
+        """Starts building the nlu in the default executor"""
+        if self._future is None:
+            loop = asyncio.get_running_loop()
+            self._future = loop.run_in_executor(None, self.get)
+        return self._future
+
+    async def wait_ready(self):
+        if self._nlu is None:
+            await self.start()
+
+    def match_any_intent(self, text: str) -> Optional[IntentMatchResultBase]:
+        return self.get().match_any_intent(text)
+
+    def match_intent_one_of(
+        self, text: str, intents: Iterable[str]
+    ) -> Optional[IntentMatchResultBase]:
+        return self.get().match_intent_one_of(text, intents)
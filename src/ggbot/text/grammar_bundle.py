@@ -0,0 +1,182 @@
+from typing import List, Dict, Optional, Any, Tuple, Sequence
+import os
+import sys
+import time
+import pickle
+import marshal
+import hashlib
+import logging
+
+import jinja2
+from jinja2 import Environment
+
+from ggbot.assets import yaml_dict_from_file
+from ggbot.cache import write_file_atomic
+from ggbot.text.tokema_integration import (
+    ExtendedRule,
+    iter_rule_specs,
+    _parse_queries,
+)
+
+
+__all__ = ["load_grammar_rules", "build_grammar_bundle"]
+
+_logger = logging.getLogger(__name__)
+
+_BUNDLE_VERSION = 1
+
+# (path, mtime_ns, size, sha256)
+FileStamp = Tuple[str, int, int, str]
+
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+
+def _stamp(path: str, digest: Optional[str] = None) -> FileStamp:
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size, digest or _file_hash(path)
+
+
+def _header(jinja_env: Environment) -> Dict[str, Any]:
+    # Compiled template code is only valid for the same python and jinja
+    return {
+        "version": _BUNDLE_VERSION,
+        "python": sys.implementation.cache_tag,
+        "jinja": jinja2.__version__,
+        "environment": type(jinja_env).__name__,
+    }
+
+
+def build_grammar_bundle(
+    filenames: Sequence[str], jinja_env: Environment
+) -> Dict[str, Any]:
+    """Parses grammar files into a picklable bundle: rule specs with the code
+    of meta templates compiled by jinja_env"""
+    files = []
+    data = {}
+    for filename in filenames:
+        _logger.info(f"Loading grammar from {filename}")
+        files.append(_stamp(filename))
+        data.update(yaml_dict_from_file(filename).get_data())
+
+    rules = []
+    for production, raw_queries, meta in iter_rule_specs(data):
+        templates = {}
+        if meta:
+            for k, v in meta.items():
+                if isinstance(v, str):
+                    templates[k] = marshal.dumps(jinja_env.compile(v))
+        rules.append((production, raw_queries, meta, templates))
+
+    return {**_header(jinja_env), "files": files, "rules": rules}
+
+
+def rules_from_bundle(
+    bundle: Dict[str, Any], jinja_env: Environment
+) -> List[ExtendedRule]:
+    rules = []
+    template_class = jinja_env.template_class
+    template_globals = jinja_env.make_globals(None)
+    for production, raw_queries, meta, templates in bundle["rules"]:
+        if templates:
+            meta = dict(meta)
+            for k, code in templates.items():
+                meta[k] = template_class.from_code(
+                    jinja_env, marshal.loads(code), template_globals
+                )
+        rules.append(
+            ExtendedRule(
+                production=production, queries=_parse_queries(raw_queries), meta=meta
+            )
+        )
+    return rules
+
+
+def _read_bundle(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as err:
+        _logger.warning(f"Failed to read grammar bundle {path}: {err}")
+        return None
+
+
+def _is_up_to_date(
+    bundle: Dict[str, Any], filenames: Sequence[str], jinja_env: Environment
+) -> Optional[List[FileStamp]]:
+    """Returns current file stamps if the bundle matches the files, files with
+    changed mtime are hashed to tell whether their content actually changed"""
+    if any(bundle.get(k) != v for k, v in _header(jinja_env).items()):
+        return None
+
+    stamps = bundle.get("files", [])
+    if [s[0] for s in stamps] != list(filenames):
+        return None
+
+    current = []
+    for path, mtime_ns, size, digest in stamps:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+            current.append((path, mtime_ns, size, digest))
+            continue
+        if stat.st_size != size or _file_hash(path) != digest:
+            return None
+        current.append(_stamp(path, digest))
+    return current
+
+
+def load_grammar_rules(
+    filenames: Sequence[str],
+    jinja_env: Environment,
+    bundle_file: Optional[str] = None,
+) -> List[ExtendedRule]:
+    """Loads rules of all grammar files.
+
+    With bundle_file the parsed grammar is kept in a single pickled file along
+    with the compiled meta templates. It is used as long as grammar files have
+    the same content and rebuilt otherwise.
+    """
+    started = time.perf_counter()
+    filenames = list(filenames)
+    bundle = None
+
+    if bundle_file is not None:
+        bundle = _read_bundle(bundle_file)
+        if bundle is not None:
+            stamps = _is_up_to_date(bundle, filenames, jinja_env)
+            if stamps is None:
+                _logger.info("Grammar files changed, rebuilding grammar bundle")
+                bundle = None
+            elif stamps != bundle["files"]:
+                # Only mtimes changed
+                bundle["files"] = stamps
+                _write_bundle(bundle_file, bundle)
+
+    if bundle is None:
+        bundle = build_grammar_bundle(filenames, jinja_env)
+        if bundle_file is not None:
+            _write_bundle(bundle_file, bundle)
+
+    rules = rules_from_bundle(bundle, jinja_env)
+    _logger.info(
+        f"Loaded {len(rules)} grammar rules "
+        f"in {time.perf_counter() - started:.3f} seconds"
+    )
+    return rules
+
+
+def _write_bundle(path: str, bundle: Dict[str, Any]):
+    directory = os.path.dirname(path)
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_file_atomic(path, pickle.dumps(bundle, pickle.HIGHEST_PROTOCOL))
+    except OSError as err:
+        _logger.warning(f"Failed to write grammar bundle {path}: {err}")
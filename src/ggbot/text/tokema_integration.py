@@ -1,9 +1,8 @@
-from typing import List, Dict, Optional, Iterable, Union, Any, Mapping
+from typing import List, Dict, Optional, Iterable, Iterator, Any, Mapping, Tuple
 from dataclasses import dataclass
 import logging
 import re
 
-import yaml
 from Stemmer import Stemmer
 from tokema import (
     Rule,
@@ -24,9 +23,15 @@ from jinja2.nativetypes import NativeEnvironment
 
 
 from ggbot.text.base import NluBase, IntentMatchResultBase
+from ggbot.utils import load_yaml_file
 
 
-__all__ = ["load_rules_from_yaml", "rules_from_grammar_dict", "TokemaNlu"]
+__all__ = [
+    "load_rules_from_yaml",
+    "rules_from_grammar_dict",
+    "iter_rule_specs",
+    "TokemaNlu",
+]
 
 
 _logger = logging.getLogger(__name__)
@@ -90,42 +95,30 @@ def _parse_rule(
     )
 
 
-def _parse_rules(
-    production: str,
-    rules_data: List[Union[str, Dict[str, Any]]],
-    jinja_env: Optional[Environment] = None,
-) -> List[ExtendedRule]:
-    rules = []
-
-    for rule_data in rules_data:
-        if isinstance(rule_data, str):
-            rule = _parse_rule(production=production, raw_queries=rule_data)
-            rules.append(rule)
-        elif isinstance(rule_data, dict):
-            for k, v in rule_data.items():
-                rule = _parse_rule(
-                    production=production, raw_queries=k, meta=v, jinja_env=jinja_env
-                )
-                rules.append(rule)
-    return rules
+def iter_rule_specs(
+    data: Mapping[str, List[Any]]
+) -> Iterator[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """Yields (production, raw_queries, meta) of every rule in the grammar dict"""
+    for production, rules_data in data.items():
+        for rule_data in rules_data:
+            if isinstance(rule_data, str):
+                yield production, rule_data, None
+            elif isinstance(rule_data, dict):
+                for k, v in rule_data.items():
+                    yield production, k, v
 
 
 def rules_from_grammar_dict(
     data: Mapping[str, List[Any]], j2_env: Environment
 ) -> List[ExtendedRule]:
-    rules = []
-    for production, rules_data in data.items():
-        production_rules = _parse_rules(
-            production=production, rules_data=rules_data, jinja_env=j2_env
-        )
-        rules.extend(production_rules)
-    return rules
+    return [
+        _parse_rule(production=production, raw_queries=raw, meta=meta, jinja_env=j2_env)
+        for production, raw, meta in iter_rule_specs(data)
+    ]
 
 
 def load_rules_from_yaml(filename: str, j2_env: Environment) -> List[ExtendedRule]:
-    with open(filename, "r", encoding="utf-8") as f:
-        data = yaml.full_load(f)
-        return rules_from_grammar_dict(data, j2_env)
+    return rules_from_grammar_dict(load_yaml_file(filename), j2_env)
 
 
 class StemmerResolver(Resolver):
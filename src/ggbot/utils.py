@@ -1,65 +1,177 @@
-from typing import Optional, Mapping, Any
+from typing import Optional, Mapping, Any, Dict, NamedTuple, Tuple
+from dataclasses import dataclass
+from collections import OrderedDict
 import json
 import os
+import asyncio
+import inspect
+import functools
+import threading
 import aiohttp
-import hashlib
 import time
 import logging
 from contextlib import contextmanager
 
 import yaml
 
+from ggbot.cache import CacheStore, get_default_cache_store
+
 
 __all__ = [
+    "CachePolicy",
     "get_url_json_with_file_cache",
+    "conditional_request_headers",
+    "response_validators",
     "benchmark",
     "load_yamls",
+    "YamlLoader",
+    "load_yaml",
+    "load_yaml_file",
     "local_time_cache",
+    "CacheInfo",
     "get_item_from_dict",
     "require_item_from_dict_or_env",
+    "BACKGROUND_REFRESH_TIMEOUT",
 ]
 
 _logger = logging.getLogger(__name__)
 
+# libyaml based loader is an order of magnitude faster than the pure python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-async def get_url_json_with_file_cache(
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Lifetime of a cached resource.
+
+    Once ``lifetime`` expires the cached copy is still served for up to
+    ``max_stale`` seconds while it is being refreshed in background.
+    """
+
+    lifetime: float
+    max_stale: float = 0
+
+    @classmethod
+    def from_dict(
+        cls, data: Optional[Mapping[str, Any]], default: "CachePolicy"
+    ) -> "CachePolicy":
+        if not data:
+            return default
+        return cls(
+            lifetime=float(data.get("lifetime", default.lifetime)),
+            max_stale=float(data.get("max_stale", default.max_stale)),
+        )
+
+
+# Background refreshes by cache key, keeps references to running tasks
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+
+# Nobody awaits background refreshes, a hung request would otherwise block
+# further refreshes of the key forever
+BACKGROUND_REFRESH_TIMEOUT = 60
+
+
+def response_validators(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {
+        name: headers[name] for name in ("ETag", "Last-Modified") if name in headers
+    }
+
+
+def conditional_request_headers(validators: Mapping[str, str]) -> Dict[str, str]:
+    headers = {}
+    if "ETag" in validators:
+        headers["If-None-Match"] = validators["ETag"]
+    if "Last-Modified" in validators:
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    return headers
+
+
+async def _download_to_store(
     url: str,
-    method: str = "GET",
-    cached_file_path: Optional[str] = None,
-    lifetime: float = 24 * 60 * 60,
-    encoding: str = "utf-8",
+    key: str,
+    store: CacheStore,
     session: Optional[aiohttp.ClientSession] = None,
-    cache_dir: str = os.getenv("CACHE_DIR") or ".cache",
     **kwargs,
-):
-    key = f"{method}:{url}"
-    if cached_file_path is None:
-        filename = hashlib.md5(key.encode()).hexdigest()[:8] + ".json"
-        cached_file_path = os.path.abspath(os.path.join(cache_dir, filename))
-
-    if os.path.exists(cached_file_path):
-        mtime = os.path.getmtime(cached_file_path)
-        now = time.time()
+) -> Optional[bytes]:
+    """Downloads url to the cache store.
 
-        if now - mtime < lifetime:
-            _logger.debug(f"Loading data from cache ({cached_file_path}) for url={url}")
-            with open(cached_file_path, "r", encoding=encoding) as fp:
-                return json.load(fp)
+    Returns None if the server responded with 304 Not Modified to the
+    conditional request, in that case the cached entry is kept as is.
+    """
+    entry = store.get_entry(key)
+    validators = entry.validators if entry is not None else {}
+    headers = {
+        **conditional_request_headers(validators),
+        **kwargs.pop("headers", {}),
+    }
 
     if session is None:
         session = aiohttp.ClientSession()
     async with session as session:
         _logger.debug(f"Requesting: {url}")
-        resp = await session.get(url, **kwargs)
+        resp = await session.get(url, headers=headers, **kwargs)
+        if resp.status == 304 and entry is not None:
+            _logger.debug(f"Not modified, keeping cache for {key}")
+            store.touch(entry)
+            return None
         if resp.status != 200:
             raise ValueError(f"Failed to get data from url: {url}")
         data = await resp.read()
         _logger.debug(data.decode(encoding="utf-8", errors="ignore"))
-        _logger.debug(f"Saving response data to cache ({cached_file_path})")
-        os.makedirs(cache_dir, exist_ok=True)
-        with open(cached_file_path, "wb") as fp:
-            fp.write(data)
-        return json.loads(data)
+        _logger.debug(f"Saving response data to cache for {key}")
+        store.put(key, data, response_validators(resp.headers))
+        return data
+
+
+async def _refresh(url: str, key: str, store: CacheStore, **kwargs):
+    try:
+        await asyncio.wait_for(
+            _download_to_store(url, key, store, **kwargs),
+            timeout=BACKGROUND_REFRESH_TIMEOUT,
+        )
+    except Exception as err:
+        _logger.warning(f"Background refresh of {url} failed: {err}")
+    finally:
+        _refresh_tasks.pop(key, None)
+
+
+def _schedule_refresh(url: str, key: str, store: CacheStore, **kwargs):
+    if key in _refresh_tasks:
+        return
+    _logger.debug(f"Serving stale cache for {key}, refreshing {url}")
+    _refresh_tasks[key] = asyncio.create_task(_refresh(url, key, store, **kwargs))
+
+
+async def get_url_json_with_file_cache(
+    url: str,
+    method: str = "GET",
+    lifetime: float = 24 * 60 * 60,
+    encoding: str = "utf-8",
+    session: Optional[aiohttp.ClientSession] = None,
+    store: Optional[CacheStore] = None,
+    max_stale: float = 0,
+    **kwargs,
+):
+    key = f"{method}:{url}"
+    if store is None:
+        store = get_default_cache_store()
+
+    entry = store.get_entry(key)
+    if entry is not None:
+        age = entry.age
+
+        if age < lifetime + max_stale:
+            if age >= lifetime:
+                # Stale, but still acceptable: refresh without blocking the caller
+                _schedule_refresh(url, key, store, **kwargs)
+            else:
+                _logger.debug(f"Loading data from cache ({entry.path}) for url={url}")
+            return store.load_json(entry, encoding)
+
+    data = await _download_to_store(url, key, store, session=session, **kwargs)
+    if data is None:
+        return store.load_json(store.get_entry(key), encoding)
+    return json.loads(data)
 
 
 @contextmanager
@@ -73,36 +185,213 @@ def benchmark(name: str):
         print(f"{name}: {delta:.3f} seconds")
 
 
+def load_yaml(stream) -> Any:
+    return yaml.load(stream, Loader=YamlLoader)
+
+
+# (abspath, encoding, all documents) -> ((mtime_ns, size), parsed)
+_yaml_files: Dict[Tuple[str, str, bool], Tuple[Tuple[int, int], Any]] = {}
+
+
+def _load_yaml_file(path: str, encoding: str, all_documents: bool) -> Any:
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(path), encoding, all_documents)
+    cached = _yaml_files.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(path, "r", encoding=encoding) as fp:
+        if all_documents:
+            data = list(yaml.load_all(fp, Loader=YamlLoader))
+        else:
+            data = yaml.load(fp, Loader=YamlLoader)
+    _yaml_files[key] = (stamp, data)
+    return data
+
+
+def load_yaml_file(path: str, encoding: str = "utf-8") -> Any:
+    """Parsed yaml file, memoized until the file's mtime or size changes.
+    The document is shared between callers and must not be modified"""
+    return _load_yaml_file(path, encoding, all_documents=False)
+
+
 def load_yamls(*paths: str) -> dict:
     result = {}
     for p in paths:
-        with open(p, "r", encoding="utf-8") as fp:
-            for doc in yaml.full_load_all(fp):
-                result.update(doc)
+        for doc in _load_yaml_file(p, "utf-8", all_documents=True):
+            result.update(doc)
     return result
 
 
-def local_time_cache(seconds: float):
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+
+
+class _IdentityKey:
+    """Cache key part for unhashable arguments, compared by identity.
+
+    Keeps a strong reference so that the id is not reused while cached.
+    """
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _IdentityKey) and other.obj is self.obj
+
+
+_KWARGS_MARK = object()
+
+
+def _cache_key_part(value: Any) -> Any:
+    try:
+        hash(value)
+    except TypeError:
+        return _IdentityKey(value)
+    return value
+
+
+def _make_cache_key(args: tuple, kwargs: dict) -> tuple:
+    key = tuple(_cache_key_part(arg) for arg in args)
+    if kwargs:
+        key += (_KWARGS_MARK,)
+        key += tuple((k, _cache_key_part(v)) for k, v in sorted(kwargs.items()))
+    return key
+
+
+def local_time_cache(seconds: float, maxsize: Optional[int] = 128):
+    """Memoizes results per arguments (including ``self``) for ``seconds``.
+
+    Unhashable arguments are matched by identity. Concurrent misses of the
+    same key are computed once, both for plain and coroutine functions.
+    Least recently used results are evicted above ``maxsize``. Like
+    ``functools.lru_cache`` the wrapper has ``cache_info()`` and
+    ``cache_clear()``.
+    """
+
     def _decorator(fn):
-        # Variable per decorator usage
-        last_accessed = 0
-        cache = None
+        entries: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        lock = threading.Lock()
+        # key -> [lock, number of threads holding or waiting for it]
+        key_locks: Dict[tuple, list] = {}
+        pending: Dict[tuple, asyncio.Future] = {}
+        hits = 0
+        misses = 0
+
+        def _lookup(key: tuple) -> Tuple[bool, Any]:
+            nonlocal hits
+            with lock:
+                item = entries.get(key)
+                if item is not None:
+                    expire_at, value = item
+                    if time.monotonic() < expire_at:
+                        entries.move_to_end(key)
+                        hits += 1
+                        return True, value
+                    del entries[key]
+                return False, None
+
+        def _miss():
+            nonlocal misses
+            with lock:
+                misses += 1
+
+        def _store(key: tuple, value: Any):
+            with lock:
+                entries[key] = (time.monotonic() + seconds, value)
+                entries.move_to_end(key)
+                if maxsize is not None:
+                    while len(entries) > maxsize:
+                        entries.popitem(last=False)
 
         def _inner(*args, **kwargs):
-            nonlocal last_accessed
-            nonlocal cache
+            key = _make_cache_key(args, kwargs)
+            found, value = _lookup(key)
+            if found:
+                return value
+
+            with lock:
+                key_lock = key_locks.get(key)
+                if key_lock is None:
+                    key_lock = key_locks[key] = [threading.Lock(), 0]
+                key_lock[1] += 1
+            try:
+                with key_lock[0]:
+                    # Could have been computed while waiting for the lock
+                    found, value = _lookup(key)
+                    if found:
+                        return value
+                    _miss()
+                    value = fn(*args, **kwargs)
+                    _store(key, value)
+                    return value
+            finally:
+                with lock:
+                    # Dropped once nobody waits for it, otherwise threads
+                    # coming next would not wait for the ones waiting now
+                    key_lock[1] -= 1
+                    if not key_lock[1]:
+                        del key_locks[key]
+
+        async def _inner_async(*args, **kwargs):
+            key = _make_cache_key(args, kwargs)
+            while True:
+                found, value = _lookup(key)
+                if found:
+                    return value
+                future = pending.get(key)
+                if future is None:
+                    break
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # Computing task was cancelled, not us: try again
+                    if not future.cancelled():
+                        raise
 
-            time_since_last_access = time.time() - last_accessed
+            future = asyncio.get_running_loop().create_future()
+            pending[key] = future
+            _miss()
+            try:
+                value = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as err:
+                future.set_exception(err)
+                future.exception()  # Retrieved, waiters (if any) get it too
+                raise
+            else:
+                _store(key, value)
+                future.set_result(value)
+                return value
+            finally:
+                pending.pop(key, None)
 
-            # Cache miss
-            if time_since_last_access > seconds:
-                cache = fn(*args, **kwargs)
-                last_accessed = time.time()
+        def cache_info() -> CacheInfo:
+            with lock:
+                return CacheInfo(hits, misses, maxsize, len(entries))
 
-            # Cache hit
-            return cache
+        def cache_clear():
+            nonlocal hits, misses
+            with lock:
+                entries.clear()
+                hits = misses = 0
 
-        return _inner
+        wrapper = _inner_async if inspect.iscoroutinefunction(fn) else _inner
+        wrapper = functools.wraps(fn)(wrapper)
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
 
     return _decorator
 
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from ggbot.dota.heroes import HeroTable, HeroesCollection
+
+
+HEROES = [
+    {"id": 1, "name": "npc_dota_hero_antimage", "localized_name": "Anti-Mage"},
+    {
+        "id": 5,
+        "name": "npc_dota_hero_crystal_maiden",
+        "localized_name": "Crystal Maiden",
+    },
+]
+
+
+class FakeAsset:
+    def __init__(self, data):
+        self.data = data
+        self.loads = 0
+
+    def get_data(self):
+        self.loads += 1
+        return self.data
+
+
+def test_hero_table_lookups():
+    table = HeroTable.from_data(HEROES)
+
+    assert len(table) == 2
+    assert table.name(5) == "npc_dota_hero_crystal_maiden"
+    assert table.localized_name(1) == "Anti-Mage"
+    assert table.icon_url(1) == (
+        "https://cdn.origin.steamstatic.com/apps/dota2/images/heroes/antimage_icon.png"
+    )
+    assert table.id_from_name("npc_dota_hero_antimage") == 1
+    assert table.id_from_localized_name("crystal maiden") == 5
+    assert table.get(3) is None
+    assert table.get(100) is None
+
+    with pytest.raises(TypeError):
+        table.name_to_id["npc_dota_hero_axe"] = 2
+    with pytest.raises(TypeError):
+        del table.localized_name_to_id["anti-mage"]
+
+
+def test_heroes_collection_swaps_table_on_refresh():
+    asset = FakeAsset(HEROES)
+    heroes = HeroesCollection(asset)
+
+    table = heroes.table
+    assert heroes.table is table
+    assert heroes[1]["localized_name"] == "Anti-Mage"
+    assert asset.loads == 1
+
+    asset.data = HEROES + [
+        {"id": 2, "name": "npc_dota_hero_axe", "localized_name": "Axe"}
+    ]
+    asyncio.run(heroes.refresh_async())
+    assert heroes.table is not table
+    assert heroes.table.localized_name(2) == "Axe"
+    assert len(list(heroes)) == 3
+    # Previously obtained table is left intact
+    assert table.get(2) is None
@@ -0,0 +1,110 @@
+from ggbot.text.base import NluBase, IntentMatchResultBase
+from ggbot.dota.phrases import PhraseGenerator
+from ggbot.dota.phrase_refresh import PhraseRulesRefresher
+
+
+STATEMENTS = {
+    "выиграл": [{"var": "result", "value": "won"}],
+    "проиграл": [{"var": "result", "value": "lose"}],
+    "много убийств": [{"var": "kills", "value": "high"}],
+}
+
+
+class FakeMatch(IntentMatchResultBase):
+    def __init__(self, rules):
+        self.rules = rules
+
+    def get_slot_value(self, slot_name: str):
+        return self.rules
+
+
+class FakeNlu(NluBase):
+    def __init__(self):
+        self.parsed = []
+
+    def match_intent_one_of(self, text, intents):
+        self.parsed.append(text)
+        if text in STATEMENTS:
+            return FakeMatch(STATEMENTS[text])
+        return None
+
+
+def _make_refresher(table, cache_file, nlus, grammar_files=()):
+    def _create_nlu():
+        nlu = FakeNlu()
+        nlus.append(nlu)
+        return nlu
+
+    generator = PhraseGenerator([])
+    return PhraseRulesRefresher(
+        generator,
+        table,
+        _create_nlu,
+        cache_file=cache_file,
+        grammar_files=grammar_files,
+    )
+
+
+def test_refresh_rebuilds_only_changed_rows(tmp_path):
+    cache_file = str(tmp_path / "phrases.json")
+    table = [
+        ["выиграл", "1", "{name} победил"],
+        ["проиграл", "1", "{name} проиграл"],
+        ["непонятно", "1", "..."],
+    ]
+    nlus = []
+    refresher = _make_refresher(table, cache_file, nlus)
+
+    assert refresher.refresh_sync()
+    generator = refresher.generator
+    assert [r.phrase_template for r in generator.phrase_rules] == [
+        "{name} победил",
+        "{name} проиграл",
+    ]
+    assert nlus[0].parsed == ["выиграл", "проиграл", "непонятно"]
+    assert not refresher.refresh_sync()
+
+    # Same condition with another phrase is not parsed again
+    old_rules = generator.phrase_rules
+    table[1] = ["проиграл", "2", "{name} слил"]
+    table.append(["много убийств", "1", "{name} убийца"])
+    assert refresher.refresh_sync()
+    assert nlus[0].parsed[3:] == ["много убийств"]
+    assert generator.phrase_rules is not old_rules
+    assert generator.phrase_rules[0] is old_rules[0]
+    assert generator.compiled_rules.rules is generator.phrase_rules
+
+    # Warm start builds the same rules from the cache without nlu
+    nlus.clear()
+    warm = _make_refresher([], cache_file, nlus)
+    assert warm.load_cache()
+    assert nlus == []
+    assert [r.phrase_template for r in warm.generator.phrase_rules] == [
+        r.phrase_template for r in generator.phrase_rules
+    ]
+
+
+def test_cached_conditions_are_dropped_when_grammar_changes(tmp_path):
+    cache_file = str(tmp_path / "phrases.json")
+    grammar = tmp_path / "phrase_rules.yaml"
+    grammar.write_text("rules: []", encoding="utf-8")
+    table = [["выиграл", "1", "{name} победил"], ["непонятно", "1", "..."]]
+    nlus = []
+    assert _make_refresher(table, cache_file, nlus, [str(grammar)]).refresh_sync()
+
+    nlus.clear()
+    warm = _make_refresher([], cache_file, nlus, [str(grammar)])
+    assert warm.load_cache()
+    assert nlus == []
+
+    # Failed parses are not trusted either once the grammar is edited
+    grammar.write_text("rules: [new]", encoding="utf-8")
+    warm = _make_refresher(table, cache_file, nlus, [str(grammar)])
+    assert not warm.load_cache()
+    assert warm.refresh_sync()
+    assert nlus[0].parsed == ["выиграл", "непонятно"]
+    assert len(warm.generator.phrase_rules) == 1
+
+    nlus.clear()
+    assert _make_refresher([], cache_file, nlus, [str(grammar)]).load_cache()
+    assert nlus == []
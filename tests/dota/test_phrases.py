@@ -0,0 +1,87 @@
+import random
+
+import ctor
+import numpy as np
+
+from ggbot.fuzzy import And, Is, EqualsValue, ValueIsOneOf
+from ggbot.opendota import Player
+from ggbot.dota.phrases import (
+    PhraseRule,
+    PhraseGenerator,
+    CompiledPhraseRules,
+    get_dota_variables,
+)
+
+
+def _make_rules(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    variables = [v for v in get_dota_variables() if v.name != "result"]
+    rules = []
+    for i in range(n):
+        operands = []
+        for v in rnd.sample(variables, rnd.randint(1, 3)):
+            operands.append(Is(v, rnd.choice(list(v.membership_functions))))
+        if rnd.random() < 0.2:
+            operands.append(EqualsValue("player", "shide"))
+        if rnd.random() < 0.2:
+            operands.append(ValueIsOneOf("hero_id", {1, 2, 3}))
+        rules.append(PhraseRule(And(*operands), f"phrase {i}", 1 + len(operands)))
+    return variables, rules
+
+
+def test_compiled_rules_match_condition_evaluation():
+    variables, rules = _make_rules(50)
+    compiled = CompiledPhraseRules(rules)
+    rnd = random.Random(1)
+
+    for _ in range(20):
+        context = {v.name: rnd.uniform(*v.bounds) for v in variables}
+        context["player"] = rnd.choice(["shide", "other"])
+        context["hero_id"] = rnd.randint(1, 5)
+
+        expected = [r.condition.evaluate(**context) * r.weight for r in rules]
+        assert np.array_equal(compiled.scores(context), expected)
+
+        best, _ = compiled.top(context, threshold=0.1, n=3)
+        candidates = [(s, i) for i, s in enumerate(expected) if s > 0.1]
+        expected_best = sorted(candidates, key=lambda c: c[0], reverse=True)[:3]
+        assert list(best) == [i for _, i in expected_best]
+
+
+def test_compiled_rules_empty():
+    best, scores = CompiledPhraseRules([]).top({}, threshold=0.1)
+    assert len(best) == 0
+    assert len(scores) == 0
+
+
+def _make_player(slot: int, kills: int, deaths: int):
+    return ctor.load(
+        Player,
+        {
+            "hero_id": slot + 1,
+            "player_slot": slot,
+            "kills": kills,
+            "deaths": deaths,
+            "assists": 5,
+            "gold_per_min": 400,
+            "xp_per_min": 500,
+            "duration": 2400,
+            "last_hits": 150,
+            "radiant_win": True,
+        },
+    )
+
+
+def test_generate_phrases_for_match_matches_single_player():
+    variables, rules = _make_rules(50, seed=2)
+    generator = PhraseGenerator(rules)
+    players = [_make_player(slot, slot * 2, 10 - slot) for slot in range(10)]
+    names = [f"player {i}" for i in range(10)]
+    heroes = [f"hero {i}" for i in range(10)]
+
+    phrases = generator.generate_phrases(1234, players, names, heroes)
+    assert phrases == [
+        generator.generate_phrase(1234, player, name, hero)
+        for player, name, hero in zip(players, names, heroes)
+    ]
+    assert any(phrases)
@@ -0,0 +1,184 @@
+import asyncio
+from types import SimpleNamespace
+
+import ctor
+
+from ggbot.btdata import Const
+from ggbot.bttypes import STRING
+from ggbot.context import Context, UserContext, Variable
+from ggbot.memory import Memory, DictStorage
+from ggbot.opendota import DotaMatch, PlayerRecentMatch
+from ggbot.dota.component import (
+    Dota,
+    DOTA_MATCH,
+    DOTA_MATCH_PLAYER,
+    GeneratePhraseForPlayer,
+)
+from ggbot.dota.phrases import PhraseGenerator
+from ggbot.dota.prefetch import RecentMatchesWatcher
+
+
+STEAM_ID = 56145879
+
+
+def _make_match(match_id: int, parsed: bool) -> DotaMatch:
+    return ctor.load(
+        DotaMatch,
+        {
+            "match_id": match_id,
+            "start_time": 1704570254,
+            "game_mode": 22,
+            "duration": 2793,
+            "radiant_gold_adv": [0, 100] if parsed else None,
+            "players": [{"hero_id": 1, "player_slot": 0, "account_id": STEAM_ID}],
+        },
+    )
+
+
+class FakeApi:
+    def __init__(self, match_id: int, parsed: bool):
+        self.match_id = match_id
+        self.parsed = parsed
+        self.match_requests = 0
+        self.parse_requests = 0
+
+    async def get_player_recent_matches(self, account_id):
+        return [
+            ctor.load(
+                PlayerRecentMatch,
+                {
+                    "match_id": self.match_id,
+                    "player_slot": 0,
+                    "radiant_win": True,
+                    "duration": 2793,
+                    "game_mode": 22,
+                    "lobby_type": 0,
+                    "hero_id": 1,
+                    "start_time": 1704570254,
+                    "kills": 1,
+                    "deaths": 1,
+                    "assists": 1,
+                    "xp_per_min": 1,
+                    "gold_per_min": 1,
+                    "hero_damage": 1,
+                    "tower_damage": 1,
+                    "hero_healing": 1,
+                    "last_hits": 1,
+                    "cluster": 1,
+                    "leaver_status": 0,
+                },
+            )
+        ]
+
+    async def get_match(self, match_id, cache_lifetime=0):
+        self.match_requests += 1
+        return _make_match(match_id, self.parsed)
+
+    async def request_match_parse(self, match_id):
+        self.parse_requests += 1
+
+
+def _make_watcher(api: FakeApi):
+    storage = DictStorage({"42-steam_id": STEAM_ID, "42-user_medals": {}})
+    dota = Dota(opendota_api_key="", phrase_generator=PhraseGenerator([]))
+    watcher = RecentMatchesWatcher(
+        memory=Memory(storage), dota=dota, api=api, requests_per_minute=6000
+    )
+    return watcher, dota
+
+
+def test_memory_iter_user_var():
+    memory = Memory(DictStorage({"42-steam_id": 1, "43-other": 2, "global": 3}))
+    assert list(memory.iter_user_var("steam_id")) == [(42, 1)]
+
+
+def test_prefetch_parsed_match():
+    api = FakeApi(match_id=100, parsed=True)
+    watcher, dota = _make_watcher(api)
+
+    asyncio.run(watcher.poll())
+    prefetched = dota.get_prefetched(100, STEAM_ID)
+    assert prefetched is not None
+    assert prefetched.is_parsed
+    assert api.parse_requests == 0
+
+    # Already seen match is not fetched again
+    asyncio.run(watcher.poll())
+    assert api.match_requests == 1
+
+
+def test_prefetch_requests_parse_once():
+    api = FakeApi(match_id=100, parsed=False)
+    watcher, dota = _make_watcher(api)
+
+    asyncio.run(watcher.poll())
+    asyncio.run(watcher.poll())
+    assert not dota.get_prefetched(100, STEAM_ID).is_parsed
+    assert api.match_requests == 2
+    assert api.parse_requests == 1
+
+
+class StubPhraseGenerator:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_phrase(self, match_id, player, player_name, hero_name):
+        self.calls += 1
+        return f"{player_name} on {hero_name}"
+
+
+def _make_phrase_watcher(parsed: bool):
+    api = FakeApi(match_id=100, parsed=parsed)
+    watcher, dota = _make_watcher(api)
+    dota.phrase_generator = StubPhraseGenerator()
+    dota.hero_id_to_localized_name = lambda hero_id: "Axe"
+    member = SimpleNamespace(display_name="Nickname")
+    watcher._bot = SimpleNamespace(
+        client=SimpleNamespace(
+            guilds=[SimpleNamespace(get_member={42: member}.get)],
+            get_user=lambda user_id: SimpleNamespace(display_name="Global"),
+        )
+    )
+    return watcher, dota, member
+
+
+def _generate_phrase(dota: Dota, match: DotaMatch, member) -> str:
+    result = Variable("phrase", STRING)
+    node = GeneratePhraseForPlayer(
+        phrase_generator=dota.phrase_generator,
+        match=Const(DOTA_MATCH, match),
+        match_player=Const(DOTA_MATCH_PLAYER, match.players[0]),
+        result=result,
+        dota=dota,
+    )
+    context = Context(bot=None, message=None, author=UserContext(member))
+    assert asyncio.run(node(context))
+    return context.get_var_value(result)
+
+
+def test_prefetched_phrase_matches_guild_nickname():
+    watcher, dota, member = _make_phrase_watcher(parsed=True)
+
+    asyncio.run(watcher.poll())
+    prefetched = dota.get_prefetched(100, STEAM_ID)
+    assert prefetched.phrases == {
+        "Nickname": "Nickname on Axe",
+        "Global": "Global on Axe",
+    }
+
+    assert _generate_phrase(dota, prefetched.match, member) == "Nickname on Axe"
+    assert dota.phrase_generator.calls == 2
+
+
+def test_phrases_of_unparsed_matches_are_not_prefetched():
+    watcher, dota, member = _make_phrase_watcher(parsed=False)
+
+    asyncio.run(watcher.poll())
+    prefetched = dota.get_prefetched(100, STEAM_ID)
+    assert prefetched.phrases == {}
+
+    # Phrases stored along an unparsed match are not served either
+    prefetched.phrases["Nickname"] = "stale"
+    parsed = _make_match(100, parsed=True)
+    assert _generate_phrase(dota, parsed, member) == "Nickname on Axe"
+    assert dota.phrase_generator.calls == 1
@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+
+import pytest
+from attr import dataclass as attr_dataclass
+
+from ggbot.bttypes import *
+from ggbot.btdata import *
+from ggbot.btexpr import CompiledExpression, compile_expression
+from ggbot.context import Context, Variable, IExpression, dependencies_of
+
+
+@dataclass
+class Hero:
+    name: str
+    wins: int
+    games: int
+    carry: bool
+
+
+HERO = make_struct_from_python_type(Hero)
+
+
+class Upper(IExpression[str]):
+    """Node the compiler knows nothing about"""
+
+    def __init__(self, value: IExpression[str]):
+        self.value = value
+
+    def evaluate(self, context):
+        return self.value.evaluate(context).upper()
+
+    def get_return_type(self):
+        return STRING
+
+
+def _context() -> Context:
+    heroes = [
+        Hero("axe", 5, 10, False),
+        Hero("lina", 1, 4, True),
+        Hero("pudge", 0, 1, False),
+    ]
+    return Context(
+        bot=None,
+        message=None,
+        author=None,
+        local={"heroes": heroes, "hero": heroes[0], "names": {"a": "x"}},
+    )
+
+
+heroes = Variable("heroes", ARRAY(HERO))
+hero = Variable("hero", HERO)
+h = Variable("_h", HERO)
+k = Variable("_k", STRING)
+v = Variable("_v", STRING)
+
+EXPRESSIONS = [
+    Formatted(
+        "{name}: {rate}% {{of}} {games!r} {rate:>5}",
+        name=Upper(Attr(hero, "name")),
+        rate=AsString(Rounded(Divided(Attr(hero, "wins"), Const(NUMBER, 0.1)))),
+        games=Attr(hero, "games"),
+        unused=Upper(Const(STRING, "never evaluated")),
+    ),
+    JoinedString(
+        ", ",
+        SelectFromArray(
+            heroes,
+            h,
+            Formatted(
+                "{name} ({games})",
+                name=Attr(h, "name"),
+                games=Sum(Attr(h, "games"), Const(NUMBER, 1)),
+            ),
+        ),
+    ),
+    Formatted("{a:>4}|{b!r:'^9}|{b}", a=Const(NUMBER, 7), b=Upper(Attr(hero, "name"))),
+    Filtered(heroes, h, Attr(h, "carry")),
+    SelectFromMap(
+        Variable("names", MAP(STRING, STRING)), k, v, Formatted("{k}={v}", k=k, v=v)
+    ),
+    Fallback(
+        STRING,
+        Item(Variable("names", MAP(STRING, STRING)), Const(STRING, "missing")),
+        Upper(Const(STRING, "fallback")),
+    ),
+    StringDictionary(
+        {
+            "const": Formatted("{a}-{b}", a=Const(NUMBER, 1), b=Const(STRING, "x")),
+            "games": AsString(Attr(hero, "games")),
+        }
+    ),
+]
+
+
+@pytest.mark.parametrize("expr", EXPRESSIONS)
+def test_compiled_expression_matches_interpreted(expr):
+    compiled = compile_expression(expr)
+    assert isinstance(compiled, CompiledExpression)
+    assert str(compiled.get_return_type()) == str(expr.get_return_type())
+    assert compiled.evaluate(_context()) == expr.evaluate(_context())
+
+
+def test_constants_are_folded_and_trees_are_compiled_once():
+    expr = StringDictionary(
+        {
+            "a": Formatted(
+                "{x} k", x=Rounded(Divided(Const(NUMBER, 2500), Const(NUMBER, 1000)))
+            ),
+            "b": AsString(Attr(hero, "wins")),
+        }
+    )
+    compiled = compile_expression(expr)
+    assert "'2 k'" in compiled.source
+    assert "_local.get('hero')" in compiled.source
+    assert ".wins" in compiled.source
+    assert compile_expression(expr) is compiled
+    assert compile_expression(compiled) is compiled
+    assert compiled.evaluate(_context()) == {"a": "2 k", "b": "5"}
+
+
+def test_unknown_nodes_get_their_subexpressions_compiled():
+    @attr_dataclass
+    class Lower(IExpression[str]):
+        value: IExpression[str]
+
+        def evaluate(self, context):
+            return self.value.evaluate(context).lower()
+
+        def get_return_type(self):
+            return STRING
+
+    expr = Lower(Formatted("{n}!", n=Attr(hero, "name")))
+    compiled = compile_expression(expr)
+    assert isinstance(compiled, Lower)
+    assert isinstance(compiled.value, CompiledExpression)
+    assert compiled.evaluate(_context()) == "axe!"
+
+
+def test_attribute_types_are_checked():
+    bad = Attr.__new__(Attr)
+    object.__setattr__(bad, "object", hero)
+    object.__setattr__(bad, "attr", "level")
+    with pytest.raises(TypeError):
+        compile_expression(AsString(bad)).compile()
+
+
+class Counted(IExpression[str]):
+    """Pure node counting its evaluations"""
+
+    def __init__(self, value: IExpression[str]):
+        self.value = value
+        self.calls = 0
+
+    def evaluate(self, context):
+        self.calls += 1
+        return self.value.evaluate(context)
+
+    def get_return_type(self):
+        return STRING
+
+    def get_dependencies(self):
+        return dependencies_of(self.value)
+
+
+def test_dependencies_are_declared():
+    expr = Formatted(
+        "{a}{b}", a=Attr(hero, "name"), b=Item(Variable("m", MAP(STRING, STRING)), k)
+    )
+    assert expr.get_dependencies() == {"hero", "m", "_k"}
+    assert not SelectFromArray(heroes, h, Attr(h, "name")).is_pure()
+    assert not Formatted("{a}", a=Upper(Const(STRING, "x"))).is_pure()
+    assert memoized(Upper(Const(STRING, "x"))).__class__ is Upper
+
+
+def test_pure_expressions_are_memoized_until_dependencies_change():
+    counted = Counted(Attr(hero, "name"))
+    expr = memoized(compile_expression(Formatted("<{x}>", x=counted)))
+    ctx = _context()
+
+    assert expr.evaluate(ctx) == "<axe>"
+    assert expr.evaluate(ctx) == "<axe>"
+    ctx.set_variable(Variable("other", NUMBER), 1)
+    assert expr.evaluate(ctx) == "<axe>"
+    assert counted.calls == 1
+
+    ctx.set_variable(hero, ctx.local["heroes"][1])
+    assert expr.evaluate(ctx) == "<lina>"
+    # Same object again, it might have been mutated
+    ctx.local["hero"].name = "lion"
+    ctx.set_variable(hero, ctx.local["hero"])
+    assert expr.evaluate(ctx) == "<lion>"
+    # Assigned bypassing set_variable
+    ctx.local["hero"] = ctx.local["heroes"][2]
+    assert expr.evaluate(ctx) == "<pudge>"
+    assert counted.calls == 4
+
+    # Contexts do not share values
+    assert expr.evaluate(_context()) == "<axe>"
+    assert counted.calls == 5
+
+
+def test_memoized_slots_follow_the_match():
+    class Match:
+        def __init__(self, hero):
+            self.hero = hero
+
+        def get_slot_value(self, name):
+            return self.hero
+
+    expr = memoized(Formatted("<{x}>", x=SlotExpression("hero")))
+    ctx = _context()
+    ctx.match = Match("axe")
+    assert expr.evaluate(ctx) == "<axe>"
+    # Replaced by an expectation waiting for another message
+    ctx.match = Match("lina")
+    assert expr.evaluate(ctx) == "<lina>"
@@ -0,0 +1,223 @@
+import asyncio
+import gc
+import random
+import time
+
+from jinja2.nativetypes import NativeEnvironment
+
+from ggbot.btree import (
+    sequence,
+    selector,
+    inverter,
+    always_fail,
+    always_success,
+    retry_until_success,
+    random_one_of,
+    check_condition,
+    no_longer_than,
+    repeat_until_timer_expires,
+    parallel_all,
+    parallel_any,
+    race,
+)
+from ggbot.btnodes import Constant, Sequence, optimize, compile_tree
+from ggbot.context import Context, BotContext
+
+
+class Leaf:
+    """Action with a fixed result recording the calls"""
+
+    def __init__(self, name: str, result: bool):
+        self.name = name
+        self.result = result
+
+    async def __call__(self, ctx):
+        ctx.local.setdefault("calls", []).append(self.name)
+        return self.result
+
+
+def _random_tree(rnd: random.Random, depth: int = 0):
+    if depth > 3 or rnd.random() < 0.3:
+        return rnd.choice(
+            [
+                Leaf(f"leaf{rnd.randint(0, 99)}", rnd.random() < 0.5),
+                check_condition(rnd.choice(["{{ true }}", "{{ 1 > 2 }}", ""])),
+            ]
+        )
+    children = [_random_tree(rnd, depth + 1) for _ in range(rnd.randint(0, 3))]
+    combinator = rnd.choice(
+        [sequence, selector, inverter, always_fail, always_success, retry_until_success]
+    )
+    if combinator in (sequence, selector):
+        return combinator(*children)
+    child = children[0] if children else sequence()
+    if combinator is retry_until_success:
+        return retry_until_success(rnd.randint(0, 2), child)
+    return combinator(child)
+
+
+def _run(action):
+    bot = BotContext(template_env=NativeEnvironment())
+    ctx = Context(bot=bot, message=None, author=None)
+    result = asyncio.run(action(ctx))
+    return bool(result), ctx.local.get("calls", [])
+
+
+def test_optimize_flattens_and_removes_no_ops():
+    a, b, c = Leaf("a", True), Leaf("b", True), Leaf("c", True)
+    tree = sequence(
+        sequence(a, check_condition("{{ 1 < 2 }}")),
+        selector(sequence(), b),
+        sequence(b, sequence(c)),
+        check_condition("{{ false }}"),
+        a,
+    )
+    optimized = optimize(tree)
+    assert isinstance(optimized, Sequence)
+    # selector(sequence(), b) is always successful, a after false is unreachable
+    assert optimized.children[:3] == (a, b, c)
+    assert isinstance(optimized.children[3], Constant)
+    assert optimized.children[3].value is False
+    assert len(optimized.children) == 4
+
+    assert optimize(sequence()).value is True
+    assert optimize(selector()).value is False
+    assert optimize(inverter(check_condition("{{ 0 }}"))).value is True
+    assert optimize(random_one_of(a)) is a
+
+
+def test_compiled_tree_matches_interpreted():
+    rnd = random.Random(42)
+    for _ in range(300):
+        tree = _random_tree(rnd)
+        assert _run(compile_tree(tree)) == _run(tree), tree
+
+
+def test_nodes_with_own_scheduling_are_compiled_inside():
+    a, b = Leaf("a", True), Leaf("b", False)
+    tree = sequence(a, no_longer_than(1, sequence(a, inverter(b))), b)
+    compiled = compile_tree(tree)
+    assert _run(compiled) == (False, ["a", "a", "b", "b"])
+    assert "no_longer_than" in repr(compiled.__bt_tree__)
+
+
+class Delayed:
+    """Sets the variable to its name after the delay"""
+
+    def __init__(self, name: str, delay: float, result: bool = True):
+        self.name = name
+        self.delay = delay
+        self.result = result
+        self.cancelled = False
+
+    async def __call__(self, ctx):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        ctx.local["winner"] = self.name
+        ctx.local[self.name] = True
+        return self.result
+
+
+def test_parallel_all_runs_children_concurrently_and_merges_in_order():
+    slow, fast = Delayed("slow", 0.05), Delayed("fast", 0.01)
+    ctx = Context(bot=None, message=None, author=None, local={"x": 1})
+
+    started = time.perf_counter()
+    assert asyncio.run(parallel_all(slow, fast)(ctx))
+    assert time.perf_counter() - started < 0.09
+
+    # Order of children, not of completion
+    assert ctx.local == {"x": 1, "winner": "fast", "slow": True, "fast": True}
+
+
+def test_parallel_all_fails_fast_and_cancels_the_rest():
+    slow, failing = Delayed("slow", 1), Delayed("failing", 0.01, result=False)
+    ctx = Context(bot=None, message=None, author=None)
+    assert not asyncio.run(parallel_all(slow, failing)(ctx))
+    assert slow.cancelled
+    assert ctx.local == {"winner": "failing", "failing": True}
+
+
+def test_parallel_retrieves_the_exceptions_of_all_finished_children():
+    async def failing(ctx):
+        await asyncio.sleep(0)
+        raise ValueError("first")
+
+    async def also_failing(ctx):
+        await asyncio.sleep(0)
+        raise KeyError("second")
+
+    async def main(tree):
+        unhandled = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: unhandled.append(context)
+        )
+        ctx = Context(bot=None, message=None, author=None)
+        raised = None
+        try:
+            await tree(ctx)
+        except Exception as err:
+            # Traceback keeps the tasks alive
+            raised = type(err)
+        gc.collect()
+        await asyncio.sleep(0)
+        return raised, unhandled
+
+    # Exceptions finishing together with a deciding result are raised too
+    for tree in (
+        parallel_all(failing, also_failing),
+        parallel_all(Delayed("f", 0, False), also_failing),
+    ):
+        raised, unhandled = asyncio.run(main(tree))
+        assert raised in (ValueError, KeyError)
+        assert unhandled == []
+
+
+def test_parallel_any_and_race():
+    ctx = Context(bot=None, message=None, author=None)
+    failing, ok, slow = Delayed("f", 0, False), Delayed("ok", 0.01), Delayed("s", 1)
+    assert asyncio.run(parallel_any(failing, ok, slow)(ctx))
+    assert slow.cancelled
+    assert ctx.local["winner"] == "ok"
+
+    ctx = Context(bot=None, message=None, author=None)
+    failing, ok = Delayed("f", 0, False), Delayed("ok", 0.01)
+    assert not asyncio.run(race(ok, failing)(ctx))
+    assert ctx.local == {"winner": "f", "f": True}
+
+
+def test_parallel_timeout_fails_like_no_longer_than():
+    slow = Delayed("slow", 1)
+    ctx = Context(bot=None, message=None, author=None)
+    assert not asyncio.run(compile_tree(parallel_all(slow, timeout=0.01))(ctx))
+    assert slow.cancelled
+    assert ctx.local == {}
+
+
+def test_nested_timeouts_respect_the_outer_deadline():
+    slow = Delayed("slow", 1)
+    seen = []
+
+    async def remaining(ctx):
+        seen.append(ctx.remaining())
+        return await slow(ctx)
+
+    ctx = Context(bot=None, message=None, author=None)
+    tree = no_longer_than(0.05, no_longer_than(10, no_longer_than(10, remaining)))
+
+    started = time.perf_counter()
+    assert not asyncio.run(compile_tree(tree)(ctx))
+    assert time.perf_counter() - started < 0.5
+    assert slow.cancelled
+    assert seen[0] <= 0.05
+    assert ctx.deadline is None
+
+
+def test_repeat_until_timer_expires_cancels_the_running_child():
+    slow = Delayed("slow", 1)
+    ctx = Context(bot=None, message=None, author=None)
+    assert asyncio.run(repeat_until_timer_expires(0.02, slow)(ctx))
+    assert slow.cancelled
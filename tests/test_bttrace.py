@@ -0,0 +1,94 @@
+import asyncio
+
+from ggbot.btree import sequence, selector, inverter, wait_time, check_condition
+from ggbot.btnodes import compile_tree
+from ggbot.bttrace import (
+    Tracer,
+    enable_tracing,
+    disable_tracing,
+    instrument,
+)
+from ggbot.context import Context
+
+
+def _fail():
+    async def _fn(ctx):
+        return False
+
+    return _fn
+
+
+def test_tracer_records_node_paths_and_folded_trace():
+    tracer = enable_tracing(Tracer())
+    try:
+        tree = instrument(
+            sequence(
+                selector(_fail(), wait_time(0.01)),
+                inverter(_fail()),
+                wait_time(0),
+            ),
+            "intent-test",
+        )
+    finally:
+        disable_tracing()
+
+    ctx = Context(bot=None, message=None, author=None)
+    assert asyncio.run(tree(ctx))
+
+    paths = {"/".join(path): stats for path, stats in tracer.stats.items()}
+    assert set(paths) == {
+        "intent-test",
+        "intent-test/selector",
+        "intent-test/selector/_fail",
+        "intent-test/selector/wait_time",
+        "intent-test/inverter",
+        "intent-test/inverter/_fail",
+        "intent-test/wait_time",
+    }
+    assert paths["intent-test/selector/_fail"].success_ratio == 0
+    assert paths["intent-test/selector"].success_ratio == 1
+    assert paths["intent-test/selector/wait_time"].percentile(0.5) >= 0.01
+
+    trace = tracer.get_trace(ctx.name)
+    assert trace["intent-test;selector;wait_time"] >= 0.01
+    # Self time of the root does not include its children
+    assert trace["intent-test"] < trace["intent-test;selector;wait_time"]
+    folded = tracer.folded(trace).splitlines()
+    assert "intent-test;selector;wait_time" in {line.split()[0] for line in folded}
+
+
+def test_trees_are_not_instrumented_without_tracer():
+    action = check_condition("{{ true }}")
+    assert sequence(action) is not None
+    assert instrument(action) is action
+
+
+def test_traced_trees_are_optimized_and_compiled():
+    tracer = enable_tracing(Tracer())
+    try:
+        tree = sequence(
+            check_condition("{{ true }}"),
+            selector(check_condition("{{ false }}"), inverter(_fail())),
+            wait_time(0),
+        )
+        compiled = instrument(compile_tree(tree), "intent-test")
+    finally:
+        disable_tracing()
+
+    # Constant conditions are gone and the selector with a single child left
+    # is replaced by it, wrappers of traced nodes are kept
+    assert hasattr(compiled.__wrapped__, "__bt_source__")
+    selector_node, wait_node = compiled.__wrapped__.__bt_tree__.children
+    assert selector_node.__bt_node__ == "selector"
+    assert selector_node.__wrapped__.__bt_node__ == "inverter"
+    assert wait_node.__bt_node__ == "wait_time"
+
+    ctx = Context(bot=None, message=None, author=None)
+    assert asyncio.run(compiled(ctx))
+    assert {"/".join(path) for path in tracer.stats} == {
+        "intent-test",
+        "intent-test/selector",
+        "intent-test/selector/inverter",
+        "intent-test/selector/inverter/_fail",
+        "intent-test/wait_time",
+    }
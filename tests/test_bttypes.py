@@ -1,3 +1,4 @@
+import copy
 from typing import Union, Dict
 
 from ggbot.bttypes import *
@@ -63,3 +64,25 @@ def test_types():
     assert s.get_attr_type("a").can_accept(STRING)
     assert s.get_attr_type("b").can_accept(MAP(STRING, NUMBER))
     print(s.get_name())
+
+
+def test_types_are_interned():
+    assert ARRAY(MAP(STRING, ONEOF(NUMBER, NULL_TYPE))) is ARRAY(
+        MAP(STRING, ONEOF(NULL_TYPE, NUMBER))
+    )
+    assert ONEOF(NUMBER, STRING) is not ONEOF(NUMBER, NULL_TYPE)
+
+    class B:
+        def __init__(self, a: str, b: int):
+            self.a = a
+            self.b = b
+
+    s = make_struct_from_python_type(B)
+    assert make_struct_from_python_type(B) is s
+
+    # Copies are not interned but are still accepted structurally
+    c = copy.copy(s)
+    assert c is not s
+    assert s.can_accept(c)
+    assert c.can_accept(s)
+    assert not s.can_accept(ARRAY(s))
@@ -0,0 +1,110 @@
+import gc
+import os
+import time
+import gzip
+import warnings
+
+from ggbot.cache import CacheStore
+
+
+def _set_times(store: CacheStore, key: str, accessed: float, modified: float):
+    os.utime(store.get_entry(key).path, (accessed, modified))
+
+
+def test_cache_store_roundtrip(tmp_path):
+    store = CacheStore(str(tmp_path), codec="gzip")
+    data = b'{"items": [' + b",".join(b"1" for _ in range(1000)) + b"]}"
+    store.put("GET:http://example", data, {"ETag": '"abc"'})
+
+    entry = store.get_entry("GET:http://example")
+    assert entry.key == "GET:http://example"
+    assert entry.validators == {"ETag": '"abc"'}
+    assert os.path.getsize(entry.path) < len(data)
+    assert gzip.decompress(open(entry.path, "rb").read()) == data
+    assert store.read_bytes(entry) == data
+    assert store.load_json(entry) == {"items": [1] * 1000}
+
+    # Index is rebuilt from disk by a new instance
+    assert CacheStore(str(tmp_path)).total_size == store.total_size
+
+    store.delete("GET:http://example")
+    assert store.get_entry("GET:http://example") is None
+    assert store.total_size == 0
+
+
+def test_cache_store_evicts_least_recently_used(tmp_path):
+    store = CacheStore(str(tmp_path), codec="gzip")
+    blob = os.urandom(1000)  # incompressible
+    now = time.time()
+    for i, key in enumerate(("a", "b", "c")):
+        store.put(key, blob)
+        _set_times(store, key, accessed=now - 100 + i, modified=now)
+
+    # "a" was read most recently
+    store.read_bytes(store.get_entry("a"))
+    store.max_bytes = store.total_size - 1
+    store.put("d", blob)
+
+    assert store.get_entry("b") is None
+    assert store.get_entry("c") is None
+    assert store.get_entry("a") is not None
+    assert store.get_entry("d") is not None
+    assert store.total_size <= store.max_bytes
+
+
+def test_cache_store_prune_older_than(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put("old", b"old")
+    store.put("new", b"new")
+    t = time.time() - 1000
+    _set_times(store, "old", accessed=t, modified=t)
+
+    removed = store.prune(older_than=500)
+    assert [entry.key for entry in removed] == ["old"]
+    assert store.get_entry("new") is not None
+
+
+def test_cache_store_eviction_uses_index(tmp_path, monkeypatch):
+    store = CacheStore(str(tmp_path), codec="gzip")
+    blob = os.urandom(1000)
+    for key in ("a", "b", "c"):
+        store.put(key, blob)
+    store.read_bytes(store.get_entry("a"))
+
+    def _scan():
+        raise AssertionError("eviction must not scan the whole store")
+
+    monkeypatch.setattr(store, "iter_entries", _scan)
+    store.max_bytes = store.total_size + 10
+    store.put("d", blob)
+    assert store.get_entry("b") is None
+    assert store.get_entry("c") is not None
+    assert store.get_entry("a") is not None
+
+
+def test_cache_store_reads_close_files(tmp_path):
+    store = CacheStore(str(tmp_path), codec="gzip")
+    store.put("key", b'{"a": 1}')
+    entry = store.get_entry("key")
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        assert store.read_bytes(entry) == b'{"a": 1}'
+        assert store.load_json(entry) == {"a": 1}
+        gc.collect()
+    assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+def test_cache_store_clear_keeps_other_files(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put("a", b"a")
+    store.put("b", b"b")
+    (tmp_path / "grammar.bundle").write_bytes(b"bundle")
+    (tmp_path / "phrases").mkdir()
+    (tmp_path / "phrases" / "rules.json").write_text("{}")
+
+    store.clear()
+    assert store.get_entry("a") is None
+    assert store.total_size == 0
+    assert sorted(os.listdir(tmp_path)) == ["grammar.bundle", "phrases"]
+    assert (tmp_path / "phrases" / "rules.json").read_text() == "{}"
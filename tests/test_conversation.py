@@ -0,0 +1,216 @@
+from types import SimpleNamespace
+import asyncio
+
+from ggbot.actions import wait_for_message_from_channel
+from ggbot.btree import (
+    sequence,
+    repeat_until_timer_expires,
+    no_longer_than,
+    parallel_all,
+)
+from ggbot.context import BotContext
+from ggbot.conversation import ConversationManager, ScenarioHandler
+from ggbot.ratelimit import IntentRateLimiter, intent_rate_limits_from_config
+from ggbot.supervisor import ConversationSupervisor
+from ggbot.utils import get_item_from_dict
+
+
+class FakeMatch:
+    def get_intent(self):
+        return "intent-test"
+
+    def get_confidence(self):
+        return 1.0
+
+    def get_all_slots(self):
+        return {}
+
+
+class FakeNlu:
+    async def wait_ready(self):
+        pass
+
+    def match_intent_one_of(self, text, intents):
+        return FakeMatch() if text == "start" else None
+
+
+def _message(author: str, content: str):
+    return SimpleNamespace(
+        author=SimpleNamespace(id=hash(author), name=author),
+        channel=SimpleNamespace(id=1),
+        content=content,
+    )
+
+
+async def _record(ctx):
+    ctx.local.setdefault("authors", []).append(ctx.message.author.name)
+    return True
+
+
+async def _converse(action, *authors: str):
+    """Starts a conversation running the action and answers it by authors,
+    returns the context of the finished conversation"""
+    handler = ScenarioHandler(action, reply_ttl=60)
+    manager = ConversationManager(
+        FakeNlu(), {"intent-test": handler}, BotContext(template_env=None)
+    )
+    await manager.handle_mentioned_message(_message("starter", "start"))
+    (conversation,) = manager.conversations
+    for author in authors:
+        await asyncio.sleep(0.01)
+        await manager.handle_mentioned_message(_message(author, "+"))
+    await conversation.task
+    assert len(handler.reply_cache) == 0
+    return conversation.context
+
+
+def test_expectations_under_timeouts_are_satisfied_through_the_manager():
+    gather = repeat_until_timer_expires(
+        0.2, sequence(wait_for_message_from_channel(0.1), _record)
+    )
+    ctx = asyncio.run(_converse(gather, "alice", "bob"))
+    assert ctx.local["authors"] == ["alice", "bob"]
+    assert ctx.message.author.name == "bob"
+    assert ctx.interactive
+
+    ask = no_longer_than(1, sequence(wait_for_message_from_channel(0.5), _record))
+    ctx = asyncio.run(_converse(ask, "alice"))
+    assert ctx.local["authors"] == ["alice"]
+
+
+def test_parallel_children_share_the_conversation():
+    async def lookup(ctx):
+        await asyncio.sleep(0.02)
+        ctx.local["steam_id"] = 42
+        return True
+
+    ask = sequence(wait_for_message_from_channel(0.5), _record)
+    ctx = asyncio.run(_converse(parallel_all(ask, lookup), "alice"))
+    assert ctx.local == {"authors": ["alice"], "steam_id": 42}
+    assert ctx.message.author.name == "alice"
+    assert ctx.interactive
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = 1
+        self.sent = []
+
+    async def send(self, content=None, embeds=None):
+        self.sent.append(content)
+        return SimpleNamespace(content=content or "", embeds=embeds or [])
+
+
+class FakeMessage:
+    def __init__(self, author: str, channel: FakeChannel):
+        self.author = SimpleNamespace(id=hash(author), name=author)
+        self.channel = channel
+        self.content = "start"
+        self.reactions = []
+
+    async def reply(self, content=None, embeds=None):
+        return await self.channel.send(content, embeds=embeds)
+
+    async def add_reaction(self, emoji):
+        self.reactions.append(emoji)
+
+
+def _throttling_manager(action, supervisor=None) -> ConversationManager:
+    """Manager configured with rate limits the same way as in __main__"""
+    config = {
+        "rate_limits": {
+            "throttled_reaction": "🐢",
+            "intents": {"intent-test": {"window": 60, "per_user": 2}},
+        }
+    }
+    return ConversationManager(
+        FakeNlu(),
+        {"intent-test": ScenarioHandler(action)},
+        BotContext(template_env=None),
+        supervisor=supervisor,
+        rate_limiter=IntentRateLimiter(
+            intent_rate_limits_from_config(
+                get_item_from_dict(config, "rate_limits.intents")
+            )
+        ),
+        throttled_reaction=get_item_from_dict(config, "rate_limits.throttled_reaction"),
+    )
+
+
+async def _start(manager: ConversationManager, message: FakeMessage):
+    await manager.handle_mentioned_message(message)
+    for conversation in manager.conversations:
+        await conversation.task
+
+
+def test_throttled_requests_replay_the_latest_replies():
+    runs = []
+
+    async def action(ctx):
+        runs.append(ctx.message.author.name)
+        ctx.answered(await ctx.message.reply(f"reply {len(runs)}"))
+        return True
+
+    async def _test():
+        manager = _throttling_manager(action)
+        channel = FakeChannel()
+        for _ in range(3):
+            await _start(manager, FakeMessage("alice", channel))
+        # Limit is per user
+        await _start(manager, FakeMessage("bob", channel))
+        return channel
+
+    channel = asyncio.run(_test())
+    assert runs == ["alice", "alice", "bob"]
+    assert channel.sent == ["reply 1", "reply 2", "reply 2", "reply 3"]
+
+
+def test_throttled_request_without_replies_gets_a_reaction():
+    async def failing(ctx):
+        ctx.answered(await ctx.message.reply("failed"))
+        return False
+
+    async def _test():
+        manager = _throttling_manager(failing)
+        channel = FakeChannel()
+        for _ in range(2):
+            await _start(manager, FakeMessage("alice", channel))
+        throttled = FakeMessage("alice", channel)
+        await _start(manager, throttled)
+        return channel, throttled
+
+    channel, throttled = asyncio.run(_test())
+    # Replies of failed runs are not repeated
+    assert channel.sent == ["failed", "failed"]
+    assert throttled.reactions == ["🐢"]
+
+
+def test_rejected_conversations_do_not_use_up_the_rate_limit():
+    runs = []
+
+    async def _test():
+        released = asyncio.Event()
+
+        async def action(ctx):
+            runs.append(ctx.message.author.name)
+            await released.wait()
+            return True
+
+        manager = _throttling_manager(
+            action, ConversationSupervisor(max_per_user=1, queue_size=0)
+        )
+        channel = FakeChannel()
+        await manager.handle_mentioned_message(FakeMessage("alice", channel))
+        # Rejected by the supervisor while the first one is running
+        rejected = FakeMessage("alice", channel)
+        await manager.handle_mentioned_message(rejected)
+        released.set()
+        for conversation in manager.conversations:
+            await conversation.task
+
+        await _start(manager, FakeMessage("alice", channel))
+        return rejected
+
+    rejected = asyncio.run(_test())
+    assert runs == ["alice", "alice"]
+    assert rejected.reactions == []
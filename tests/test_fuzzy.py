@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ggbot.fuzzy import *
+
+
+MFS = [
+    TriangularMf(0, 1, 2),
+    TrapezoidalMf(0.5, 1, 2, 2.5),
+    GaussianMf(1.5, 0.5),
+    ConstMf(0.3),
+    FuzzyUnion(TriangularMf(0, 1, 2), GaussianMf(2, 0.3)),
+    FuzzySum(FuzzyNegate(GaussianMf(1, 1)), ConstMf(0.2)),
+    TriangularMf(0, 1, 2).to_discrete(0, 3, 50),
+]
+
+
+@pytest.mark.parametrize("mf", MFS)
+def test_sample_array_matches_scalar_sample(mf):
+    x = linear_space(-1, 4, 101)
+    expected = [mf.sample(v) for v in x]
+    assert np.allclose(mf.sample_array(x), expected)
+
+
+def test_scalar_only_fuzzy_set_is_sampled_pointwise():
+    class Step(FuzzySet):
+        def sample(self, x):
+            return 1.0 if x > 0.5 else 0.0
+
+    assert Step().calculate_centroid(0, 1, 101) == pytest.approx(0.755)
+
+
+def test_rules_match_compound_sets():
+    low, high = TrapezoidalMf(-1, 0, 0.2, 0.7), TrapezoidalMf(0.3, 0.8, 1, 2)
+    x = Variable("x", (0, 1), low=low, high=high)
+    y = Variable("y", (0, 1), low=low, high=high)
+    rules = Rules(y)
+    rules.add_rule("low", Is(x, "high"))
+    rules.add_rule("high", Is(x, "low"))
+
+    for value in (0.1, 0.5, 0.8):
+        expected = FuzzyUnion(
+            FuzzyIntersection(low, ConstMf(high.sample(value))),
+            FuzzyIntersection(high, ConstMf(low.sample(value))),
+        ).calculate_centroid(0, 1)
+        assert rules.evaluate(x=value) == pytest.approx(expected)
+
+
+def test_discretized_variable_is_within_error_bound():
+    mf = FuzzyUnion(GaussianMf(0, 0.5), TrapezoidalMf(1, 1.5, 2, 2.5))
+    analytic = Variable("x", (0, 3), term=mf)
+    discrete = Variable("x", (0, 3), max_error=1e-3, term=mf)
+
+    assert discrete.is_discrete
+    assert discrete.discretization_error["term"] <= 1e-3
+    assert isinstance(discrete.get_sampler("term"), DiscreteFuzzySet)
+
+    for x in linear_space(-1, 4, 500):
+        expected = Is(analytic, "term").evaluate(x=x)
+        assert Is(discrete, "term").evaluate(x=x) == pytest.approx(expected, abs=1e-3)
+    # Analytic outside of bounds
+    assert discrete.fuzzify("term", 5) == mf.sample(5)
+
+
+def test_discrete_fuzzy_set_sample():
+    table = DiscreteFuzzySet([0, 1, 0.5], (0, 2))
+    assert table.sample(-1) == 0
+    assert table.sample(0.5) == 0.5
+    assert table.sample(1) == 1
+    assert table.sample(1.5) == 0.75
+    assert table.sample(3) == 0.5
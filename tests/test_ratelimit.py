@@ -0,0 +1,65 @@
+from ggbot.ratelimit import (
+    SlidingWindowCounter,
+    IntentRateLimiter,
+    intent_rate_limits_from_config,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock(100.0)  # start of a window
+    counter = SlidingWindowCounter(limit=2, window=10, clock=clock)
+    counter.add("a")
+    counter.add("a")
+    assert not counter.allows("a")
+    assert counter.allows("b")
+    assert counter.retry_after("a") == 10
+
+    clock.now = 112.5  # a quarter into the next window, previous weighs 0.75
+    assert counter.count("a") == 1.5
+    assert not counter.allows("a")
+    assert counter.retry_after("a") == 2.5
+
+    clock.now = 115.0
+    assert counter.allows("a")
+
+    clock.now = 130.0
+    assert counter.count("a") == 0
+    counter.prune()
+    assert len(counter) == 0
+
+
+def test_intent_limiter_checks_user_and_channel():
+    clock = FakeClock()
+    limits = intent_rate_limits_from_config(
+        {"intent-x": {"window": 60, "per_user": 2, "per_channel": 3}}
+    )
+    limiter = IntentRateLimiter(limits, clock=clock)
+
+    assert limiter.acquire("intent-other", 1, 1)
+    assert limiter.acquire("intent-x", 1, "c")
+    assert limiter.acquire("intent-x", 1, "c")
+    assert not limiter.acquire("intent-x", 1, "c")
+    assert limiter.acquire("intent-x", 2, "c")
+    # Channel is exhausted by now
+    assert not limiter.acquire("intent-x", 3, "c")
+    assert limiter.acquire("intent-x", 3, "d")
+    # Checking alone does not count the request
+    assert limiter.allows("intent-x", 4, "e")
+    assert limiter.allows("intent-x", 4, "e")
+    limiter.add("intent-x", 4, "e")
+    limiter.add("intent-x", 4, "e")
+    assert not limiter.allows("intent-x", 4, "e")
+
+    key = limiter.reply_key("intent-x", 1, {"b": 2, "a": 1})
+    assert limiter.cached_replies(key) is None
+    limiter.remember_replies(key, ["hello"])
+    assert limiter.cached_replies(limiter.reply_key("intent-x", 1, {"a": 1, "b": 2}))
+    assert limiter.cached_replies(limiter.reply_key("intent-x", 2, {"a": 1})) is None
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+import asyncio
+
+import discord
+
+from ggbot.context import Context
+from ggbot.conversation import ScenarioHandler
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, embed=None, embeds=None):
+        embeds = embeds or ([embed] if embed else [])
+        self.sent.append((content, [e.to_dict() for e in embeds]))
+        return SimpleNamespace(content=content or "", embeds=embeds)
+
+
+class FakeMessage:
+    def __init__(self, author_id: int):
+        self.author = SimpleNamespace(id=author_id)
+        self.channel = FakeChannel()
+
+    async def reply(self, content=None, embeds=None):
+        return await self.channel.send(content, embeds=embeds)
+
+
+class FakeMatch:
+    def __init__(self, **slots):
+        self.slots = slots
+
+    def get_all_slots(self):
+        return self.slots
+
+
+def _context(author_id: int, **slots) -> Context:
+    return Context(
+        bot=SimpleNamespace(last_answer=None),
+        message=FakeMessage(author_id),
+        author=None,
+        match=FakeMatch(**slots),
+    )
+
+
+def test_scenario_reply_cache_skips_the_action():
+    runs = []
+
+    async def action(ctx):
+        runs.append(ctx.match.slots)
+        ctx.answered(await ctx.message.reply(f"hero {ctx.match.slots['hero']}"))
+        embed = discord.Embed(title="stats")
+        ctx.answered(await ctx.message.channel.send(embed=embed))
+        return True
+
+    handler = ScenarioHandler(action, reply_ttl=60)
+
+    async def _test():
+        first = _context(1, hero=5)
+        assert await handler.run(first)
+        cached = _context(1, hero=5)
+        assert await handler.run(cached)
+        assert cached.message.channel.sent == first.message.channel.sent
+        assert cached.message.channel.sent[1][1][0]["title"] == "stats"
+        assert len(cached.answers) == 2
+
+        # Different slots or author
+        await handler.run(_context(1, hero=6))
+        await handler.run(_context(2, hero=5))
+
+    asyncio.run(_test())
+    assert runs == [{"hero": 5}, {"hero": 6}, {"hero": 5}]
+    assert handler.reply_cache.hits == 1
+
+
+def test_scenario_reply_cache_ignores_failed_and_interactive_runs():
+    results = iter([False, True, True])
+
+    async def action(ctx):
+        ctx.answered(await ctx.message.reply("answer"))
+        return next(results)
+
+    async def interactive(ctx):
+        ctx.interactive = True
+        return await action(ctx)
+
+    handler = ScenarioHandler(action, reply_ttl=60)
+
+    async def _test():
+        await handler.run(_context(1))
+        assert len(handler.reply_cache) == 0
+        handler.action = interactive
+        await handler.run(_context(1))
+        assert len(handler.reply_cache) == 0
+        handler.action = action
+        await handler.run(_context(1))
+        assert len(handler.reply_cache) == 1
+
+    asyncio.run(_test())
@@ -0,0 +1,56 @@
+from ggbot.cache import CacheStore
+from ggbot.spreadsheet import LocalTableSource, SnapshotTable, TableSource
+
+
+class FailingSource(TableSource):
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.fetches = 0
+
+    def get_uri(self) -> str:
+        return self.uri
+
+    def fetch_rows(self):
+        self.fetches += 1
+        raise ConnectionError("offline")
+
+
+def test_local_table_source(tmp_path):
+    tsv = tmp_path / "phrases.tsv"
+    tsv.write_text("выиграл\t{name} победил\nпроиграл\t{name} слил\n\n", "utf-8")
+    csv = tmp_path / "phrases.csv"
+    csv.write_text('condition,weight,phrase\nвыиграл,"1,5",{name} победил\n', "utf-8")
+
+    assert LocalTableSource(str(tsv)).fetch_rows() == [
+        ["выиграл", "{name} победил"],
+        ["проиграл", "{name} слил"],
+    ]
+    assert LocalTableSource(str(csv), skip_header=True).fetch_rows() == [
+        ["выиграл", "1,5", "{name} победил"]
+    ]
+
+
+def test_snapshot_table_serves_snapshot_when_source_is_offline(tmp_path):
+    snapshot_file = str(tmp_path / "cache" / "phrases.json")
+    tsv = tmp_path / "phrases.tsv"
+    tsv.write_text("a\tb\n", "utf-8")
+
+    table = SnapshotTable(LocalTableSource(str(tsv)), snapshot_file)
+    assert list(table) == [["a", "b"]]
+
+    # Response cache sharing the directory does not take the snapshot down
+    store = CacheStore(str(tmp_path / "cache"), max_bytes=1)
+    store.put("other", b"x" * 16)
+    store.clear()
+
+    # Same uri, but the source is unavailable now
+    offline = FailingSource(table.source.get_uri())
+    cold = SnapshotTable(offline, snapshot_file)
+    assert list(cold) == [["a", "b"]]
+    assert offline.fetches == 0
+    assert not cold.refresh()
+    assert cold[0] == ["a", "b"]
+
+    # Snapshot of another table is not used
+    other = FailingSource("other")
+    assert not SnapshotTable(other, snapshot_file).load_snapshot()
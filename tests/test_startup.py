@@ -0,0 +1,59 @@
+import asyncio
+
+from ggbot.startup import StartupProfiler
+from ggbot.text import DeferredNlu, NluBase
+
+
+class FakeNlu(NluBase):
+    def match_any_intent(self, text: str):
+        return text
+
+
+def test_profiler_records_sequential_and_concurrent_phases():
+    profiler = StartupProfiler()
+
+    async def _sleep(seconds: float):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    async def _main():
+        with profiler.phase("config"):
+            pass
+        return await profiler.gather({"a": _sleep(0.05), "b": _sleep(0.05)})
+
+    assert asyncio.run(_main()) == [0.05, 0.05]
+    profiler.mark("ready")
+
+    phases = {p.name: p for p in profiler.phases}
+    assert set(phases) == {"config", "a", "b", "ready"}
+    # Concurrent phases overlap
+    assert phases["b"].started_at < phases["a"].finished_at
+    assert phases["ready"].started_at >= phases["a"].finished_at
+    assert phases["ready"].duration == 0
+    assert "config" in profiler.report()
+
+
+def test_deferred_nlu_is_built_once():
+    created = []
+
+    def _factory():
+        created.append(FakeNlu())
+        return created[-1]
+
+    async def _main():
+        nlu = DeferredNlu(_factory)
+        assert not nlu.is_ready
+        nlu.start()
+        await nlu.wait_ready()
+        await nlu.wait_ready()
+        return nlu
+
+    nlu = asyncio.run(_main())
+    assert nlu.is_ready
+    assert nlu.match_any_intent("hi") == "hi"
+    assert len(created) == 1
+
+    # Without start the nlu is built on first use
+    lazy = DeferredNlu(_factory)
+    assert lazy.match_any_intent("hey") == "hey"
+    assert len(created) == 2
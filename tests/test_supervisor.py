@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from ggbot.context import Context
+from ggbot.supervisor import ConversationSupervisor, DROP_NEWEST
+
+
+def _context(user_id: int) -> Context:
+    message = SimpleNamespace(author=SimpleNamespace(id=user_id))
+    return Context(bot=None, message=message, author=None)
+
+
+def _run_all(supervisor: ConversationSupervisor, contexts, release: asyncio.Event):
+    started = []
+
+    async def runner(ctx):
+        started.append(ctx.message.author.id)
+        await release.wait()
+        return True
+
+    return started, [supervisor.submit(runner, ctx) for ctx in contexts]
+
+
+def test_global_limit_queues_and_starts_when_slots_free():
+    async def _test():
+        release = asyncio.Event()
+        supervisor = ConversationSupervisor(max_active=2, queue_size=10)
+        started, admitted = _run_all(
+            supervisor, [_context(i) for i in range(5)], release
+        )
+        await asyncio.sleep(0)
+        assert all(admitted)
+        assert started == [0, 1]
+        assert supervisor.metrics().queued == 3
+
+        release.set()
+        while supervisor.metrics().active or supervisor.metrics().queued:
+            await asyncio.sleep(0)
+        assert started == [0, 1, 2, 3, 4]
+        m = supervisor.metrics()
+        assert (m.started, m.completed, m.peak_active) == (5, 5, 2)
+
+    asyncio.run(_test())
+
+
+@pytest.mark.parametrize("policy,expected", [("oldest", [0, 3]), (DROP_NEWEST, [0, 1])])
+def test_queue_overflow_drop_policy(policy, expected):
+    async def _test():
+        release = asyncio.Event()
+        supervisor = ConversationSupervisor(
+            max_active=1, queue_size=1, drop_policy=policy
+        )
+        started, _ = _run_all(supervisor, [_context(i) for i in range(4)], release)
+        assert supervisor.metrics().dropped == 2
+        release.set()
+        while supervisor.metrics().active or supervisor.metrics().queued:
+            await asyncio.sleep(0)
+        assert started == expected
+
+    asyncio.run(_test())
+
+
+def test_per_user_limit_and_failures():
+    async def _test():
+        release = asyncio.Event()
+        supervisor = ConversationSupervisor(max_active=10, max_per_user=2)
+        _, admitted = _run_all(supervisor, [_context(7) for _ in range(3)], release)
+        assert admitted == [True, True, False]
+        assert supervisor.metrics().rejected == 1
+
+        async def failing(ctx):
+            raise RuntimeError("boom")
+
+        assert supervisor.submit(failing, _context(8))
+        release.set()
+        await asyncio.sleep(0.01)
+        supervisor.reap()
+        m = supervisor.metrics()
+        assert (m.active, m.completed, m.failed) == (0, 2, 1)
+        # Slots of the user are released
+        assert supervisor.submit(failing, _context(7))
+
+    asyncio.run(_test())
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import time
+import threading
+
+import pytest
+
+from ggbot import assets, utils
+from ggbot.assets import Source, Cached
+from ggbot.cache import CacheStore
+
+
+class CountingSource(Source):
+    def __init__(self, content: bytes):
+        self.content = content
+        self.requests = 0
+
+    def get_uri(self) -> str:
+        return "counting://"
+
+    def get_as_binary(self) -> bytes:
+        self.requests += 1
+        return self.content
+
+    def get_as_text(self, encoding: str = "utf-8") -> str:
+        return self.get_as_binary().decode(encoding)
+
+
+def _make_stale(store: CacheStore, key: str, age: float):
+    t = time.time() - age
+    os.utime(store.get_entry(key).path, (t, t))
+
+
+def test_url_json_cache_serves_stale_and_refreshes(tmp_path, monkeypatch):
+    downloads = []
+
+    async def fake_download(url, key, store, session=None, **kwargs):
+        downloads.append(url)
+        data = json.dumps({"fresh": True}).encode()
+        store.put(key, data)
+        return data
+
+    monkeypatch.setattr(utils, "_download_to_store", fake_download)
+    store = CacheStore(str(tmp_path))
+    key = "GET:http://example"
+    store.put(key, json.dumps({"fresh": False}).encode())
+    _make_stale(store, key, 100)
+
+    async def _run(max_stale: float):
+        result = await utils.get_url_json_with_file_cache(
+            "http://example", lifetime=10, store=store, max_stale=max_stale
+        )
+        # Let background refresh complete
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(_run(max_stale=1000)) == {"fresh": False}
+    assert downloads == ["http://example"]
+
+    # Fresh after the background refresh
+    assert asyncio.run(_run(max_stale=1000)) == {"fresh": True}
+    assert len(downloads) == 1
+
+    # Older than lifetime + max_stale blocks on the download
+    _make_stale(store, key, 100)
+    assert asyncio.run(_run(max_stale=0)) == {"fresh": True}
+    assert len(downloads) == 2
+
+
+def test_cached_source_stale_while_revalidate(tmp_path):
+    source = CountingSource(b"new")
+    store = CacheStore(str(tmp_path))
+    store.put(source.get_uri(), b"old")
+    _make_stale(store, source.get_uri(), 100)
+
+    cached = Cached(source, store, lifetime_seconds=10, max_stale_seconds=1000)
+    assert cached.get_as_binary() == b"old"
+
+    # Wait for the background thread
+    with cached._refresh_lock:
+        pass
+    assert source.requests == 1
+    assert cached.get_as_binary() == b"new"
+
+    _make_stale(store, source.get_uri(), 2000)
+    source.content = b"newest"
+    assert cached.get_as_binary() == b"newest"
+    assert source.requests == 2
+
+
+class ConditionalSource(CountingSource):
+    def __init__(self, content: bytes, etag: str):
+        super().__init__(content)
+        self.etag = etag
+        self.received_validators = []
+
+    def get_as_binary_if_modified(self, validators):
+        self.received_validators.append(dict(validators))
+        if validators.get("ETag") == self.etag:
+            return None, dict(validators)
+        return self.get_as_binary(), {"ETag": self.etag}
+
+
+def test_cached_source_conditional_request(tmp_path):
+    source = ConditionalSource(b"content", etag='"v1"')
+    store = CacheStore(str(tmp_path))
+    cached = Cached(source, store, lifetime_seconds=10)
+
+    assert cached.get_as_binary() == b"content"
+    assert store.get_entry(cached.key).validators == {"ETag": '"v1"'}
+
+    # Expired: validators are sent and 304 only refreshes the lifetime
+    _make_stale(store, cached.key, 100)
+    assert cached.get_as_binary() == b"content"
+    assert source.received_validators[-1] == {"ETag": '"v1"'}
+    assert source.requests == 1
+    assert cached.valid_cache_exists
+
+    # Changed on the server
+    _make_stale(store, cached.key, 100)
+    source.etag = '"v2"'
+    source.content = b"changed"
+    assert cached.get_as_binary() == b"changed"
+    assert store.get_entry(cached.key).validators == {"ETag": '"v2"'}
+
+
+def test_local_time_cache_is_keyed_by_arguments():
+    calls = []
+
+    class Table:
+        __hash__ = None  # like eq-comparable dataclasses
+
+        @utils.local_time_cache(60, maxsize=2)
+        def get(self, index):
+            calls.append((self, index))
+            return index * 2
+
+    a, b = Table(), Table()
+    assert a.get(1) == 2
+    assert a.get(1) == 2
+    assert b.get(1) == 2
+    assert len(calls) == 2
+
+    a.get(2)  # evicts a.get(1)
+    a.get(1)
+    assert len(calls) == 4
+    assert Table.get.cache_info() == utils.CacheInfo(
+        hits=1, misses=4, maxsize=2, currsize=2
+    )
+
+
+def test_local_time_cache_async_single_flight():
+    calls = 0
+
+    @utils.local_time_cache(60)
+    async def fetch(key):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return key
+
+    async def _run():
+        return await asyncio.gather(*(fetch("x") for _ in range(5)))
+
+    assert asyncio.run(_run()) == ["x"] * 5
+    assert calls == 1
+
+
+def test_local_time_cache_threads_wait_for_the_retry_of_a_failed_call():
+    release = threading.Event()
+    calls = []
+
+    @utils.local_time_cache(60)
+    def compute():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            release.wait(1)
+            raise ValueError("first call fails")
+        time.sleep(0.05)
+        return len(calls)
+
+    def _call():
+        try:
+            compute()
+        except ValueError:
+            pass
+
+    first = threading.Thread(target=_call, name="first")
+    first.start()
+    while not calls:
+        time.sleep(0.001)
+    # Waits for the first one, then computes again once it failed
+    waiting = threading.Thread(target=_call, name="waiting")
+    waiting.start()
+    time.sleep(0.02)
+    release.set()
+    first.join()
+    while len(calls) < 2:
+        time.sleep(0.001)
+    # Arrives while the retry is running and has to wait for it
+    assert compute() == 2
+    waiting.join()
+    assert calls == ["first", "waiting"]
+
+
+def test_local_time_cache_expires():
+    calls = 0
+
+    @utils.local_time_cache(0.01)
+    def compute():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert compute() == 1
+    assert compute() == 1
+    time.sleep(0.02)
+    assert compute() == 2
+
+
+def test_load_yaml_file_is_memoized_until_modified(tmp_path):
+    path = tmp_path / "grammar.yaml"
+    path.write_text("a: [1, 2]\n", "utf-8")
+
+    first = utils.load_yaml_file(str(path))
+    assert first == {"a": [1, 2]}
+    assert utils.load_yaml_file(str(path)) is first
+
+    path.write_text("a: [1, 2, 3]\n", "utf-8")
+    assert utils.load_yaml_file(str(path)) == {"a": [1, 2, 3]}
+
+
+def test_url_source_error_keeps_cached_copy(tmp_path, monkeypatch):
+    class Response:
+        status_code = 503
+        content = b"Service Unavailable"
+        headers = {"ETag": '"error"'}
+
+    monkeypatch.setattr(assets.requests, "request", lambda *a, **kw: Response())
+    source = assets.UrlSource("http://example")
+    store = CacheStore(str(tmp_path))
+    store.put(source.get_uri(), b"good", {"ETag": '"v1"'})
+    _make_stale(store, source.get_uri(), 100)
+    cached = Cached(source, store, lifetime_seconds=10)
+
+    with pytest.raises(ValueError):
+        cached.get_as_binary()
+    entry = store.get_entry(source.get_uri())
+    assert store.read_bytes(entry) == b"good"
+    assert entry.validators == {"ETag": '"v1"'}
+
+
+def test_cached_source_not_modified_without_entry_fetches_async(tmp_path):
+    class NotModifiedSource(CountingSource):
+        def get_as_binary(self) -> bytes:
+            raise AssertionError("blocking download on the event loop")
+
+        async def get_as_binary_async(self) -> bytes:
+            self.requests += 1
+            return self.content
+
+        async def get_as_binary_if_modified_async(self, validators):
+            # The cached copy was evicted while the request was in flight
+            return None, dict(validators)
+
+    source = NotModifiedSource(b"content")
+    cached = Cached(source, CacheStore(str(tmp_path)), lifetime_seconds=10)
+    assert asyncio.run(cached.get_as_binary_async()) == b"content"
+    assert source.requests == 1
+    assert cached.valid_cache_exists
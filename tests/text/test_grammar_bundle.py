@@ -0,0 +1,52 @@
+import os
+
+from jinja2.nativetypes import NativeEnvironment
+
+from ggbot.text import grammar_bundle
+from ggbot.text.grammar_bundle import load_grammar_rules
+from ggbot.text.tokema_integration import TokemaNlu
+
+
+GRAMMAR = """
+intent-greet:
+  - привет <name>: {name: "{{ args[1].name }}"}
+name:
+  - вася: {name: Вася}
+"""
+
+
+def _load(paths, bundle_file):
+    return load_grammar_rules(paths, NativeEnvironment(), bundle_file=bundle_file)
+
+
+def test_bundle_is_used_until_grammar_changes(tmp_path, monkeypatch):
+    grammar = tmp_path / "grammar.yaml"
+    grammar.write_text(GRAMMAR, "utf-8")
+    bundle_file = str(tmp_path / "cache" / "grammar.bundle")
+    paths = [str(grammar)]
+
+    builds = []
+    build = grammar_bundle.build_grammar_bundle
+    monkeypatch.setattr(
+        grammar_bundle,
+        "build_grammar_bundle",
+        lambda *args: builds.append(args) or build(*args),
+    )
+
+    _load(paths, bundle_file)
+    rules = _load(paths, bundle_file)
+    assert len(builds) == 1
+
+    match = TokemaNlu(rules).match_any_intent("привет вася")
+    assert match.intent == "intent-greet"
+    assert match.get_slot_value("name") == "Вася"
+
+    # Same content with another mtime is still served from the bundle
+    os.utime(grammar, (1, 1))
+    _load(paths, bundle_file)
+    assert len(builds) == 1
+
+    grammar.write_text(GRAMMAR.replace("вася", "петя"), "utf-8")
+    rules = _load(paths, bundle_file)
+    assert len(builds) == 2
+    assert TokemaNlu(rules).match_any_intent("привет петя") is not None